@@ -19,7 +19,13 @@ import configparser
 import time
 
 sys.path.append(os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../gpio_control"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../scripts"))
 from GPIODevices import LED  # noqa: E402
+from mpd_client import MPDConnection, MPDError  # noqa: E402
+
+# MPD output ids, mpc counts from 1: "Output 1" are the speakers, "Output 2" the headphones
+SPEAKERS = 0
+HEADPHONES = 1
 
 # Create logger
 logger = logging.getLogger('bt-sink-switch.py')
@@ -37,16 +43,22 @@ def bt_usage(sname):
     print("  ./" + sname + " toggle | speakers | headphones [debug]")
 
 
-def bt_check_mpc_err() -> None:
+def bt_check_mpc_err(mpd) -> None:
     """Error check on mpd output stream and attempt to recover previous state"""
     logger.debug("bt_check_mpc_err()")
-    mpcproc = subprocess.run("mpc status", shell=True, check=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    logger.debug(mpcproc.stdout)
-    # grep for this expression: 'ERROR: Failed to open audio output'
-    mpcerr = re.search(b"ERROR:.*output", mpcproc.stdout)
-    if mpcerr is not None:
-        mpcplay = subprocess.run("mpc play", shell=True, check=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        logger.debug(mpcplay)
+    status = mpd.status()
+    logger.debug(status)
+    # look for this error: 'Failed to open audio output'
+    if re.search("output", status.get("error", "")) is not None:
+        mpd.execute("play")
+        logger.debug("Restarted playback")
+
+
+def bt_enable_only(mpd, outputs, outputid) -> None:
+    """Like mpc enable only: enable outputid first, then disable all others, in one request"""
+    commands = [("enableoutput", outputid)]
+    commands += [("disableoutput", output["outputid"]) for output in outputs if output["outputid"] != str(outputid)]
+    mpd.command_list(*commands)
 
 
 def bt_switch(cmd, led_pin=None): # noqa C901
@@ -118,11 +130,15 @@ def bt_switch(cmd, led_pin=None): # noqa C901
         else:
             led_device = LED(led_pin, name="BluetoothToggleLed", initial_value=False)
 
-    # Figure out if output 1 (speakers) is enabled
-    isSpeakerOn_console = subprocess.run("mpc outputs", shell=True, check=False, stdout=subprocess.PIPE,
-                                         stderr=subprocess.STDOUT)
-    logger.debug(isSpeakerOn_console.stdout)
-    isSpeakerOn = re.search(b"^Output 1.*enabled", isSpeakerOn_console.stdout)
+    mpd = MPDConnection()
+    try:
+        # Figure out if output 1 (speakers) is enabled
+        outputs = mpd.outputs()
+    except (OSError, MPDError) as e:
+        logger.error("Could not reach MPD: " + str(e))
+        return
+    logger.debug(outputs)
+    isSpeakerOn = len(outputs) > 0 and outputs[SPEAKERS].get("outputenabled") == "1"
 
     # Figure out if a bluetooth device is connected (any device will do). Assume here that only speakers/headsets
     # will be connected
@@ -140,14 +156,18 @@ def bt_switch(cmd, led_pin=None): # noqa C901
             print("Switched audio sink to \"Output 2\"")
             # With mpc enable only 2, output 1 gets disabled before output 2 gets enabled causing a stream output fail
             # This order avoids the issue
-            proc = subprocess.run("mpc enable 2; sleep 0.1; mpc disable 1", shell=True, check=False,
-                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            logger.debug(proc.stdout)
-            # Yet, in some cases, a stream error still occurs: check and recover
-            bt_check_mpc_err()
+            try:
+                mpd.execute("enableoutput", HEADPHONES)
+                time.sleep(0.1)
+                mpd.execute("disableoutput", SPEAKERS)
+                # Yet, in some cases, a stream error still occurs: check and recover
+                bt_check_mpc_err(mpd)
+            except (OSError, MPDError) as e:
+                logger.error("Could not switch to headphones: " + str(e))
+            mpd.disconnect()
             if led_device is not None:
                 led_device.on()
-                logger.debug(b'LED on: ' + proc.stdout)
+                logger.debug("LED on")
             return
         else:
             print("No bluetooth device connected. Defaulting to \"Output 1\".")
@@ -161,15 +181,17 @@ def bt_switch(cmd, led_pin=None): # noqa C901
 
     # Default: Switch to Speakers
     print("Switched audio sink to \"Output 1\"")
-    # mpc only 1 always enables 1 first, avoiding any intermediate state with no valid output stream
-    proc = subprocess.run("mpc enable only 1", shell=True, check=False, stdout=subprocess.PIPE,
-                          stderr=subprocess.STDOUT)
-    logger.debug(proc.stdout)
-    # Yet, in some cases, a stream error still occurs: check and recover
-    bt_check_mpc_err()
+    # enable only 1 always enables 1 first, avoiding any intermediate state with no valid output stream
+    try:
+        bt_enable_only(mpd, outputs, SPEAKERS)
+        # Yet, in some cases, a stream error still occurs: check and recover
+        bt_check_mpc_err(mpd)
+    except (OSError, MPDError) as e:
+        logger.error("Could not switch to speakers: " + str(e))
+    mpd.disconnect()
     if led_device is not None:
         led_device.off()
-        logger.debug(b'LED off: ' + proc.stdout)
+        logger.debug("LED off")
 
 
 def get_led_pin_config(cfg_file):
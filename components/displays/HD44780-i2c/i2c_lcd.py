@@ -3,10 +3,13 @@
 import i2c_lcd_driver
 from time import *
 import time
+import os
+import sys
 import subprocess
 import numpy
 # import datetime
-from mpd import MPDClient
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../../scripts")
+from mpd_state import MPDStateService
 # constants
 mylcd = i2c_lcd_driver.lcd()
 info_at_lines_play = [" "] * 4
@@ -250,13 +253,8 @@ def sec_to_min_and_sec(seconds):
 
 
 ######### BEGIN OF CODE ################################
-##  init mpd-client
-try:
-    client = MPDClient()
-    client.timeout = 0.3
-    client.connect("localhost", 6600)                               #
-except Exception:  # if reconnect isn't possible, client is not running  #
-    print("mpd not avalible")
+##  init mpd-state, it keeps the latest state of mpd and reconnects if the connection is lost
+mpd_state = MPDStateService("localhost", 6600, timeout=0.3).start()
 if use_state_icons == "yes":
     mylcd.lcd_load_custom_chars(user_icons)
 try:
@@ -271,21 +269,13 @@ try:
         #################################################################################
 
         ########################## GET STATE ############################################
-        try:                                                                            #
-            client.ping()  # test if client is up                                    #
-            status = client.status()                                                  #
+        snapshot = mpd_state.state  # no request, mpd tells about changes              #
+        if snapshot.connected:                                                          #
+            status = snapshot.status                                                  #
             state = status['state']                                                   #
-            current_song_infos = client.currentsong()                                 #
-        except Exception:                                                               #
-            try:  # if client is not connected, try to reconnect                     #
-                client = MPDClient()                                            #
-                client.timeout = 0.3                                              #
-                client.connect("localhost", 6600)                               #
-                status = client.status()                                          #
-                state = status['state']                                           #
-                current_song_infos = client.currentsong()                         #
-            except Exception:  # if reconnect isn't possible, client is not running  #
-                state = "not_running"                                             #
+            current_song_infos = {key.lower(): value for key, value in snapshot.currentsong.items()}  #
+        else:  # if reconnect isn't possible, client is not running                     #
+            state = "not_running"                                                     #
         # it is running, get more details                                               #
         #################################################################################
         ########### RESTART COUNTER, IF STATE CHANGED####################################
@@ -343,9 +333,9 @@ try:
                     artist = artist.replace("\n", "").replace("ä", "\341").replace("ö", "\357").replace("ü", "\365").replace("ß", "\342").replace("Ä", "\341").replace("Ö", "\357").replace("Ü", "\365")  # weitere codes siehe https://www.mikrocontroller.net/topic/293125                         #
                 except KeyError:                                                                  #
                     artist = ""                                                               #
-            if (client.mpd_version) >= "0.20":
+            if (mpd_state.mpd.mpd_version) >= "0.20":
                 try:                                                                              #
-                    elapsed = status['elapsed'].split(".")[0]                                   #
+                    elapsed = str(int(snapshot.elapsed()))  # continues while playing          #
                     duration = status['duration'].split(".")[0]                                 #
                     track_time = sec_to_min_and_sec(elapsed) + "/" + sec_to_min_and_sec(duration)  #
                 except KeyError:                                                                  #
@@ -427,5 +417,4 @@ except KeyboardInterrupt:
         lines[3] = print_nothing()
     for row in range(n_rows):
         print_changes(lines[row], last_lines[row], row + 1)
-    client.close()                     # send the close command
-    client.disconnect()                # disconnect from the server
+    mpd_state.stop()                   # disconnect from the server
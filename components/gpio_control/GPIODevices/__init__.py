@@ -2,4 +2,4 @@ from .rotary_encoder import RotaryEncoder
 from .two_button_control import TwoButtonControl
 from .shutdown_button import ShutdownButton
 from .simple_button import SimpleButton
-from .led import LED, StatusLED
+from .led import LED, StatusLED, MPDStatusLED
@@ -42,3 +42,19 @@ class StatusLED(LED):
             time.sleep(1)
         self.logger.info('phoniebox-startup-scripts service active')
         self.on()
+
+
+class MPDStatusLED(StatusLED):
+    """StatusLED, which is switched off while MPD is not running"""
+
+    def __init__(self, pin, mpd_state, name='MPDStatusLED'):
+        super(MPDStatusLED, self).__init__(pin, name=name)
+        # only connection changes are of interest
+        mpd_state.subscribe(self.update, subsystems=())
+        self.update(mpd_state.state, set())
+
+    def update(self, state, changed):
+        if state.connected:
+            self.on()
+        else:
+            self.off()
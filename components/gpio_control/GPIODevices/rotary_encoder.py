@@ -1,26 +1,11 @@
 import RPi.GPIO as GPIO
 from timeit import default_timer as timer
-import ctypes
 import logging
 
 logger = logging.getLogger(__name__)
 
-c_uint8 = ctypes.c_uint8
-
-
-class Flags_bits(ctypes.LittleEndianStructure):
-    _fields_ = [
-        ("A", c_uint8, 1),  # asByte & 1
-        ("B", c_uint8, 1),  # asByte & 2
-    ]
-
-
-class Flags(ctypes.Union):
-    _anonymous_ = ("bit",)
-    _fields_ = [
-        ("bit", Flags_bits),
-        ("asByte", c_uint8)
-    ]
+# weight of the latest detent interval in the smoothed velocity
+VELOCITY_SMOOTHING = 0.5
 
 
 class RotaryEncoder:
@@ -28,14 +13,17 @@ class RotaryEncoder:
     KeyIncr = 0b00000010
     KeyDecr = 0b00000001
 
-    tblEncoder = [
+    # next state by (state & StateMask) | B << 1 | A
+    StateMask = 0b00011100
+
+    tblEncoder = (
         0b00000011, 0b00000111, 0b00010011, 0b00000011,
         0b00001011, 0b00000111, 0b00000011, 0b00000011,
         0b00001011, 0b00000111, 0b00001111, 0b00000011,
         0b00001011, 0b00000011, 0b00001111, 0b00000001,
         0b00010111, 0b00000011, 0b00010011, 0b00000011,
         0b00010111, 0b00011011, 0b00010011, 0b00000011,
-        0b00010111, 0b00011011, 0b00000011, 0b00000010]
+        0b00010111, 0b00011011, 0b00000011, 0b00000010)
 
     def __init__(self, pinA, pinB, functionCallIncr=None, functionCallDecr=None, timeBase=0.1,
                  name='RotaryEncoder'):
@@ -52,8 +40,11 @@ class RotaryEncoder:
         self.functionCallbackDecr = functionCallDecr
         self.timeBase = timeBase
 
-        self.encoderState = Flags()  # stores the encoder state machine state
+        self.encoderState = 0  # stores the encoder state machine state
+        self.pinState = 0b11  # the last levels of the pins, B << 1 | A, both are high with the pull-ups
+        self.illegalTransitions = 0  # both pins changed at once, so an edge was missed
         self.startTime = timer()
+        self.velocity = 0.0  # smoothed detents per second
 
         # setup pins
         GPIO.setup(self.pinA, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -94,37 +85,37 @@ class RotaryEncoder:
 
     def _StepSize(self):
         end = timer()
-        duration = end - self.startTime
+        duration = max(end - self.startTime, 1e-6)
         self.startTime = end
-        return int(self.timeBase / duration) + 1
+        if duration >= self.timeBase or not self.velocity:
+            # a slow turn starts over, so a single detent is never accelerated by a previous spin
+            self.velocity = 1 / duration
+        else:
+            self.velocity += VELOCITY_SMOOTHING * (1 / duration - self.velocity)
+        return int(self.velocity * self.timeBase) + 1
 
     def _Callback(self, pin):
-        logger.debug('EventDetection Called')
         # construct new state machine input from encoder state and old state
-        statusA = GPIO.input(self.pinA)
-        statusB = GPIO.input(self.pinB)
-
-        self.encoderState.A = statusA
-        self.encoderState.B = statusB
-        logger.debug('new encoderState: "{}" -> {}, {},{}'.format(
-            self.encoderState.asByte,
-            self.tblEncoder[self.encoderState.asByte], statusA, statusB
-        ))
-        current_state = self.encoderState.asByte
-        self.encoderState.asByte = self.tblEncoder[current_state]
-
-        if self.KeyIncr == self.encoderState.asByte:
+        pinState = GPIO.input(self.pinA) | GPIO.input(self.pinB) << 1
+        if pinState ^ self.pinState == 0b11:
+            self.illegalTransitions += 1
+        self.pinState = pinState
+        current_state = (self.encoderState & self.StateMask) | pinState
+        self.encoderState = self.tblEncoder[current_state]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('EventDetection on {}, new encoderState: "{}" -> {}'.format(
+                pin, current_state, self.encoderState))
+
+        if self.KeyIncr == self.encoderState:
             steps = self._StepSize()
-            logger.info('{name}: Calling functionIncr {steps}'.format(
-                name=self.name, steps=steps))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info('{name}: Calling functionIncr {steps}'.format(name=self.name, steps=steps))
             self.functionCallbackIncr(steps)
-        elif self.KeyDecr == self.encoderState.asByte:
+        elif self.KeyDecr == self.encoderState:
             steps = self._StepSize()
-            logger.info('{name}: Calling functionDecr {steps}'.format(
-                name=self.name, steps=steps))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info('{name}: Calling functionDecr {steps}'.format(name=self.name, steps=steps))
             self.functionCallbackDecr(steps)
-        else:
-            logger.debug('Ignoring encoderState: "{}"'.format(self.encoderState.asByte))
 
 
 # Umcomment for manual tests
@@ -0,0 +1,77 @@
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Calls callbacks at their deadline (monotonic clock) from one thread, shared by all devices
+
+    The GPIO callback thread only schedules a timer and returns, so a held button never delays the others.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._timers = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __repr__(self):
+        return '<Scheduler timers={}>'.format(len(self._timers))
+
+    def call_at(self, deadline, callback, *args):
+        timer = Timer(deadline, callback, args)
+        with self._condition:
+            heapq.heappush(self._timers, timer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='Scheduler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def _next_timer(self):
+        with self._condition:
+            while True:
+                while self._timers and self._timers[0].cancelled:
+                    heapq.heappop(self._timers)
+                if not self._timers:
+                    self._condition.wait()
+                    continue
+                timeout = self._timers[0].deadline - self.clock()
+                if timeout <= 0:
+                    return heapq.heappop(self._timers)
+                self._condition.wait(timeout)
+
+    def _run(self):
+        while True:
+            timer = self._next_timer()
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logger.exception('Timer callback {} failed'.format(timer.callback))
+
+
+# shared by all buttons
+scheduler = Scheduler()
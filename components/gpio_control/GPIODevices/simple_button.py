@@ -1,10 +1,24 @@
 import time
 import logging
+import threading
 import RPi.GPIO as GPIO
+try:
+    from scheduler import scheduler as default_scheduler
+except ImportError:
+    from .scheduler import scheduler as default_scheduler
 GPIO.setmode(GPIO.BCM)
 
 logger = logging.getLogger(__name__)
 
+# seconds between the checks, if a held button was released
+POLL_INTERVAL = 0.1
+
+HOLD_MODES = ('Repeat', 'Postpone', 'SecondFunc', 'SecondFuncRepeat')
+# states of a button with hold_mode
+IDLE = 'idle'
+PRESSED = 'pressed'  # waiting for hold_time
+HELD = 'held'  # repeating each hold_time
+
 map_edge_parse = {'falling': GPIO.FALLING, 'rising': GPIO.RISING, 'both': GPIO.BOTH}
 map_pull_parse = {'pull_up': GPIO.PUD_UP, 'pull_down': GPIO.PUD_DOWN, 'pull_off': GPIO.PUD_OFF}
 map_edge_print = {GPIO.FALLING: 'falling', GPIO.RISING: 'rising', GPIO.BOTH: 'both'}
@@ -49,33 +63,10 @@ def print_pull_up_down(pull_up_down):
     return result
 
 
-# This function takes a holding time (fractional seconds), a channel, a GPIO state and an action reference (function).
-# It checks if the GPIO is in the state since the function was called. If the state
-# changes it return False. If the time is over the function returns True.
-def checkGpioStaysInState(holdingTime, gpioChannel, gpioHoldingState):
-    # Get a reference start time (https://docs.python.org/3/library/time.html#time.perf_counter)
-    startTime = time.perf_counter()
-    # Continously check if time is not over
-    while True:
-        time.sleep(0.1)
-        currentState = GPIO.input(gpioChannel)
-        endTime = time.perf_counter() - startTime
-        if holdingTime < endTime:
-            break
-        # Return if state does not match holding state
-        if (gpioHoldingState != currentState):
-            return False
-        # Else: Wait
-
-    if (gpioHoldingState != currentState):
-        return False
-    return True
-
-
 class SimpleButton:
     def __init__(self, pin, action=lambda *args: None, action2=lambda *args: None, name=None,
                  bouncetime=500, antibouncehack=False, edge='falling',
-                 hold_time=.3, hold_mode=None, pull_up_down='pull_up'):
+                 hold_time=.3, hold_mode=None, pull_up_down='pull_up', scheduler=None):
         self.pin = pin
         self.name = name
         self.edge = parse_edge_key(edge)
@@ -90,6 +81,12 @@ class SimpleButton:
         GPIO.setup(self.pin, GPIO.IN, pull_up_down=self.pull_up_down)
         self._action = action
         self._action2 = action2
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
+        self._state = IDLE
+        self._deadline = None
+        self._timer = None
+        self._args = ()
+        self._lock = threading.Lock()
         GPIO.add_event_detect(self.pin, edge=self.edge, callback=self.callbackFunctionHandler,
                               bouncetime=self.bouncetime)
         self.callback_with_pin_argument = False
@@ -135,42 +132,78 @@ class SimpleButton:
     def _handleCallbackFunction(self, *args):
         logger.info('{}: handleCallbackFunction, mode: {}'.format(self.name, self.hold_mode))
 
-        if self.hold_mode == "Repeat":
+        if self.hold_mode not in HOLD_MODES:
+            return self.when_pressed(*args)
+
+        # the hold_time is tracked by the scheduler, this callback returns right away
+        with self._lock:
+            # pressed again while the last press was tracked => it was released in between
+            action = self._release() if self._state != IDLE else None
+            last_args = self._args
+
+            now = self.scheduler.clock()
+            self._state = HELD if self.hold_mode == 'Repeat' else PRESSED
+            self._deadline = now + self._hold_time()
+            self._args = args
+            self._schedule(now)
+
+        if action is not None:
+            action(*last_args)
+        if self.hold_mode == 'Repeat':
             # Instantly call primary action
             self.when_pressed(*args)
-            # Repeated call of primary action if button is held long enough
-            while checkGpioStaysInState(self.hold_time, self.pin, GPIO.LOW):
-                self.when_pressed(*args)
-
-        elif self.hold_mode == "Postpone":
-            # Postponed call of primary action (once)
-            if checkGpioStaysInState(self.hold_time, self.pin, GPIO.LOW):
-                self.when_pressed(*args)
-                while checkGpioStaysInState(self.hold_time, self.pin, GPIO.LOW):
-                    pass
-
-        elif self.hold_mode == "SecondFunc":
-            # Call of secondary action (once)
-            # execute primary action if not held past hold_time
-            if checkGpioStaysInState(self.hold_time, self.pin, GPIO.LOW):
-                self.when_held(*args)
-                while checkGpioStaysInState(self.hold_time, self.pin, GPIO.LOW):
-                    pass
-            else:
-                self.when_pressed(*args)
-
-        elif self.hold_mode == "SecondFuncRepeat":
-            # Repeated call of secondary action (multiple times if button is held long enough)
-            # execute primary action if not held past hold_time
-            if checkGpioStaysInState(self.hold_time, self.pin, GPIO.LOW):
-                self.when_held(*args)
-                while checkGpioStaysInState(self.hold_time, self.pin, GPIO.LOW):
-                    self.when_held(*args)
-            else:
-                self.when_pressed(*args)
 
+    def _hold_time(self):
+        return max(self.hold_time, POLL_INTERVAL)
+
+    def _schedule(self, now):
+        # wake up at the deadline or earlier to check, if the button was released
+        self._timer = self.scheduler.call_at(min(self._deadline, now + POLL_INTERVAL), self._tick)
+
+    def _tick(self):
+        with self._lock:
+            if self._state == IDLE:
+                return
+            now = self.scheduler.clock()
+            if GPIO.input(self.pin) != GPIO.LOW:
+                action = self._release()
+            elif now >= self._deadline:
+                action = self._hold(now)
+            else:
+                action = None
+            if self._state != IDLE:
+                self._schedule(now)
+            args = self._args
+
+        if action is not None:
+            action(*args)
+
+    def _release(self):
+        """Button was released, returns the action to call"""
+        if self._timer is not None:
+            self._timer.cancel()
+        released_before_hold_time = self._state == PRESSED
+        self._state = IDLE
+        # execute primary action if not held past hold_time
+        if released_before_hold_time and self.hold_mode in ('SecondFunc', 'SecondFuncRepeat'):
+            return self.when_pressed
+        return None
+
+    def _hold(self, now):
+        """Button was held for hold_time, returns the action to call"""
+        if self.hold_mode in ('Repeat', 'SecondFuncRepeat'):
+            self._state = HELD
+            # the repetitions keep their pace, however long the action takes
+            self._deadline += self._hold_time()
+            if self._deadline <= now:
+                self._deadline = now + self._hold_time()
         else:
-            self.when_pressed(*args)
+            # Postpone and SecondFunc call their action once
+            self._state = IDLE
+
+        if self.hold_mode in ('Repeat', 'Postpone'):
+            return self.when_pressed
+        return self.when_held
 
     def __del__(self):
         logger.debug('remove event detection')
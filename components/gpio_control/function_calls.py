@@ -1,13 +1,19 @@
 import logging
 import sys
-from subprocess import Popen as function_call
 import os
 import pathlib
 
+# the executor is shared with the MQTT daemon in the scripts folder
+sys.path.append(os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../scripts"))
+from command_executor import SUMMED_COMMANDS, CommandCoalescer, CommandExecutor, class_of  # noqa: E402
+
 
 class phoniebox_function_calls:
-    def __init__(self):
+    def __init__(self, executor=None, coalesce_window=0.1):
         self.logger = logging.getLogger(__name__)
+        # the callbacks only enqueue, the scripts are run by the executor
+        self.executor = executor if executor is not None else CommandExecutor()
+        self.coalescer = CommandCoalescer(self.submit_playout_control, coalesce_window) if coalesce_window else None
 
         playout_control_relative_path = "../../scripts/playout_controls.sh"
         function_calls_absolute_path = str(pathlib.Path(__file__).parent.absolute())
@@ -15,95 +21,106 @@ class phoniebox_function_calls:
         rfid_trigger_relative_path = "../../scripts/rfid_trigger_play.sh"
         self.rfid_trigger = os.path.abspath(os.path.join(function_calls_absolute_path, rfid_trigger_relative_path))
 
+    def function_call(self, command, command_class='player'):
+        if self.coalescer is not None:
+            self.coalescer.flush(command_class)
+        self.executor.submit(command_class, command)
+
+    def playout_control_call(self, command, value=None):
+        command_class = class_of(command)
+        if self.coalescer is not None and command in SUMMED_COMMANDS:
+            # playout_controls.sh defaults to one volume step
+            self.coalescer.add(command_class, command, 1 if value is None else int(value))
+        elif value is None:
+            self.function_call("{command} -c={name}".format(command=self.playout_control, name=command),
+                               command_class)
+        else:
+            self.function_call("{command} -c={name} -v={value}".format(command=self.playout_control, name=command,
+                                                                       value=value),
+                               command_class)
+
+    def submit_playout_control(self, command_class, command, value):
+        self.executor.submit(command_class, "{command} -c={name} -v={value}".format(
+            command=self.playout_control, name=command, value=SUMMED_COMMANDS[command].format(value)))
+
     def functionCallShutdown(self, *args):
-        function_call("{command} -c=shutdown".format(command=self.playout_control), shell=True)
+        self.playout_control_call('shutdown')
 
     def functionCallVolU(self, steps=None, *args):
-        if steps is None:
-            function_call("{command} -c=volumeup".format(command=self.playout_control), shell=True)
-        else:
-            function_call("{command} -c=volumeup -v={value}".format(value=steps,
-                command=self.playout_control),
-                    shell=True)
+        self.playout_control_call('volumeup', steps)
 
     def functionCallVolD(self, steps=None, *args):
-        if steps is None:
-            function_call("{command} -c=volumedown".format(command=self.playout_control), shell=True)
-        else:
-            function_call("{command} -c=volumedown -v={value}".format(value=steps,
-                command=self.playout_control),
-                    shell=True)
+        self.playout_control_call('volumedown', steps)
 
     def functionCallVol0(self, *args):
-        function_call("{command} -c=mute".format(command=self.playout_control), shell=True)
+        self.playout_control_call('mute')
 
     def functionCallPlayerNext(self, *args):
-        function_call("{command} -c=playernext".format(command=self.playout_control), shell=True)
+        self.playout_control_call('playernext')
 
     def functionCallPlayerPrev(self, *args):
-        function_call("{command} -c=playerprev".format(command=self.playout_control), shell=True)
+        self.playout_control_call('playerprev')
 
     def functionCallPlayerPauseForce(self, *args):
-        function_call("{command} -c=playerpauseforce".format(command=self.playout_control), shell=True)
+        self.playout_control_call('playerpauseforce')
 
     def functionCallPlayerPause(self, *args):
-        function_call("{command} -c=playerpause".format(command=self.playout_control), shell=True)
+        self.playout_control_call('playerpause')
 
     def functionCallRecordStart(self, *args):
-        function_call("{command} -c=recordstart".format(command=self.playout_control), shell=True)
+        self.playout_control_call('recordstart')
 
     def functionCallRecordStop(self, *args):
-        function_call("{command} -c=recordstop".format(command=self.playout_control), shell=True)
+        self.playout_control_call('recordstop')
 
     def functionCallRecordPlayLatest(self, *args):
-        function_call("{command} -c=recordplaylatest".format(command=self.playout_control), shell=True)
+        self.playout_control_call('recordplaylatest')
 
     def functionCallToggleWifi(self, *args):
-        function_call("{command} -c=togglewifi".format(command=self.playout_control), shell=True)
+        self.playout_control_call('togglewifi')
 
     def functionCallPlayerStop(self, *args):
-        function_call("{command} -c=playerstop".format(command=self.playout_control),
-                shell=True)
+        self.playout_control_call('playerstop')
 
     def functionCallPlayerSeekFwd(self, seconds=None, *args):
         if seconds is None:
             seconds = 10
-        function_call("{command} -c=playerseek -v=+{value}".format(command=self.playout_control, value=seconds), shell=True)
+        self.playout_control_call('playerseek', '+{}'.format(seconds))
 
     def functionCallPlayerSeekBack(self, seconds=None, *args):
         if seconds is None:
             seconds = 10
-        function_call("{command} -c=playerseek -v=-{value}".format(command=self.playout_control, value=seconds), shell=True)
+        self.playout_control_call('playerseek', '-{}'.format(seconds))
 
     def functionCallPlayerSeekFarFwd(self, seconds=None, *args):
         if seconds is None:
             seconds = 60
-        function_call("{command} -c=playerseek -v=+{value}".format(command=self.playout_control, value=seconds), shell=True)
+        self.playout_control_call('playerseek', '+{}'.format(seconds))
 
     def functionCallPlayerSeekFarBack(self, seconds=None, *args):
         if seconds is None:
             seconds = 60
-        function_call("{command} -c=playerseek -v=-{value}".format(command=self.playout_control, value=seconds), shell=True)
+        self.playout_control_call('playerseek', '-{}'.format(seconds))
 
     def functionCallPlayerRandomTrack(self, *args):
-        function_call("{command} -c=randomtrack".format(command=self.playout_control), shell=True)
+        self.playout_control_call('randomtrack')
 
     def functionCallPlayerRandomCard(self, *args):
-        function_call("{command} -c=randomcard".format(command=self.playout_control), shell=True)
+        self.playout_control_call('randomcard')
 
     def functionCallPlayerRandomFolder(self, *args):
-        function_call("{command} -c=randomfolder".format(command=self.playout_control), shell=True)
+        self.playout_control_call('randomfolder')
 
     def functionCallBluetoothToggle(self, mode=None, *args):
         if mode is None:
             mode = 'toggle'
-        function_call("{command} -c=bluetoothtoggle -v={value}".format(command=self.playout_control, value=mode), shell=True)
+        self.playout_control_call('bluetoothtoggle', mode)
 
     def functionCallTriggerPlayCardId(self, cardid, *args):
-        function_call("{command} --cardid={value}".format(command=self.rfid_trigger, value=cardid), shell=True)
+        self.function_call("{command} --cardid={value}".format(command=self.rfid_trigger, value=cardid))
 
     def functionCallTriggerPlayFolder(self, folder, *args):
-        function_call("{command} --dir={value}".format(command=self.rfid_trigger, value=folder), shell=True)
+        self.function_call("{command} --dir={value}".format(command=self.rfid_trigger, value=folder))
 
     def getFunctionCall(self, functionName):
         self.logger.error('Get FunctionCall: {} {}'.format(functionName, functionName in locals()))
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import configparser
 import os
+import sys
 import logging
 
 from signal import pause
@@ -10,16 +11,21 @@ from GPIODevices import (RotaryEncoder,
                          ShutdownButton,
                          SimpleButton,
                          LED,
-                         StatusLED)
+                         StatusLED,
+                         MPDStatusLED)
 from function_calls import phoniebox_function_calls
 from config_compatibility import ConfigCompatibilityChecks
 
+sys.path.append(os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../scripts"))
+from mpd_state import MPDStateService  # noqa: E402
+
 
 class GPIOControl():
 
     def __init__(self, function_calls):
         self.devices = []
         self.function_calls = function_calls
+        self.mpd_state = None
 
         GPIO.setmode(GPIO.BCM)
 
@@ -40,6 +46,12 @@ class GPIOControl():
             self.logger.error('Could not find FunctionCall {function_name}'.format(function_name=function_name))
         return lambda *args: None
 
+    def get_mpd_state(self):
+        """One connection to MPD for all devices following its state, started on first use"""
+        if self.mpd_state is None:
+            self.mpd_state = MPDStateService().start()
+        return self.mpd_state
+
     def generate_device(self, config, deviceName):
         print(deviceName)
         device_type = config.get('Type')
@@ -75,8 +87,10 @@ class GPIOControl():
             return LED(config.getint('Pin'),
                                 name=deviceName,
                                 initial_value=config.getboolean('initial_value', fallback=True))
-        elif device_type in ('StatusLED', 'MPDStatusLED'):
+        elif device_type == 'StatusLED':
             return StatusLED(config.getint('Pin'), name=deviceName)
+        elif device_type == 'MPDStatusLED':
+            return MPDStatusLED(config.getint('Pin'), self.get_mpd_state(), name=deviceName)
         elif device_type == 'RotaryEncoder':
             return RotaryEncoder(config.getint('Pin1'),
                     config.getint('Pin2'),
@@ -140,3 +154,6 @@ if __name__ == "__main__":
     devices = gpio_control_class.get_all_devices(config)
     gpio_control_class.print_all_devices()
     gpio_control_class.gpio_loop()
+    _phoniebox_function_calls.coalescer.flush()
+    gpio_control_class.logger.info('Commands run: {}, merged: {}'.format(_phoniebox_function_calls.executor.stats(),
+                                                                        _phoniebox_function_calls.coalescer.merged))
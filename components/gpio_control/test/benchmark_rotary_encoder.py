@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Rotary encoder decoding benchmark.
+# Replays quadrature edge trains at 1-5 kHz in real time into
+# RotaryEncoder._Callback of components/gpio_control and, for comparison,
+# into the former decoder with its ctypes state and unconditional debug
+# messages. Like the GPIO library, the callback is not called again while it
+# is running: edges arriving meanwhile are merged into the next call, which
+# only sees the latest levels. Reported per rate are the edges which were
+# merged (missed), the transitions where both pins changed at once as counted
+# by the decoder (illegal, not counted by the former decoder), the detents
+# decoded out of the detents turned and the time per callback.
+# A recorded trace can be replayed instead, one edge per line: seconds A B
+# Usage: python3 components/gpio_control/test/benchmark_rotary_encoder.py --detents 500 --rates 1000 2000 5000
+
+import argparse
+import ctypes
+import math
+import os
+import random
+import sys
+import time
+import types
+from importlib.machinery import SourceFileLoader
+
+from mock import MagicMock, patch
+
+GPIO_CONTROL_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+PIN_A = 23
+PIN_B = 24
+# levels (A, B) of one detent turned clockwise, starting from the rest position with both pins high
+CLOCKWISE = ((0, 1), (0, 0), (1, 0), (1, 1))
+
+
+class ReplayGPIO:
+    """Just enough of RPi.GPIO for the RotaryEncoder, the levels are set by the replay"""
+    IN = 1
+    BOTH = 33
+    PUD_UP = 22
+
+    def __init__(self):
+        self.levels = {PIN_A: 1, PIN_B: 1}
+
+    def setup(self, *args, **kwargs):
+        pass
+
+    def add_event_detect(self, *args, **kwargs):
+        pass
+
+    def remove_event_detect(self, *args, **kwargs):
+        pass
+
+    def input(self, pin):
+        return self.levels[pin]
+
+
+class Flags_bits(ctypes.LittleEndianStructure):
+    _fields_ = [("A", ctypes.c_uint8, 1), ("B", ctypes.c_uint8, 1)]
+
+
+class Flags(ctypes.Union):
+    _anonymous_ = ("bit",)
+    _fields_ = [("bit", Flags_bits), ("asByte", ctypes.c_uint8)]
+
+
+def load_rotary_encoder(gpio):
+    """A copy of GPIODevices.rotary_encoder of its own, using gpio, so the module of the other tests is untouched"""
+    path = os.path.join(GPIO_CONTROL_PATH, 'GPIODevices', 'rotary_encoder.py')
+    with patch.dict(sys.modules, {'RPi': MagicMock(), 'RPi.GPIO': MagicMock()}):
+        loader = SourceFileLoader('benchmarked_rotary_encoder', path)
+        module = types.ModuleType(loader.name)
+        module.__file__ = path
+        loader.exec_module(module)
+    module.GPIO = gpio
+    return module
+
+
+def legacy_encoder_class(module):
+    """The decoder before the integer state machine, for comparison"""
+    logger = module.logger
+    GPIO = module.GPIO
+
+    class LegacyRotaryEncoder(module.RotaryEncoder):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.encoderState = Flags()
+            self.illegalTransitions = None  # the former decoder did not count them
+
+        def _StepSize(self):
+            end = module.timer()
+            duration = end - self.startTime
+            self.startTime = end
+            return int(self.timeBase / duration) + 1
+
+        def _Callback(self, pin):
+            logger.debug('EventDetection Called')
+            statusA = GPIO.input(self.pinA)
+            statusB = GPIO.input(self.pinB)
+            self.encoderState.A = statusA
+            self.encoderState.B = statusB
+            logger.debug('new encoderState: "{}" -> {}, {},{}'.format(
+                self.encoderState.asByte, self.tblEncoder[self.encoderState.asByte], statusA, statusB))
+            current_state = self.encoderState.asByte
+            self.encoderState.asByte = self.tblEncoder[current_state]
+            if self.KeyIncr == self.encoderState.asByte:
+                steps = self._StepSize()
+                logger.info('{name}: Calling functionIncr {steps}'.format(name=self.name, steps=steps))
+                self.functionCallbackIncr(steps)
+            elif self.KeyDecr == self.encoderState.asByte:
+                steps = self._StepSize()
+                logger.info('{name}: Calling functionDecr {steps}'.format(name=self.name, steps=steps))
+                self.functionCallbackDecr(steps)
+            else:
+                logger.debug('Ignoring encoderState: "{}"'.format(self.encoderState.asByte))
+
+    return LegacyRotaryEncoder
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100.0 * len(ordered)) - 1)]
+
+
+def edge_train(detents, rate, jitter=0.0, seed=1):
+    """Edges (seconds, A, B) of turning clockwise by detents at rate edges per second"""
+    rnd = random.Random(seed)
+    edges = []
+    for index in range(detents * len(CLOCKWISE)):
+        offset = rnd.uniform(-jitter, jitter) / rate if jitter else 0
+        edges.append((index / rate + offset,) + CLOCKWISE[index % len(CLOCKWISE)])
+    edges.sort()
+    return edges
+
+
+def load_trace(path):
+    with open(path) as f:
+        return [(float(seconds), int(a), int(b)) for seconds, a, b in (line.split() for line in f if line.strip())]
+
+
+def replay(encoder_class, module, edges, realtime=True):
+    """Replay the edges in real time, calling the callback with the latest levels when it is free
+
+    Without realtime, the callback is called once per edge as fast as possible.
+    """
+    decoded = []
+    encoder = encoder_class(PIN_A, PIN_B, functionCallIncr=decoded.append, functionCallDecr=decoded.append,
+                            name='Benchmark')
+    gpio = module.GPIO
+    gpio.levels[PIN_A], gpio.levels[PIN_B] = 1, 1
+    last_levels = (1, 1)
+    durations = []
+    missed = 0
+    index = 0
+    started = time.perf_counter()
+    while index < len(edges):
+        due = started + edges[index][0]
+        while realtime and time.perf_counter() < due:
+            pass
+        # the edges which arrived while the previous callback was running are merged into this one
+        elapsed = time.perf_counter() - started
+        latest = index
+        while realtime and latest + 1 < len(edges) and edges[latest + 1][0] <= elapsed:
+            latest += 1
+        missed += latest - index
+        _, a, b = edges[latest]
+        pin = PIN_A if a != last_levels[0] else PIN_B
+        last_levels = gpio.levels[PIN_A], gpio.levels[PIN_B] = a, b
+        call_started = time.perf_counter()
+        encoder._Callback(pin)
+        durations.append(time.perf_counter() - call_started)
+        index = latest + 1
+    encoder.stop()
+    return {
+        'edges': len(edges),
+        'missed': missed,
+        'illegal': encoder.illegalTransitions,
+        'detents': len(decoded),
+        'expected': len(edges) // len(CLOCKWISE),
+        'callback_us_p50': percentile(durations, 50) * 1e6,
+        'callback_us_p95': percentile(durations, 95) * 1e6,
+    }
+
+
+def run_benchmark(detents=500, rates=(1000, 2000, 3000, 4000, 5000), jitter=0.0, trace=None):
+    """Results by decoder and rate, a trace is replayed at its recorded rate"""
+    module = load_rotary_encoder(ReplayGPIO())
+    decoders = {'int': module.RotaryEncoder, 'ctypes': legacy_encoder_class(module)}
+    trains = {'trace': load_trace(trace)} if trace else {rate: edge_train(detents, rate, jitter) for rate in rates}
+    return {name: {rate: replay(decoder, module, edges) for rate, edges in trains.items()}
+            for name, decoder in decoders.items()}
+
+
+def report(results):
+    lines = ['{:<8}{:>8}{:>8}{:>8}{:>8}{:>10}{:>10}{:>10}'.format(
+        'decoder', 'rate', 'edges', 'missed', 'illegal', 'detents', 'p50 us', 'p95 us')]
+    for name, rates in results.items():
+        for rate, result in rates.items():
+            illegal = '-' if result['illegal'] is None else result['illegal']
+            lines.append('{:<8}{:>8}{edges:>8}{missed:>8}{:>8}{detents:>5}/{expected:<4}'
+                         '{callback_us_p50:>10.1f}{callback_us_p95:>10.1f}'.format(name, rate, illegal, **result))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay rotary encoder edge trains and count the missed edges')
+    parser.add_argument('--detents', type=int, default=500, help='detents turned per rate')
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 2000, 3000, 4000, 5000],
+                        help='edges per second')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='random shift of each edge, as a fraction of the edge interval')
+    parser.add_argument('--trace', help='replay a recorded trace instead, one edge per line: seconds A B')
+    args = parser.parse_args()
+
+    print(report(run_benchmark(args.detents, args.rates, args.jitter, args.trace)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import os
 from mock import MagicMock, patch
 # add absolute parent path, to harmonize imports with gpio_control.py __main__ usage for tests
 sys.path.insert(1, "/".join(os.path.abspath(__file__).split("/")[0:-2]))
+# and the scripts folder, for the modules shared with the daemons there
+sys.path.append(os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../../scripts"))
 
 MockRPi = MagicMock()
 modules = {
@@ -10,6 +12,13 @@ modules = {
     "RPi.GPIO": MockRPi.GPIO,
 }
 
+# the values of RPi.GPIO, shared with the SimulatedGPIO
+MockRPi.GPIO.BCM = 11
+MockRPi.GPIO.OUT = 0
+MockRPi.GPIO.IN = 1
+MockRPi.GPIO.PUD_OFF = 20
+MockRPi.GPIO.PUD_DOWN = 21
+MockRPi.GPIO.PUD_UP = 22
 MockRPi.GPIO.RISING = 31
 MockRPi.GPIO.FALLING = 32
 MockRPi.GPIO.BOTH = 33
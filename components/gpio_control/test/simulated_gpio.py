@@ -0,0 +1,320 @@
+# Simulated RPi.GPIO backend for load tests of the GPIODevices.
+# Replays timestamped edge traces on a virtual clock and calls the event
+# callbacks one after another on a single thread, like the GPIO library does.
+# A callback takes its real duration (times slowdown) of virtual time, events
+# of a pin arriving meanwhile wait and are dropped, when max_pending events of
+# that pin are waiting already. It also serves as the scheduler of SimpleButton
+# and replaces the time module of the device modules, so hold times and the
+# sleeps within a callback, e.g. of the ShutdownButton, run on the virtual clock.
+
+import heapq
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from mock import patch
+from command_executor import percentile
+from GPIODevices.scheduler import Timer
+
+logger = logging.getLogger(__name__)
+
+# levels of one detent turned clockwise (A, B), starting from the rest position with both pins high
+CLOCKWISE = ((0, 1), (0, 0), (1, 0), (1, 1))
+
+
+def press(pin, at, duration, bounces=0, bounce_interval=0.001, active=0):
+    """Edges (seconds, pin, level) of pressing a button, each contact bouncing before it settles"""
+    edges = []
+    for start, level in ((at, active), (at + duration, 1 - active)):
+        for index in range(2 * bounces + 1):
+            edges.append((start + index * bounce_interval, pin, level if index % 2 == 0 else 1 - level))
+    return edges
+
+
+def quadrature(pin_a, pin_b, at, detents, rate, clockwise=True):
+    """Edges of turning a rotary encoder by detents at rate edges per second"""
+    levels = CLOCKWISE if clockwise else tuple((b, a) for a, b in CLOCKWISE)
+    edges = []
+    last = (1, 1)
+    for index in range(detents * len(levels)):
+        a, b = levels[index % len(levels)]
+        edges.append((at + index / rate, pin_a if a != last[0] else pin_b, a if a != last[0] else b))
+        last = (a, b)
+    return edges
+
+
+class EventDetection:
+
+    def __init__(self, edge, callback, bouncetime, level):
+        self.edge = edge
+        self.callbacks = [callback] if callback is not None else []
+        self.bouncetime = bouncetime / 1000.0 if bouncetime else 0
+        self.reported = level  # the level after the last reported edge
+        self.last_event = None
+        self.stable_since = None  # a change waiting for the signal to be stable for the bouncetime
+        self.pending = 0
+
+
+class VirtualTime:
+    """The time module of a device module, sleeping on the virtual clock of the simulation"""
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def sleep(self, seconds):
+        self.simulation.sleep(seconds)
+
+    def monotonic(self):
+        return self.simulation.now
+
+
+class VirtualScheduler:
+    """The scheduler of the SimpleButton on a virtual clock, its timers fire when the clock is advanced"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers = []
+
+    def clock(self):
+        return self.now
+
+    def call_at(self, deadline, callback, *args):
+        timer = Timer(deadline, callback, args)
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def _next_deadline(self):
+        while self._timers and self._timers[0].cancelled:
+            heapq.heappop(self._timers)
+        return self._timers[0].deadline if self._timers else None
+
+    def _fire_timer(self):
+        timer = heapq.heappop(self._timers)
+        timer.callback(*timer.args)
+
+    def run(self, until):
+        while True:
+            deadline = self._next_deadline()
+            if deadline is None or deadline > until:
+                break
+            self.now = max(self.now, deadline)
+            self._fire_timer()
+        self.now = max(self.now, until)
+
+    def advance(self, seconds):
+        self.run(self.now + seconds)
+
+
+class SimulatedGPIO(VirtualScheduler):
+    """The subset of RPi.GPIO used by the GPIODevices, driven by edge traces on a virtual clock
+
+    debounce is 'stable' like rpi-lgpio, which reports an edge after the level was stable for the bouncetime,
+    or 'ignore' like the former RPi.GPIO, which ignores edges within the bouncetime after an event.
+    """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, debounce='stable', max_pending=1, slowdown=1.0):
+        super().__init__()
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self.slowdown = slowdown
+        self.levels = {}
+        self.directions = {}
+        self.events = {}
+        self.delivered = 0
+        self.dropped = 0
+        self.bounced = 0
+        self.latencies = []
+        self._edges = []
+        self._queue = deque()
+        self._busy_until = 0.0
+        self._sequence = 0
+        self._in_callback = False
+        self._callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix='GPIOCallbacks')
+
+    def __repr__(self):
+        return '<SimulatedGPIO now={:.3f} delivered={} dropped={} bounced={}>'.format(
+            self.now, self.delivered, self.dropped, self.bounced)
+
+    @contextmanager
+    def patch(self, *modules):
+        """Use the simulation as GPIO and virtual time of the given device modules"""
+        with ExitStack() as stack:
+            for module in modules:
+                stack.enter_context(patch.object(module, 'GPIO', self))
+                if getattr(module, 'time', None) is time:
+                    stack.enter_context(patch.object(module, 'time', VirtualTime(self)))
+            yield self
+
+    # RPi.GPIO
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        self.directions[channel] = direction
+        if direction == self.OUT:
+            self.levels[channel] = initial if initial is not None else self.levels.get(channel, self.LOW)
+        elif channel not in self.levels:
+            self.levels[channel] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+
+    def input(self, channel):
+        return self.levels[channel]
+
+    def output(self, channel, value):
+        if self.directions.get(channel) != self.OUT:
+            raise RuntimeError('The GPIO channel has not been set up as an OUTPUT')
+        self.levels[channel] = int(bool(value))
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        if channel in self.events:
+            raise RuntimeError('Conflicting edge detection already enabled for this GPIO channel')
+        self.events[channel] = EventDetection(edge, callback, bouncetime, self.levels.get(channel, self.HIGH))
+
+    def add_event_callback(self, channel, callback):
+        self.events[channel].callbacks.append(callback)
+
+    def remove_event_detect(self, channel):
+        self.events.pop(channel, None)
+
+    def cleanup(self, channel=None):
+        if channel is None:
+            self.events.clear()
+        else:
+            self.events.pop(channel, None)
+
+    # replay
+
+    def add_edges(self, edges):
+        for seconds, channel, level in edges:
+            heapq.heappush(self._edges, (seconds, self._sequence, channel, level))
+            self._sequence += 1
+
+    def play(self, edges, settle=1.0):
+        """Replay the edges and run until settle seconds after the last one"""
+        edges = list(edges)
+        self.add_edges(edges)
+        self.run(max(seconds for seconds, _, _ in edges) + settle)
+        return self.stats()
+
+    def run(self, until):
+        self._advance(until, dispatch=True)
+
+    def sleep(self, seconds):
+        """Within a callback the edges meanwhile change the levels, but their events wait for the callback"""
+        self._advance(self.now + seconds, dispatch=not self._in_callback)
+
+    def _advance(self, until, dispatch):
+        while True:
+            happenings = []
+            if self._edges:
+                happenings.append((self._edges[0][0], 0, self._apply_edge))
+            stable = [detection.stable_since + detection.bouncetime
+                      for detection in self.events.values() if detection.stable_since is not None]
+            if stable:
+                happenings.append((min(stable), 1, self._settle))
+            if dispatch and self._queue:
+                happenings.append((max(self._busy_until, self._queue[0][0]), 2, self._dispatch))
+            deadline = self._next_deadline()
+            if deadline is not None:
+                happenings.append((deadline, 3, self._fire_timer))
+            if not happenings:
+                break
+            at, _, happen = min(happenings, key=lambda happening: happening[:2])
+            if at > until:
+                break
+            self.now = max(self.now, at)
+            happen()
+        self.now = max(self.now, until)
+
+    def _apply_edge(self):
+        _, _, channel, level = heapq.heappop(self._edges)
+        if self.levels.get(channel) == level:
+            return
+        self.levels[channel] = level
+        detection = self.events.get(channel)
+        if detection is None:
+            return
+        if self.debounce == 'stable' and detection.bouncetime:
+            if detection.stable_since is not None:
+                self.bounced += 1
+            detection.stable_since = self.now
+            return
+        if (detection.bouncetime and detection.last_event is not None
+                and self.now - detection.last_event < detection.bouncetime):
+            self.bounced += 1
+            return
+        self._detect(channel, detection, level)
+
+    def _settle(self):
+        for channel, detection in self.events.items():
+            if detection.stable_since is not None and detection.stable_since + detection.bouncetime <= self.now:
+                detection.stable_since = None
+                if self.levels[channel] != detection.reported:
+                    self._detect(channel, detection, self.levels[channel])
+
+    def _detect(self, channel, detection, level):
+        detection.reported = level
+        rising = level == self.HIGH
+        if detection.edge != self.BOTH and detection.edge != (self.RISING if rising else self.FALLING):
+            return
+        detection.last_event = self.now
+        if detection.pending >= self.max_pending:
+            self.dropped += 1
+            return
+        detection.pending += 1
+        self._queue.append((self.now, channel, detection))
+
+    def _dispatch(self):
+        arrived, channel, detection = self._queue.popleft()
+        detection.pending -= 1
+        self.latencies.append(self.now - arrived)
+        self.delivered += 1
+        started = time.perf_counter()
+        self._in_callback = True
+        try:
+            for callback in list(detection.callbacks):
+                self._callbacks.submit(self._call, callback, channel).result()
+        finally:
+            self._in_callback = False
+        self._busy_until = self.now + (time.perf_counter() - started) * self.slowdown
+
+    @staticmethod
+    def _call(callback, channel):
+        try:
+            callback(channel)
+        except Exception:
+            logger.exception('Callback {} of channel {} failed'.format(callback, channel))
+
+    def stats(self):
+        result = {'delivered': self.delivered, 'dropped': self.dropped, 'bounced': self.bounced}
+        if self.latencies:
+            result['latency_ms_p50'] = percentile(self.latencies, 50) * 1000
+            result['latency_ms_p95'] = percentile(self.latencies, 95) * 1000
+            result['latency_ms_max'] = max(self.latencies) * 1000
+        return result
+
+    def close(self):
+        self._callbacks.shutdown()
@@ -1,6 +1,6 @@
 import pytest
-from mock import patch, call
-from GPIODevices.led import LED, StatusLED, GPIO
+from mock import MagicMock, patch, call
+from GPIODevices.led import LED, StatusLED, MPDStatusLED, GPIO
 
 
 @pytest.fixture
@@ -70,3 +70,19 @@ class TestLED:
                 mock_system.assert_called_with('systemctl is-active --quiet phoniebox-startup-scripts.service')
                 GPIO.setup.assert_called_once_with(2, GPIO.OUT)
                 GPIO.output.assert_has_calls([call(2, False), call(2, GPIO.HIGH)])
+
+    def test_mpdstatusled_follows_mpd(self):
+        GPIO.reset_mock()
+        mpd_state = MagicMock()
+        mpd_state.state.connected = False
+        with patch('GPIODevices.led.system') as mock_system:
+            mock_system.side_effect = [False]
+            _led = MPDStatusLED(pin=3, mpd_state=mpd_state)
+        assert _led.name == 'MPDStatusLED'
+        mpd_state.subscribe.assert_called_once_with(_led.update, subsystems=())
+        # on after startup, off as long as MPD is not running
+        GPIO.output.assert_has_calls([call(3, False), call(3, GPIO.HIGH), call(3, GPIO.LOW)])
+        GPIO.reset_mock()
+        mpd_state.state.connected = True
+        _led.update(mpd_state.state, {'connection'})
+        GPIO.output.assert_called_once_with(3, GPIO.HIGH)
@@ -1,6 +1,8 @@
+import logging
+
 import pytest
-from mock import MagicMock
-from GPIODevices.rotary_encoder import RotaryEncoder, GPIO
+from mock import MagicMock, patch
+from GPIODevices.rotary_encoder import RotaryEncoder, GPIO, logger
 
 
 pinA = 1
@@ -74,3 +76,31 @@ class TestRotaryEncoder:
         print(mockCallDecr.call_count, mockCallIncr.call_count)
         mockCallDecr.assert_not_called()
         mockCallIncr.assert_called_once()
+
+    def test_illegal_transitions(self, rotaryEncoder):
+        # from the rest position both pins low at once, the edge in between was missed
+        GPIO.input.side_effect = lambda pin: 0
+        rotaryEncoder._Callback(1)
+        assert rotaryEncoder.illegalTransitions == 1
+        GPIO.input.side_effect = lambda pin: 1 if pin == pinA else 0
+        rotaryEncoder._Callback(1)
+        assert rotaryEncoder.illegalTransitions == 1
+
+    def test_no_debug_messages_are_formatted(self, rotaryEncoder):
+        GPIO.input.side_effect = lambda pin: 0
+        with patch.object(logger, 'debug') as debug:
+            logger.setLevel(logging.INFO)
+            rotaryEncoder._Callback(1)
+            debug.assert_not_called()
+            logger.setLevel(logging.DEBUG)
+            rotaryEncoder._Callback(1)
+            debug.assert_called_once()
+        logger.setLevel(logging.NOTSET)
+
+    def test_step_size(self, rotaryEncoder):
+        # detents 0.2 s apart are single steps, 0.02 s apart accelerate smoothly
+        times = [10.0, 10.2, 10.22, 10.24, 10.26, 10.3, 10.5]
+        with patch('GPIODevices.rotary_encoder.timer', side_effect=times):
+            rotaryEncoder.startTime = 9.8
+            steps = [rotaryEncoder._StepSize() for _ in times]
+        assert steps == [1, 1, 3, 4, 5, 4, 1]
@@ -1,6 +1,10 @@
+import time
+
 import pytest
 from mock import MagicMock
+from GPIODevices.scheduler import Scheduler
 from GPIODevices.simple_button import SimpleButton, GPIO
+from .simulated_gpio import VirtualScheduler
 
 
 mockedAction = MagicMock()
@@ -15,6 +19,25 @@ def simple_button():
     return SimpleButton(pin=1, action=mockedAction, action2=mockedSecAction, name='TestButton')
 
 
+@pytest.fixture
+def held_button():
+    mockedAction.reset_mock()
+    mockedSecAction.reset_mock()
+
+    return SimpleButton(pin=1, action=mockedAction, action2=mockedSecAction, name='TestButton',
+                        hold_time=0.3, scheduler=VirtualScheduler())
+
+
+def hold(button, seconds):
+    """Press the button, keep it pressed for seconds and release it"""
+    pressed = [True]
+    GPIO.input.side_effect = lambda *args: GPIO.LOW if pressed[0] else GPIO.HIGH
+    button.callbackFunctionHandler(button.pin)
+    button.scheduler.advance(seconds)
+    pressed[0] = False
+    button.scheduler.advance(0.2)
+
+
 class TestButton:
 
     def test_init(self):
@@ -103,85 +126,100 @@ class TestButton:
         mockedAction.assert_called_once_with(5)
         mockedSecAction.assert_not_called()
 
-    def test_hold_Repeat_longer_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, False, False, True]
-        simple_button.hold_time = 0
-        simple_button.hold_mode = 'Repeat'
-        calls = mockedAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
-        assert mockedAction.call_count - calls == 4
+    def test_hold_Repeat_longer_holdtime(self, held_button):
+        held_button.hold_mode = 'Repeat'
+        hold(held_button, 1.0)
+        assert mockedAction.call_count == 4
         mockedSecAction.assert_not_called()
 
-    def test_hold_Repeat_shorter_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, True]
-        simple_button.hold_time = 0.3
-        simple_button.hold_mode = 'Repeat'
-        calls = mockedAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
-        assert mockedAction.call_count - calls == 1
+    def test_hold_Repeat_shorter_holdtime(self, held_button):
+        held_button.hold_mode = 'Repeat'
+        hold(held_button, 0.2)
+        assert mockedAction.call_count == 1
         mockedSecAction.assert_not_called()
 
-    def test_hold_Postpone_longer_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, False, False, True]
-        simple_button.hold_time = 0
-        simple_button.hold_mode = 'Postpone'
-        calls = mockedAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
-        assert mockedAction.call_count - calls == 1
+    def test_hold_Repeat_timing(self, held_button):
+        held_button.hold_mode = 'Repeat'
+        times = []
+        held_button.when_pressed = lambda *args: times.append(held_button.scheduler.now)
+        hold(held_button, 1.0)
+        assert times == pytest.approx([0, 0.3, 0.6, 0.9])
+
+    def test_hold_Postpone_longer_holdtime(self, held_button):
+        held_button.hold_mode = 'Postpone'
+        hold(held_button, 1.0)
+        assert mockedAction.call_count == 1
         mockedSecAction.assert_not_called()
 
-    def test_hold_Postpone_shorter_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, True, True]
-        simple_button.hold_time = 0.3
-        simple_button.hold_mode = 'Postpone'
-        calls = mockedAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
-        assert mockedAction.call_count - calls == 0
+    def test_hold_Postpone_shorter_holdtime(self, held_button):
+        held_button.hold_mode = 'Postpone'
+        hold(held_button, 0.2)
+        mockedAction.assert_not_called()
         mockedSecAction.assert_not_called()
 
-    def test_hold_SecondFunc_longer_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, False, False, True]
-        simple_button.hold_time = 0
-        simple_button.hold_mode = 'SecondFunc'
-        calls = mockedSecAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
+    def test_hold_SecondFunc_longer_holdtime(self, held_button):
+        held_button.hold_mode = 'SecondFunc'
+        hold(held_button, 1.0)
         mockedAction.assert_not_called()
-        assert mockedSecAction.call_count - calls == 1
-
-    def test_hold_SecondFunc_shorter_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, True, True]
-        simple_button.hold_time = 0.3
-        simple_button.hold_mode = 'SecondFunc'
-        calls = mockedSecAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
+        assert mockedSecAction.call_count == 1
+
+    def test_hold_SecondFunc_shorter_holdtime(self, held_button):
+        held_button.hold_mode = 'SecondFunc'
+        hold(held_button, 0.2)
         mockedAction.assert_called_once()
-        assert mockedSecAction.call_count - calls == 0
-
-    def test_hold_SecondFuncRepeat_longer_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, False, False, True]
-        simple_button.hold_time = 0
-        simple_button.hold_mode = 'SecondFuncRepeat'
-        calls = mockedSecAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
+        mockedSecAction.assert_not_called()
+
+    def test_hold_SecondFunc_pressed_again(self, held_button):
+        # released and pressed again between two checks
+        held_button.hold_mode = 'SecondFunc'
+        held_button.callbackFunctionHandler(held_button.pin)
+        held_button.scheduler.advance(0.05)
+        hold(held_button, 0.2)
+        assert mockedAction.call_count == 2
+        mockedSecAction.assert_not_called()
+
+    def test_hold_SecondFuncRepeat_longer_holdtime(self, held_button):
+        held_button.hold_mode = 'SecondFuncRepeat'
+        hold(held_button, 1.0)
         mockedAction.assert_not_called()
-        assert mockedSecAction.call_count - calls == 3
-
-    def test_hold_SecondFuncRepeat_shorter_holdtime(self, simple_button):
-        GPIO.LOW = 0
-        GPIO.input.side_effect = [False, True, True]
-        simple_button.hold_time = 0.3
-        simple_button.hold_mode = 'SecondFuncRepeat'
-        calls = mockedSecAction.call_count
-        simple_button.callbackFunctionHandler(simple_button.pin)
+        assert mockedSecAction.call_count == 3
+
+    def test_hold_SecondFuncRepeat_shorter_holdtime(self, held_button):
+        held_button.hold_mode = 'SecondFuncRepeat'
+        hold(held_button, 0.2)
         mockedAction.assert_called_once()
-        assert mockedSecAction.call_count - calls == 0
+        mockedSecAction.assert_not_called()
+
+    def test_hold_does_not_block_other_buttons(self):
+        scheduler = Scheduler()
+        pressed = {1: True, 2: False}
+        GPIO.input.side_effect = lambda pin: GPIO.LOW if pressed[pin] else GPIO.HIGH
+        held_calls = []
+        hammered_calls = []
+        held = SimpleButton(pin=1, action=lambda *args: held_calls.append(args), name='held',
+                            hold_mode='Repeat', hold_time=0.1, scheduler=scheduler)
+        hammered = SimpleButton(pin=2, action=lambda *args: hammered_calls.append(args), name='hammered',
+                                hold_mode='SecondFunc', hold_time=0.1, scheduler=scheduler)
+
+        held.callbackFunctionHandler(1)
+        started = time.monotonic()
+        for _ in range(50):
+            hammered.callbackFunctionHandler(2)
+        assert time.monotonic() - started < 0.1
+        time.sleep(0.35)
+        pressed[1] = False
+        time.sleep(0.15)
+
+        # each press of the hammered button was released before the next one
+        assert len(hammered_calls) == 50
+        assert 3 <= len(held_calls) <= 5
+
+    def test_tick_after_release_is_ignored(self, held_button):
+        held_button.hold_mode = 'SecondFunc'
+        hold(held_button, 0.2)
+        held_button.scheduler.advance(1.0)
+        mockedAction.assert_called_once()
+        mockedSecAction.assert_not_called()
 
     def test_repr(self):
         button = SimpleButton(name='test_repr', pin=1, edge='rising', hold_mode=None, hold_time=2.5,
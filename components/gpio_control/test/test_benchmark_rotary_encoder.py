@@ -0,0 +1,42 @@
+from .benchmark_rotary_encoder import (CLOCKWISE, ReplayGPIO, edge_train, legacy_encoder_class, load_rotary_encoder,
+                                       load_trace, replay, report, run_benchmark)
+
+
+def test_edge_train():
+    edges = edge_train(3, 1000)
+    assert len(edges) == 12
+    assert [edge[1:] for edge in edges[:4]] == list(CLOCKWISE)
+    assert edges[1][0] == 0.001
+
+
+def test_decoders_agree():
+    module = load_rotary_encoder(ReplayGPIO())
+    edges = edge_train(5, 200)
+    for decoder, illegal in ((module.RotaryEncoder, 0), (legacy_encoder_class(module), None)):
+        # every edge gets its callback, however busy the machine is
+        result = replay(decoder, module, edges, realtime=False)
+        assert result['detents'] == result['expected'] == 5
+        assert result['illegal'] == illegal
+
+
+def test_illegal_transitions_are_counted_by_the_decoder():
+    module = load_rotary_encoder(ReplayGPIO())
+    edges = edge_train(5, 200)
+    # the edge of pin B within the second detent is missed, so both pins change at once
+    del edges[5]
+    result = replay(module.RotaryEncoder, module, edges, realtime=False)
+    assert result['illegal'] == 1
+
+
+def test_trace(tmpdir):
+    trace = tmpdir.join('trace')
+    trace.write(''.join('{} {} {}\n'.format(*edge) for edge in edge_train(2, 1000)))
+    assert load_trace(str(trace)) == edge_train(2, 1000)
+
+
+def test_run_benchmark():
+    results = run_benchmark(detents=5, rates=(1000, 5000))
+    assert set(results) == {'int', 'ctypes'}
+    assert set(results['int']) == {1000, 5000}
+    assert 'missed' in report(results)
+    assert ' - ' in report(results).splitlines()[-1]
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from function_calls import phoniebox_function_calls
+
+
+class RecordingExecutor:
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, command_class, command):
+        self.submitted.append((command_class, command))
+        return True
+
+
+@pytest.fixture
+def function_calls():
+    return phoniebox_function_calls(executor=RecordingExecutor(), coalesce_window=0)
+
+
+@pytest.fixture
+def coalescing():
+    return phoniebox_function_calls(executor=RecordingExecutor(), coalesce_window=0.05)
+
+
+def submitted(function_calls):
+    return [(command_class, command.split('/')[-1]) for command_class, command in function_calls.executor.submitted]
+
+
+class TestFunctionCalls:
+
+    def test_volume(self, function_calls):
+        function_calls.functionCallVolU()
+        function_calls.functionCallVolD(3)
+        function_calls.functionCallVol0()
+        assert submitted(function_calls) == [('volume', 'playout_controls.sh -c=volumeup'),
+                                             ('volume', 'playout_controls.sh -c=volumedown -v=3'),
+                                             ('volume', 'playout_controls.sh -c=mute')]
+
+    def test_seek(self, function_calls):
+        function_calls.functionCallPlayerSeekFwd()
+        function_calls.functionCallPlayerSeekFarBack()
+        function_calls.functionCallPlayerSeekBack(5)
+        assert submitted(function_calls) == [('player', 'playout_controls.sh -c=playerseek -v=+10'),
+                                             ('player', 'playout_controls.sh -c=playerseek -v=-60'),
+                                             ('player', 'playout_controls.sh -c=playerseek -v=-5')]
+
+    def test_system(self, function_calls):
+        function_calls.functionCallShutdown()
+        function_calls.functionCallBluetoothToggle()
+        assert submitted(function_calls) == [('system', 'playout_controls.sh -c=shutdown'),
+                                             ('system', 'playout_controls.sh -c=bluetoothtoggle -v=toggle')]
+
+    def test_rfid_trigger(self, function_calls):
+        function_calls.functionCallTriggerPlayCardId('0001234567')
+        function_calls.functionCallTriggerPlayFolder('Moby Dick')
+        assert submitted(function_calls) == [('player', 'rfid_trigger_play.sh --cardid=0001234567'),
+                                             ('player', 'rfid_trigger_play.sh --dir=Moby Dick')]
+
+
+class TestCoalescing:
+
+    def test_volume_steps_are_summed(self, coalescing):
+        for _ in range(7):
+            coalescing.functionCallVolU(1)
+        assert submitted(coalescing) == []
+        time.sleep(0.1)
+        assert submitted(coalescing) == [('volume', 'playout_controls.sh -c=volumeup -v=7')]
+        assert coalescing.coalescer.merged == 6
+
+    def test_seeks_are_summed(self, coalescing):
+        coalescing.functionCallPlayerSeekFwd()
+        coalescing.functionCallPlayerSeekFwd()
+        coalescing.functionCallPlayerSeekFarBack()
+        coalescing.coalescer.flush()
+        assert submitted(coalescing) == [('player', 'playout_controls.sh -c=playerseek -v=-40')]
+
+    def test_order_is_kept(self, coalescing):
+        coalescing.functionCallVolU()
+        coalescing.functionCallVolU(2)
+        coalescing.functionCallVolD()
+        coalescing.functionCallPlayerSeekFwd()
+        coalescing.functionCallPlayerNext()
+        assert submitted(coalescing) == [('volume', 'playout_controls.sh -c=volumeup -v=3'),
+                                         ('player', 'playout_controls.sh -c=playerseek -v=+10'),
+                                         ('player', 'playout_controls.sh -c=playernext')]
+        time.sleep(0.1)
+        assert submitted(coalescing)[-1] == ('volume', 'playout_controls.sh -c=volumedown -v=1')
+
+    def test_bursts_are_not_merged(self, coalescing):
+        coalescing.functionCallVolD(2)
+        time.sleep(0.1)
+        coalescing.functionCallVolD(2)
+        time.sleep(0.1)
+        assert submitted(coalescing) == [('volume', 'playout_controls.sh -c=volumedown -v=2')] * 2
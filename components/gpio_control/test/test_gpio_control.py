@@ -2,6 +2,7 @@ import pytest
 from mock import patch, call
 from gpio_control import GPIOControl
 from GPIODevices import (StatusLED,
+                                                 MPDStatusLED,
                                                  LED,
                                                  RotaryEncoder,
                                                  SimpleButton,
@@ -96,8 +97,9 @@ class TestGPIOControl:
     def test_generateDevice_MPDStatusLED(self, gpio_control_class):
         name = 'TEST_MPDStatusLED'
         configArray = {'Type': 'MPDStatusLED', 'Pin': '5'}
-        mock_init = func_test_generateDevice_type(gpio_control_class, name, configArray, StatusLED)
-        mock_init.assert_called_once_with(5, name=name)
+        gpio_control_class.mpd_state = 'TestMPDState'
+        mock_init = func_test_generateDevice_type(gpio_control_class, name, configArray, MPDStatusLED)
+        mock_init.assert_called_once_with(5, 'TestMPDState', name=name)
 
     def test_generateDevice_LED_default(self, gpio_control_class):
         name = 'TEST_LED'
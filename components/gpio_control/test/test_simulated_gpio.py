@@ -0,0 +1,122 @@
+import gc
+import threading
+import time
+
+import pytest
+from mock import MagicMock
+from GPIODevices import led, rotary_encoder, shutdown_button, simple_button, two_button_control
+from GPIODevices.led import LED
+from GPIODevices.rotary_encoder import RotaryEncoder
+from GPIODevices.shutdown_button import ShutdownButton
+from GPIODevices.simple_button import SimpleButton
+from GPIODevices.two_button_control import TwoButtonControl
+
+from .simulated_gpio import SimulatedGPIO, press, quadrature
+
+
+@pytest.fixture
+def gpio():
+    simulation = SimulatedGPIO()
+    with simulation.patch(simple_button, rotary_encoder, led, two_button_control, shutdown_button):
+        yield simulation
+        # the devices remove their event detection, when they are deleted
+        simulation.cleanup()
+        gc.collect()
+    simulation.close()
+
+
+def recording(calls, delay=0):
+    def action(*args):
+        calls.append((gpio_now(), threading.current_thread().name))
+        time.sleep(delay)
+    return action
+
+
+def gpio_now():
+    return simple_button.GPIO.clock()
+
+
+class TestSimulatedGPIO:
+
+    def test_bouncing_press(self, gpio):
+        calls = []
+        SimpleButton(pin=5, action=recording(calls), bouncetime=50, scheduler=gpio)
+        stats = gpio.play(press(5, at=1.0, duration=0.2, bounces=3))
+        # reported once the contact was stable for the bouncetime
+        assert [round(at, 3) for at, _ in calls] == [1.056]
+        assert calls[0][1].startswith('GPIOCallbacks')
+        assert stats['delivered'] == 1
+        assert stats['bounced'] == 12
+
+    def test_bouncetime_after_event(self, gpio):
+        gpio.debounce = 'ignore'
+        calls = []
+        SimpleButton(pin=5, action=recording(calls), bouncetime=50, scheduler=gpio)
+        gpio.play(press(5, at=1.0, duration=0.2, bounces=3))
+        # reported right away, but the bouncing release is long after the bouncetime and triggers again
+        assert [round(at, 3) for at, _ in calls] == [1.0, 1.201]
+        assert gpio.bounced == 11
+
+    def test_hold_on_virtual_clock(self, gpio):
+        calls = []
+        SimpleButton(pin=5, action=recording(calls), bouncetime=10, hold_mode='Repeat', hold_time=0.3,
+                     scheduler=gpio)
+        gpio.play(press(5, at=1.0, duration=1.0))
+        assert [round(at, 2) for at, _ in calls] == [1.01, 1.31, 1.61, 1.91]
+
+    def test_rotary_encoder(self, gpio):
+        incr, decr = MagicMock(), MagicMock()
+        RotaryEncoder(7, 8, functionCallIncr=incr, functionCallDecr=decr)
+        # the callbacks take no virtual time, otherwise a slow or busy host drops edges of the fast turn
+        gpio.slowdown = 0
+        gpio.play(quadrature(7, 8, at=0.5, detents=10, rate=1000)
+                  + quadrature(7, 8, at=1.0, detents=4, rate=1000, clockwise=False))
+        assert incr.call_count == 10
+        assert decr.call_count == 4
+        assert gpio.dropped == 0
+
+    def test_two_button_control(self, gpio):
+        btn1, btn2, both = [], [], []
+        TwoButtonControl(5, 6, recording(btn1), recording(btn2), recording(both), bouncetime=50)
+        # button 1 alone, then button 2 pressed while button 1 is held
+        gpio.play(press(5, at=1.0, duration=0.2) + press(5, at=2.0, duration=1.0) + press(6, at=2.2, duration=0.3))
+        assert [round(at, 3) for at, _ in btn1] == [1.05, 2.05]
+        assert btn2 == []
+        assert [round(at, 3) for at, _ in both] == [2.25]
+
+    def test_shutdown_button(self, gpio):
+        calls = []
+        ShutdownButton(3, action=recording(calls), bouncetime=50, led_pin=4, hold_time=1.0, iteration_time=0.2)
+        # released while the LED is flashing, the sleeps of the callback run on the virtual clock
+        gpio.play(press(3, at=1.0, duration=0.5))
+        assert calls == []
+        assert gpio.input(4) == gpio.LOW
+        # held for the hold_time, the LED stays on for the shutdown
+        stats = gpio.play(press(3, at=5.0, duration=2.0))
+        assert [round(at, 3) for at, _ in calls] == [6.65]
+        assert gpio.input(4) == gpio.HIGH
+        assert stats['delivered'] == 2
+
+    def test_led(self, gpio):
+        status_led = LED(9, initial_value=False)
+        assert status_led.status() == gpio.LOW
+        status_led.on()
+        assert status_led.status() == gpio.HIGH
+
+    def test_slow_callback_under_load(self, gpio):
+        gpio.slowdown = 10
+        slow_calls, fast_calls = [], []
+        SimpleButton(pin=5, action=recording(slow_calls, delay=0.005), bouncetime=1, scheduler=gpio)
+        SimpleButton(pin=6, action=recording(fast_calls), bouncetime=1, scheduler=gpio)
+        # both buttons are hammered every 10 ms, a slow callback takes about 50 ms of virtual time
+        edges = []
+        for index in range(20):
+            edges += press(5, at=0.01 * index, duration=0.005) + press(6, at=0.01 * index + 0.001, duration=0.005)
+        stats = gpio.play(edges)
+        assert stats['dropped'] > 0
+        assert stats['delivered'] + stats['dropped'] == 40
+        assert stats['latency_ms_max'] >= 40
+        # the callbacks never overlap
+        dispatched = sorted(slow_calls + fast_calls)
+        assert len(dispatched) == stats['delivered']
+        assert all(name == dispatched[0][1] for _, name in dispatched)
@@ -22,6 +22,13 @@ case "$choice" in
   * ) printf "ON" > "${JUKEBOX_HOME_DIR}"/settings/Rfidreader_Rc522_Readmode_UID;;
 esac
 
+printf "Is the IRQ pin of the reader connected (recommended)?\n"
+read -p "(Y/n) " choice
+case "$choice" in
+  n|N ) printf "POLL" > "${JUKEBOX_HOME_DIR}"/settings/Rfidreader_Rc522_Detection;;
+  * ) printf "IRQ" > "${JUKEBOX_HOME_DIR}"/settings/Rfidreader_Rc522_Detection;;
+esac
+
 printf "Installing Python requirements for RC522...\n"
 sudo python3 -m pip install --upgrade --force-reinstall --no-deps -q -r "${JUKEBOX_HOME_DIR}"/components/rfid-reader/RC522/requirements.txt
 
@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
 import datetime
+import json
 import os
+import random
 import re
 import subprocess
 import time
-from threading import Thread
+from collections import OrderedDict
+from threading import Event, Lock, Thread
 
 import inotify.adapters
+import inotify.constants
 import paho.mqtt.client as mqtt
 import paho.mqtt.enums as mqtt_enum
 
+from command_executor import REPLACED_COMMANDS, SUMMED_COMMANDS, CommandCoalescer, CommandExecutor, class_of
+from mpd_client import MPDConnection, MPDError
+from mpd_state import MPDStateService
+
 # ----------------------------------------------------------
 #  Prerequisites
 # ----------------------------------------------------------
@@ -32,8 +41,15 @@ config = {
     "mqttCert": "/home/pi/MQTT/mqtt-client-phoniebox.crt",  # path to client certificate for certificate-based authentication
     "mqttKey": "/home/pi/MQTT/mqtt-client-phoniebox.key",  # path to client keyfile for certificate-based authentication
     "mqttConnectionTimeout": 60,  # in seconds; timeout for MQTT connection
+    "mqttReconnectDelayMin": 1,  # in seconds; first delay before reconnecting, doubled with every failed attempt
+    "mqttReconnectDelayMax": 120,  # in seconds; longest delay before reconnecting
+    "mqttOfflineQueueSize": 64,  # how many topics to hold back while disconnected, only the latest message of each
     "refreshIntervalPlaying": 5,  # in seconds; how often should the status be sent to MQTT (while playing)
     "refreshIntervalIdle": 30,  # in seconds; how often should the status be sent to MQTT (when NOT playing)
+    "collectorTimeout": 2,  # in seconds; how long to wait for a single value (e.g. from systemctl or vcgencmd)
+    "mqttStateJson": False,  # publish all attributes as one JSON document to <mqttBaseTopic>/state/json, too
+    "commandQueueSize": 32,  # how many commands may wait to be executed, further commands are dropped
+    "commandCoalesceWindow": 0.1,  # in seconds; repetitions of a command within this time are combined into one
 }
 
 
@@ -47,6 +63,12 @@ path = os.path.dirname(os.path.realpath(__file__))
 # internal refresh interval
 refreshInterval = config.get("refreshIntervalPlaying")
 
+# persistent connection to MPD, shared by all threads
+mpd = MPDConnection()
+
+# MQTT client (a ReconnectingClient), created in main()
+client = None
+
 # list of available commands and attributes
 arAvailableCommands = [
     "volumeup",
@@ -82,6 +104,7 @@ arAvailableCommandsWithParam = [
     "playfolder",
     "playfolderrecursive",
 ]
+
 arAvailableAttributes = [
     "volume",
     "mute",
@@ -112,36 +135,211 @@ arAvailableAttributes = [
     "temperature",
 ]
 
+# published on request only, as they change with every refresh
+diagnosticAttributes = [
+    "collector_durations",
+    "published_messages",
+    "suppressed_messages",
+    "mqtt_reconnects",
+    "mqtt_downtime",
+]
 
-def watchForNewCard():
-    i = inotify.adapters.Inotify()
-    i.add_watch(path + "/../settings/Latest_RFID")
 
-    # wait for inotify events
-    for event in i.event_gen(yield_nones=False):
-        if event is not None:
-            # fetch event attributes
-            (e_header, e_type_names, e_path, e_filename) = event
+# settings files and the attributes they hold
+settingsAttributes = {
+    "Latest_RFID": "last_card",
+    "Max_Volume_Limit": "maxvolume",
+    "Audio_Volume_Change_Step": "volstep",
+    "Idle_Time_Before_Shutdown": "idletime",
+}
 
-            # file was closed and written => a new card was swiped
-            if "IN_CLOSE_WRITE" in e_type_names:
-                # fetch card ID
-                cardid = readfile(path + "/../settings/Latest_RFID")
 
-                # publish event "card_swiped"
-                client.publish(
-                    config.get("mqttBaseTopic") + "/event/card_swiped", payload=cardid
-                )
-                print(" --> Publishing event card_swiped = " + cardid)
+class SettingsObserver:
+    """ Keeps the values of the settings files, read again as soon as inotify reports that one was written
+
+    callback(attribute, value) is called from the observer thread for each change.
+    """
+
+    def __init__(self, settingsPath, attributes):
+        self.settingsPath = settingsPath
+        self.attributes = attributes  # file name => attribute name
+        self.values = {}
+        self.callbacks = []
+        self.lock = Lock()
+        self.watching = Event()
+        self.stopped = Event()
+
+    def __repr__(self):
+        return "<SettingsObserver {} values={}>".format(self.settingsPath, len(self.values))
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def read(self, filename):
+        attribute = self.attributes[filename]
+        try:
+            value = readfile(os.path.join(self.settingsPath, filename))
+        except OSError as e:
+            print(" --> Could not read setting " + filename + ":", e)
+            return None
+        with self.lock:
+            self.values[attribute] = value
+        return value
+
+    def readAll(self):
+        for filename in self.attributes:
+            self.read(filename)
+
+    def collect(self):
+        with self.lock:
+            return dict(self.values)
+
+    def handle(self, typeNames, filename):
+        # written in place or replaced by another file
+        if filename not in self.attributes or not ("IN_CLOSE_WRITE" in typeNames or "IN_MOVED_TO" in typeNames):
+            return
+        value = self.read(filename)
+        if value is None:
+            return
+        for callback in self.callbacks:
+            try:
+                callback(self.attributes[filename], value)
+            except Exception as e:
+                print(" --> Handling the change of setting " + filename + " failed:", repr(e))
+
+    def run(self):
+        i = inotify.adapters.Inotify()
+        i.add_watch(self.settingsPath, mask=inotify.constants.IN_CLOSE_WRITE | inotify.constants.IN_MOVED_TO)
+        self.watching.set()
+
+        # read again, a file might have been written before the watch was added
+        self.readAll()
+
+        # wait for inotify events, None once a second
+        for event in i.event_gen():
+            if self.stopped.is_set():
+                break
+            if event is not None:
+                (e_header, e_type_names, e_path, e_filename) = event
+                self.handle(e_type_names, e_filename)
+
+    def start(self):
+        self.readAll()
+        Thread(target=self.run, name="settings", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+
+settingsObserver = SettingsObserver(path + "/../settings", settingsAttributes)
+
+
+def onSettingChanged(attribute, value):
+    # file was closed and written => a new card was swiped
+    if attribute == "last_card":
+        # publish event "card_swiped"
+        client.publish(
+            config.get("mqttBaseTopic") + "/event/card_swiped", payload=value
+        )
+        print(" --> Publishing event card_swiped = " + value)
 
-                # process all attributes
-                processGet("all")
+    # process all attributes, publishing the changed ones
+    processGet("all")
+
+
+class ReconnectingClient:
+    """ Publishes through the MQTT client while connected and holds back the latest message per topic while not
+
+    paho's network loop reconnects after the delay set here: doubled with every failed attempt, with jitter,
+    so many boxes do not hit a restarted server at the same time.
+    """
+
+    def __init__(self, mqttClient, queueSize=64, minDelay=1, maxDelay=120, clock=time.monotonic):
+        self.mqtt = mqttClient
+        self.queueSize = queueSize
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.clock = clock
+        self.connected = False
+        self.queued = OrderedDict()  # topic => (payload, qos, retain)
+        self.attempts = 0
+        self.reconnects = 0
+        self.downtime = 0.0  # seconds, of the connections lost before
+        self.disconnected = None  # monotonic time the connection was lost
+        self.dropped = 0
+        self.lock = Lock()
+
+    def __repr__(self):
+        return "<ReconnectingClient connected={} reconnects={} queued={}>".format(
+            self.connected, self.reconnects, len(self.queued)
+        )
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self.lock:
+            if self.connected:
+                return self.mqtt.publish(topic, payload=payload, qos=qos, retain=retain)
+
+            # keep the latest message per topic, dropping the oldest topic if there are too many
+            self.queued.pop(topic, None)
+            if len(self.queued) >= self.queueSize:
+                self.queued.popitem(last=False)
+                self.dropped += 1
+            self.queued[topic] = (payload, qos, retain)
+            return None
+
+    def nextDelay(self):
+        delay = min(self.maxDelay, self.minDelay * 2 ** self.attempts)
+        delay = random.uniform(delay / 2, delay)
+        self.attempts += 1
+        self.mqtt.reconnect_delay_set(delay, delay)
+        return delay
+
+    def onConnect(self):
+        with self.lock:
+            if self.disconnected is not None:
+                self.reconnects += 1
+                self.downtime += self.clock() - self.disconnected
+                self.disconnected = None
+            self.attempts = 0
+            self.connected = True
+
+            queued, self.queued = self.queued, OrderedDict()
+            for topic, (payload, qos, retain) in queued.items():
+                self.mqtt.publish(topic, payload=payload, qos=qos, retain=retain)
+        if queued:
+            print(" --> Publishing " + str(len(queued)) + " messages held back while disconnected")
+
+    def onDisconnect(self):
+        with self.lock:
+            if self.connected:
+                self.connected = False
+                self.disconnected = self.clock()
+        print("Reconnecting in {:.1f} seconds".format(self.nextDelay()))
+
+    def getDowntime(self):
+        """ Seconds without connection since the first connect """
+        with self.lock:
+            downtime = self.downtime
+            if self.disconnected is not None:
+                downtime += self.clock() - self.disconnected
+        return downtime
 
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print("Connection established.")
 
+        # subscribe to topics, again after reconnecting as the server might have forgotten the subscriptions
+        print("Subscribing to " + config.get("mqttBaseTopic") + "/cmd/#")
+        client.subscribe(config.get("mqttBaseTopic") + "/cmd/#")
+        print("Subscribing to " + config.get("mqttBaseTopic") + "/get/#")
+        client.subscribe(config.get("mqttBaseTopic") + "/get/#")
+
+        # the broker might have lost the retained attributes => publish all of them again
+        publishedState.reset()
+        stateDocument.reset()
+
         # retrieve server version and edition
         version = readfile(path + "/../settings/version")
         edition = readfile(path + "/../settings/edition")
@@ -178,13 +376,22 @@ def on_connect(client, userdata, flags, rc):
             retain=True,
         )
 
+        # publish what was held back while disconnected
+        userdata.onConnect()
+
     else:
         print("Connection could NOT be established. Return-Code:", rc)
 
 
+def on_connect_fail(client, userdata):
+    print("Connection could NOT be established.")
+    print("Reconnecting in {:.1f} seconds".format(userdata.nextDelay()))
+
+
 def on_disconnect(client, userdata, rc):
     print("Disconnecting. Return-Code:", str(rc))
-    client.loop_stop()
+    # paho's network loop reconnects
+    userdata.onDisconnect()
 
 
 def on_log(client, userdata, level, buf):
@@ -197,143 +404,374 @@ def on_message(client, userdata, message):
     print(" - topic =", message.topic)
     print(" - value =", message.payload.decode("utf-8"))
 
-    regex_extract = re.search(
-        config.get("mqttBaseTopic") + "\/(.*)\/(.*)", message.topic
+    # commands and requests are executed by the command queue, so the network loop is never blocked
+    router.dispatch(message.topic, message.payload.decode("utf-8"))
+
+
+def isRelative(parameter):
+    return parameter[:1] in ("+", "-")
+
+
+# commands of one class are executed one after another in the order they arrived, the classes in parallel
+# the classes, their timeouts and which repetitions are combined are shared with the GPIO control
+commandExecutor = CommandExecutor(config.get("commandQueueSize"))
+
+
+def submitCoalesced(commandClass, command, value):
+    """ Called by the commandCoalescer with the combined repetitions of a command """
+    # summed repetitions are passed as value, e.g. 20x volumeup => volumeup -v=20
+    if isinstance(value, int):
+        value = SUMMED_COMMANDS[command].format(value)
+    router.routes["cmd/" + command].submit(value)
+
+
+commandCoalescer = CommandCoalescer(submitCoalesced, config.get("commandCoalesceWindow"))
+
+
+def publishAvailableCommands():
+    availableCommands = ", ".join(arAvailableCommands)
+    availableCommandsWithParam = ", ".join(arAvailableCommandsWithParam)
+    client.publish(
+        config.get("mqttBaseTopic") + "/available_commands",
+        payload=availableCommands,
+    )
+    client.publish(
+        config.get("mqttBaseTopic") + "/available_commands_with_params",
+        payload=availableCommandsWithParam,
+    )
+    print(" --> Publishing response available_commands =", availableCommands)
+    print(
+        " --> Publishing response available_commands_with_params =",
+        availableCommandsWithParam,
     )
-    message_topic = regex_extract.group(1).lower()
-    message_subtopic = regex_extract.group(2).lower()
-    message_payload = message.payload.decode("utf-8")
 
-    if message_topic == "cmd":
-        processCmd(message_subtopic, message_payload)
 
-    elif message_topic == "get":
-        processGet(message_subtopic)
+def publishAvailableAttributes():
+    availableAttributes = ", ".join(arAvailableAttributes + diagnosticAttributes)
+    client.publish(
+        config.get("mqttBaseTopic") + "/available_attributes",
+        payload=availableAttributes,
+    )
+    print(" --> Publishing response", availableAttributes)
 
 
-def processCmd(command, parameter):
-    # list all commands
-    if command == "help":
-        availableCommands = ", ".join(arAvailableCommands)
-        availableCommandsWithParam = ", ".join(arAvailableCommandsWithParam)
-        client.publish(
-            config.get("mqttBaseTopic") + "/available_commands",
-            payload=availableCommands,
-        )
-        client.publish(
-            config.get("mqttBaseTopic") + "/available_commands_with_params",
-            payload=availableCommandsWithParam,
-        )
-        print(" --> Publishing response available_commands =", availableCommands)
-        print(
-            " --> Publishing response available_commands_with_params =",
-            availableCommandsWithParam,
-        )
+def parseNothing(parameter):
+    """ Commands w/o param ignore the payload """
+    return ""
 
-    # toggle RFID reader daemon
-    elif command == "rfid":
-        parameter = parameter.lower()
-        if parameter == "start" or parameter == "stop":
-            subprocess.call(
-                ["sudo /bin/systemctl " + parameter + " phoniebox-rfid-reader.service"],
-                shell=True,
-            )
+
+def parseNumber(minimum=None, maximum=None, signed=False):
+    def parse(parameter):
+        value = int(parameter)
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            raise ValueError("expecting a number from {} to {}".format(minimum, maximum))
+        # a leading sign is kept, playout_controls.sh seeks relative with it and absolute without it
+        if signed and parameter.strip()[:1] in ("+", "-"):
+            return "{:+d}".format(value)
+        return str(value)
+
+    return parse
+
+
+def parseChoice(*choices):
+    def parse(parameter):
+        parameter = parameter.strip().lower()
+        if parameter not in choices:
+            raise ValueError("expecting parameter " + " or ".join(choices))
+        return parameter
+
+    return parse
+
+
+# the parameters are passed to a shell => allow only what is needed
+cardIdPattern = re.compile(r"[0-9A-Za-z]+")
+folderPattern = re.compile(r"[^'\x00-\x1f]+")
+
+
+def parseCardId(parameter):
+    if not cardIdPattern.fullmatch(parameter):
+        raise ValueError("expecting letters and digits")
+    return parameter
+
+
+def parseFolder(parameter):
+    if not folderPattern.fullmatch(parameter):
+        raise ValueError("expecting a folder name w/o quotes")
+    return parameter
+
+
+commandParameters = {
+    "setvolume": parseNumber(0, 100),
+    "setvolstep": parseNumber(1, 100),
+    "setmaxvolume": parseNumber(0, 100),
+    "setidletime": parseNumber(0),
+    "playerseek": parseNumber(signed=True),
+    "shutdownafter": parseNumber(0),
+    "shutdownvolumereduction": parseNumber(0),
+    "playerstopafter": parseNumber(0),
+    "playerrepeat": parseChoice("single", "playlist", "off"),
+    "rfid": parseChoice("start", "stop"),
+    "gpio": parseChoice("start", "stop"),
+    "swipecard": parseCardId,
+    "playfolder": parseFolder,
+    "playfolderrecursive": parseFolder,
+}
+
+
+def playoutControls(command, parameter):
+    if parameter:
+        return path + "/playout_controls.sh -c=" + command + " -v=" + parameter
+    return path + "/playout_controls.sh -c=" + command
+
+
+# all the other commands are sent to playout_controls.sh
+commandShells = {
+    "rfid": lambda command, parameter: "sudo /bin/systemctl " + parameter + " phoniebox-rfid-reader.service",
+    "gpio": lambda command, parameter: "sudo /bin/systemctl " + parameter + " phoniebox-gpio-control.service",
+    "swipecard": lambda command, parameter: path + "/rfid_trigger_play.sh -i=" + parameter,
+    "playfolder": lambda command, parameter: path + "/rfid_trigger_play.sh -d='" + parameter + "'",
+    "playfolderrecursive": lambda command, parameter: path + "/rfid_trigger_play.sh -d='" + parameter + "' -v=recursive",
+}
+
+
+class CommandRoute:
+    """ cmd/<command>: validates the payload and passes the command to the command executor """
+
+    def __init__(self, name, parse, shell, commandClass, coalesce=None):
+        self.name = name
+        self.parse = parse
+        self.shell = shell
+        self.commandClass = commandClass
+        self.coalesce = coalesce
+
+    def __repr__(self):
+        return "<CommandRoute {} class={}>".format(self.name, self.commandClass)
+
+    def handle(self, payload):
+        try:
+            parameter = self.parse(payload)
+        except ValueError as e:
+            print(" --> Invalid parameter " + repr(payload) + " for command " + self.name + ":", e)
+            return False
+
+        if self.coalesce == "sum" and not parameter:
+            commandCoalescer.add(self.commandClass, self.name, 1)
+        elif self.coalesce == "sum" and isRelative(parameter):
+            # relative values like the seconds of playerseek
+            commandCoalescer.add(self.commandClass, self.name, int(parameter))
+        elif self.coalesce:
+            # an absolute value like the position of playerseek replaces whatever was waiting
+            commandCoalescer.add(self.commandClass, self.name, parameter, replace=True)
         else:
-            print(" --> Expecting parameter start or stop")
-
-    # toggle GPIO button daemon
-    elif command == "gpio":
-        parameter = parameter.lower()
-        if parameter == "start" or parameter == "stop":
-            subprocess.call(
-                [
-                    "sudo /bin/systemctl "
-                    + parameter
-                    + " phoniebox-gpio-control.service"
-                ],
-                shell=True,
-            )
+            # a waiting repetition of another command of the class is executed first
+            commandCoalescer.flush(self.commandClass)
+            return self.submit(parameter)
+        return True
+
+    def submit(self, parameter):
+        print(" --> Sending command " + self.name + " and value " + repr(parameter))
+        return commandExecutor.submit(self.commandClass, self.shell(self.name, parameter), done=self.refresh)
+
+    def refresh(self, returncode):
+        # refresh all attributes as they might have changed
+        collectors.invalidate()
+        processGet("all")
+
+
+class GetRoute:
+    """ get/<attribute>: publishes the attribute, even if it did not change """
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+
+    def __repr__(self):
+        return "<GetRoute {}>".format(self.attribute)
+
+    def handle(self, payload):
+        return commandExecutor.submit("get", self.execute)
+
+    def execute(self):
+        processGet(self.attribute, force=True)
+
+
+class HelpRoute:
+    """ cmd/help and get/help: answered right away """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __repr__(self):
+        return "<HelpRoute {}>".format(self.function.__name__)
+
+    def handle(self, payload):
+        self.function()
+        return True
+
+
+class Router:
+    """ Maps the topics <base>/cmd/<command> and <base>/get/<attribute> to their routes """
+
+    def __init__(self, baseTopic):
+        self.prefix = baseTopic + "/"
+        self.routes = {}
+
+    def __repr__(self):
+        return "<Router {} routes={}>".format(self.prefix, len(self.routes))
+
+    def add(self, topic, route):
+        self.routes[topic] = route
+
+    def route(self, topic):
+        if not topic.startswith(self.prefix):
+            return None
+        return self.routes.get(topic[len(self.prefix):].lower())
+
+    def dispatch(self, topic, payload):
+        route = self.route(topic)
+        if route is None:
+            print(" --> Unknown topic", topic)
+            return False
+        return route.handle(payload)
+
+
+def buildRouter(baseTopic):
+    router = Router(baseTopic)
+    router.add("cmd/help", HelpRoute(publishAvailableCommands))
+    router.add("get/help", HelpRoute(publishAvailableAttributes))
+    router.add("get/all", GetRoute("all"))
+    for attribute in arAvailableAttributes + diagnosticAttributes:
+        router.add("get/" + attribute, GetRoute(attribute))
+
+    for command in arAvailableCommands + arAvailableCommandsWithParam:
+        if command in SUMMED_COMMANDS:
+            coalesce = "sum"
+        elif command in REPLACED_COMMANDS:
+            coalesce = "last"
         else:
-            print(" --> Expecting parameter start or stop")
-
-    # virtually swipe a RFID card
-    elif command == "swipecard":
-        print(" --> Virtually swiping card with ID", parameter)
-        subprocess.call([path + "/rfid_trigger_play.sh -i=" + parameter], shell=True)
-
-    # play folder
-    elif command == "playfolder":
-        print(" --> Playing folder", parameter)
-        subprocess.call(
-            [path + "/rfid_trigger_play.sh -d='" + parameter + "'"], shell=True
+            coalesce = None
+        router.add(
+            "cmd/" + command,
+            CommandRoute(
+                command,
+                commandParameters.get(command, parseNothing),
+                commandShells.get(command, playoutControls),
+                class_of(command),
+                coalesce,
+            ),
         )
+    return router
 
-    # play folder (recursive)
-    elif command == "playfolderrecursive":
-        print(" --> Playing folder " + parameter + " (recursive)")
-        subprocess.call(
-            [path + "/rfid_trigger_play.sh -d='" + parameter + "' -v=recursive"],
-            shell=True,
-        )
 
-    # all the other known commands w/o param
-    elif command in arAvailableCommands:
-        print(" --> Sending command " + command + " to playout_controls.sh")
-        subprocess.call([path + "/playout_controls.sh -c=" + command], shell=True)
-
-    # all the other known commands /w param
-    elif command in arAvailableCommandsWithParam:
-        print(
-            " --> Sending command "
-            + command
-            + " and value "
-            + parameter
-            + " to playout_controls.sh"
-        )
-        subprocess.call(
-            [path + "/playout_controls.sh -c=" + command + " -v=" + parameter],
-            shell=True,
-        )
+router = buildRouter(config.get("mqttBaseTopic"))
 
-    # we don't know this command
-    else:
-        print(" --> Unknown command", command)
-        return
 
-    # this was a known command => refresh all attributes as they might have changed
-    client.publish(config.get("mqttBaseTopic") + "/get/all", payload="")
+class PublishedState:
+    """ Remembers the last payload published per attribute, so unchanged attributes are not published again
 
+    The attributes are retained by the broker, so subscribers connecting later still get all of them.
+    """
 
-def processGet(attribute):
-    mpd_status = fetchData()
+    def __init__(self):
+        self.payloads = {}
+        self.sent = 0
+        self.suppressed = 0
+        self.lock = Lock()
 
-    # respond with all attributes
-    if attribute == "all":
-        for attribute in mpd_status:
+    def __repr__(self):
+        return "<PublishedState sent={} suppressed={}>".format(self.sent, self.suppressed)
+
+    def reset(self):
+        """ Publish every attribute on the next refresh, e.g. after (re)connecting to the broker """
+        with self.lock:
+            self.payloads.clear()
+
+    def publish(self, attribute, payload, force=False):
+        # publish while holding the lock, so the retained payload is the one remembered
+        with self.lock:
+            if not force and self.payloads.get(attribute) == payload:
+                self.suppressed += 1
+                return False
+            self.payloads[attribute] = payload
+            self.sent += 1
             client.publish(
                 config.get("mqttBaseTopic") + "/attribute/" + attribute,
-                payload=mpd_status[attribute],
+                payload=payload,
+                retain=True,
             )
-            print(
-                " --> Publishing response " + attribute + " = " + mpd_status[attribute]
+        print(" --> Publishing response " + attribute + " = " + payload)
+        return True
+
+
+publishedState = PublishedState()
+
+
+class StateDocument:
+    """ Publishes all attributes as one retained JSON document, so consumers get a consistent snapshot
+
+    The sequence number counts the published documents, the timestamp is the time of publishing.
+    """
+
+    def __init__(self):
+        self.attributes = None
+        self.sequence = 0
+        self.lock = Lock()
+
+    def __repr__(self):
+        return "<StateDocument sequence={}>".format(self.sequence)
+
+    def reset(self):
+        with self.lock:
+            self.attributes = None
+
+    def publish(self, attributes, force=False):
+        with self.lock:
+            if not force and attributes == self.attributes:
+                return False
+            self.attributes = attributes
+            self.sequence += 1
+            payload = json.dumps(
+                {"sequence": self.sequence, "timestamp": round(time.time(), 3), "attributes": attributes},
+                separators=(",", ":"),
             )
+            client.publish(config.get("mqttBaseTopic") + "/state/json", payload=payload, retain=True)
+        print(" --> Publishing state/json with sequence", self.sequence)
+        return True
+
+
+stateDocument = StateDocument()
 
-    # list all possible attributes
-    elif attribute == "help":
-        availableAttributes = ", ".join(arAvailableAttributes)
+
+def publishDiagnostics(attributes):
+    """ Diagnostics change with every refresh, so they are only published on request and not retained """
+    diagnostics = fetchDiagnostics()
+    for attribute in attributes:
         client.publish(
-            config.get("mqttBaseTopic") + "/available_attributes",
-            payload=availableAttributes,
+            config.get("mqttBaseTopic") + "/attribute/" + attribute,
+            payload=diagnostics[attribute],
         )
-        print(" --> Publishing response", availableAttributes)
+        print(" --> Publishing response " + attribute + " = " + diagnostics[attribute])
+
+
+def processGet(attribute, force=False):
+    # the diagnostics are not part of the state, they would defeat publishing only changes
+    if attribute in diagnosticAttributes:
+        publishDiagnostics([attribute])
+        return
+
+    mpd_status = fetchData()
+
+    # respond with all attributes, those which did not change since they were published only if forced
+    if attribute == "all":
+        for attribute in mpd_status:
+            publishedState.publish(attribute, mpd_status[attribute], force)
+        if config.get("mqttStateJson"):
+            stateDocument.publish(mpd_status, force)
+        if force:
+            publishDiagnostics(diagnosticAttributes)
 
     # all the other known attributes
     elif attribute in mpd_status:
-        client.publish(
-            config.get("mqttBaseTopic") + "/attribute/" + attribute,
-            payload=mpd_status[attribute],
-        )
-        print(" --> Publishing response " + attribute + " = " + mpd_status[attribute])
+        publishedState.publish(attribute, mpd_status[attribute], force)
 
     # we don't know this attribute
     else:
@@ -358,7 +796,11 @@ def readfile(filepath):
 
 def isServiceRunning(svc):
     cmd = ["/bin/systemctl", "status", svc]
-    status = subprocess.run(cmd, stdout=subprocess.PIPE).stdout.decode("utf-8").rstrip()
+    status = (
+        subprocess.run(cmd, stdout=subprocess.PIPE, timeout=config.get("collectorTimeout"))
+        .stdout.decode("utf-8")
+        .rstrip()
+    )
     if re.search("\n.*Active:.*running.*\n", status):
         return "true"
     else:
@@ -368,11 +810,13 @@ def isServiceRunning(svc):
 def linux_job_remaining(job_name):
     cmd = ["sudo", "atq", "-q", job_name]
     dtQueue = (
-        subprocess.run(cmd, stdout=subprocess.PIPE).stdout.decode("utf-8").rstrip()
+        subprocess.run(cmd, stdout=subprocess.PIPE, timeout=config.get("collectorTimeout"))
+        .stdout.decode("utf-8")
+        .rstrip()
     )
 
     regex = re.search(
-        "(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)", dtQueue
+        r"(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)", dtQueue
     )
     if regex:
         dtNow = datetime.datetime.now()
@@ -401,13 +845,13 @@ def getOsThrottling():
         19: "soft temperature limit has occurred",
     }
 
-    p = subprocess.Popen(
+    throttling = subprocess.run(
         ["vcgencmd", "get_throttled"],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         universal_newlines=True,
-    )
-    throttling, err = p.communicate()
+        timeout=config.get("collectorTimeout"),
+    ).stdout
     codeHex = throttling.rstrip().split("0x")[1]
 
     # code is zero => no issue
@@ -427,13 +871,13 @@ def getOsThrottling():
 
 
 def getOsTemperature():
-    p = subprocess.Popen(
+    temperature = subprocess.run(
         ["vcgencmd", "measure_temp"],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         universal_newlines=True,
-    )
-    temperature, err = p.communicate()
+        timeout=config.get("collectorTimeout"),
+    ).stdout
     temperature = temperature.rstrip().split("=")[1]
     return temperature
 
@@ -445,25 +889,17 @@ def normalizeTrueFalse(s):
         return "true"
 
 
-def regex(needle, hay, exception="-"):
-    regex_extract = re.search(needle, hay)
-    if regex_extract:
-        return regex_extract.group(1)
-    else:
-        return exception
-
-
 def getDuration(status):
     """ Find the duration of the track in the output from mpd status"""
 
     # try to get the duration value
-    duration = regex("\nduration: (.*)\n", status)
+    duration = status.get("duration")
 
-    if duration == "-":
+    if duration is None:
         # if the duration attribute is missing try to get the time
         # this attribute value is split into two parts by ":"
         # first is the elapsed time and the second part is the duration
-        duration = regex("\ntime: .*:(.*)\n", status, "0")
+        duration = status.get("time", "0").split(":")[-1]
 
     return int(float(duration))
 
@@ -479,32 +915,31 @@ def get_repeat_mode(repeat, status):
     if repeat == "false":
         return REPEAT_MODE_OFF
 
-    single = regex("\nsingle: (.*)\n", status)
+    single = status.get("single", "-")
     if single == "0":
         return REPEAT_MODE_PLAYLIST
 
     return REPEAT_MODE_SINGLE
 
 
-def fetchData():
-    # use global refreshInterval as this function is run as a thread through the paho-mqtt loop
-    global refreshInterval
+def collectPlayer():
+    """ Player state, read from MPD """
 
     result = {}
 
-    # fetch status from MPD
-    cmd = ["nc", "-w", "1", "localhost", "6600"]
-    input = "status\ncurrentsong\nclose".encode("utf-8")
-    status = subprocess.run(cmd, stdout=subprocess.PIPE, input=input).stdout.decode(
-        "utf-8"
-    )
+    # fetch status and current song from MPD in one round trip
+    try:
+        status, currentsong = mpd.command_list_dict("status", "currentsong")
+    except (OSError, MPDError) as e:
+        print(" --> Could not fetch status from MPD:", e)
+        status, currentsong = {}, {}
 
     # interpret status
-    result["state"] = regex("\nstate: (.*)\n", status).lower()
-    result["volume"] = regex("\nvolume: (.*)\n", status)
-    result["repeat"] = normalizeTrueFalse(regex("\nrepeat: (.*)\n", status))
+    result["state"] = status.get("state", "-").lower()
+    result["volume"] = status.get("volume", "-")
+    result["repeat"] = normalizeTrueFalse(status.get("repeat", "-"))
     result["repeat_mode"] = get_repeat_mode(result["repeat"], status)
-    result["random"] = normalizeTrueFalse(regex("\nrandom: (.*)\n", status))
+    result["random"] = normalizeTrueFalse(status.get("random", "-"))
 
     # interpret mute state based on volume
     if result["volume"] == "0":
@@ -515,18 +950,18 @@ def fetchData():
     # interpret metadata when in play/pause mode
     if result["state"] != "stop":
 
-        result["file"] = regex("\nfile: (.*)\n", status)
-        result["artist"] = regex("\nArtist: (.*)\n", status)
-        result["albumartist"] = regex("\nAlbumArtist: (.*)\n", status)
-        result["title"] = regex("\nTitle: (.*)\n", status)
-        result["album"] = regex("\nAlbum: (.*)\n", status)
-        result["track"] = regex("\nTrack: (.*)\n", status, "0")
-        result["trackdate"] = regex("\nDate: (.*)\n", status)
+        result["file"] = currentsong.get("file", "-")
+        result["artist"] = currentsong.get("Artist", "-")
+        result["albumartist"] = currentsong.get("AlbumArtist", "-")
+        result["title"] = currentsong.get("Title", "-")
+        result["album"] = currentsong.get("Album", "-")
+        result["track"] = currentsong.get("Track", "0")
+        result["trackdate"] = currentsong.get("Date", "-")
 
         if result["title"] == "-":
             result["title"] = result["file"]
 
-        elapsed = int(float(regex("\nelapsed: (.*)\n", status, "0")))
+        elapsed = int(float(status.get("elapsed", "0")))
         hours, remainder = divmod(elapsed, 3600)
         minutes, seconds = divmod(remainder, 60)
         result["elapsed"] = "{:02}:{:02}:{:02}".format(
@@ -540,48 +975,116 @@ def fetchData():
             int(hours), int(minutes), int(seconds)
         )
 
-    # fetch some more data from global.conf (via playout_controls.sh)
-    result["maxvolume"] = (
-        subprocess.run(
-            [path + "/playout_controls.sh", "-c=getmaxvolume"], stdout=subprocess.PIPE
-        )
-        .stdout.decode("utf-8")
-        .rstrip()
-    )
-    result["volstep"] = (
-        subprocess.run(
-            [path + "/playout_controls.sh", "-c=getvolstep"], stdout=subprocess.PIPE
-        )
-        .stdout.decode("utf-8")
-        .rstrip()
-    )
-    result["idletime"] = (
-        subprocess.run(
-            [path + "/playout_controls.sh", "-c=getidletime"], stdout=subprocess.PIPE
+    return result
+
+
+class Collector:
+    """ Fetches some attributes by calling function, at most every interval seconds
+
+    If the function fails or takes longer than timeout seconds, the values of the last run are kept.
+    """
+
+    def __init__(self, name, function, interval=0, timeout=None):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.timeout = timeout if timeout is not None else config.get("collectorTimeout")
+        self.values = {}
+        self.fetched = None  # monotonic time the last run started
+        self.duration = None  # seconds the last run took
+        self.future = None  # set while running
+
+    def __repr__(self):
+        return "<Collector {} interval={} timeout={}>".format(self.name, self.interval, self.timeout)
+
+    def isDue(self, now):
+        return self.fetched is None or now - self.fetched >= self.interval
+
+
+class Collectors:
+    """ Runs the due collectors concurrently and merges their values """
+
+    def __init__(self, collectors, maxWorkers=4):
+        self.collectors = collectors
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="collector")
+        self.lock = Lock()
+
+    def invalidate(self):
+        """ Run all collectors on the next collect, e.g. after a command changed the values """
+        with self.lock:
+            for collector in self.collectors:
+                collector.fetched = None
+
+    def run(self, collector):
+        started = time.monotonic()
+        try:
+            collector.values = collector.function()
+        except Exception as e:
+            print(" --> Collector " + collector.name + " failed:", repr(e))
+        finally:
+            collector.duration = time.monotonic() - started
+            with self.lock:
+                collector.fetched = started
+                collector.future = None
+
+    def collect(self):
+        now = time.monotonic()
+        running = []
+        with self.lock:
+            for collector in self.collectors:
+                # a collector still running for an earlier call is waited for, but not started twice
+                if collector.future is None and collector.isDue(now):
+                    collector.future = self.executor.submit(self.run, collector)
+                if collector.future is not None:
+                    running.append((collector, collector.future))
+
+        for collector, future in running:
+            try:
+                future.result(timeout=max(0, now + collector.timeout - time.monotonic()))
+            except concurrent.futures.TimeoutError:
+                print(" --> Collector " + collector.name + " timed out, keeping its last values")
+
+        result = {}
+        for collector in self.collectors:
+            result.update(collector.values)
+        return result
+
+    def durations(self):
+        """ How long the last run of each collector took """
+        return ", ".join(
+            "{}={:.0f}ms".format(collector.name, collector.duration * 1000)
+            for collector in self.collectors
+            if collector.duration is not None
         )
-        .stdout.decode("utf-8")
-        .rstrip()
-    )
 
-    # fetch last card
-    result["last_card"] = readfile(path + "/../settings/Latest_RFID")
 
-    # fetch service states
-    result["rfid"] = isServiceRunning("phoniebox-rfid-reader.service")
-    result["gpio"] = isServiceRunning("phoniebox-gpio-control.service")
+# slow-changing values are only fetched every interval seconds
+collectors = Collectors([
+    Collector("player", collectPlayer),
+    Collector("settings", lambda: settingsObserver.collect()),
+    Collector("rfid", lambda: {"rfid": isServiceRunning("phoniebox-rfid-reader.service")}, interval=60),
+    Collector("gpio", lambda: {"gpio": isServiceRunning("phoniebox-gpio-control.service")}, interval=60),
+    Collector("stopafter", lambda: {"remaining_stopafter": str(linux_job_remaining("s"))}, interval=30),
+    Collector("shutdownafter", lambda: {"remaining_shutdownafter": str(linux_job_remaining("t"))}, interval=30),
+    Collector(
+        "shutdownvolumereduction",
+        lambda: {"remaining_shutdownvolumereduction": str(linux_job_remaining("q"))},
+        interval=30,
+    ),
+    Collector("idle", lambda: {"remaining_idle": str(linux_job_remaining("i"))}, interval=30),
+    Collector("throttling", lambda: {"throttling": getOsThrottling()}, interval=60),
+    Collector("temperature", lambda: {"temperature": getOsTemperature()}, interval=30),
+])
+
 
-    # fetch linux jobs
-    result["remaining_stopafter"] = str(linux_job_remaining("s"))
-    result["remaining_shutdownafter"] = str(linux_job_remaining("t"))
-    result["remaining_shutdownvolumereduction"] = str(linux_job_remaining("q"))
-    result["remaining_idle"] = str(linux_job_remaining("i"))
+def fetchData():
+    # use global refreshInterval as this function is run as a thread through the paho-mqtt loop
+    global refreshInterval
 
-    # fetch OS information
-    result["throttling"] = getOsThrottling()
-    result["temperature"] = getOsTemperature()
+    result = collectors.collect()
 
     # modify refresh rate depending on play state
-    if result["state"] == "play":
+    if result.get("state") == "play":
         refreshInterval = config.get("refreshIntervalPlaying")
     else:
         refreshInterval = config.get("refreshIntervalIdle")
@@ -589,65 +1092,91 @@ def fetchData():
     return result
 
 
-# create client instance
-client = mqtt.Client(callback_api_version=mqtt_enum.CallbackAPIVersion.VERSION1, client_id=config.get("mqttClientId"))
+def fetchDiagnostics():
+    return {
+        "collector_durations": collectors.durations(),
+        "published_messages": str(publishedState.sent),
+        "suppressed_messages": str(publishedState.suppressed),
+        "mqtt_reconnects": str(client.reconnects),
+        "mqtt_downtime": str(round(client.getDowntime())),
+    }
 
-# configure authentication
-if config.get("mqttUsername") and config.get("mqttPassword"):
-    client.username_pw_set(
-        username=config.get("mqttUsername"), password=config.get("mqttPassword")
-    )
 
-if config.get("mqttCert") and config.get("mqttKey"):
-    if config.get("mqttCA"):
-        client.tls_set(
-            ca_certs=config.get("mqttCA"),
-            certfile=config.get("mqttCert"),
-            keyfile=config.get("mqttKey"),
+def main():
+    global client
+
+    # create client instance
+    mqttClient = mqtt.Client(callback_api_version=mqtt_enum.CallbackAPIVersion.VERSION1, client_id=config.get("mqttClientId"))
+
+    # configure authentication
+    if config.get("mqttUsername") and config.get("mqttPassword"):
+        mqttClient.username_pw_set(
+            username=config.get("mqttUsername"), password=config.get("mqttPassword")
         )
-    else:
-        client.tls_set(certfile=config.get("mqttCert"), keyfile=config.get("mqttKey"))
-elif config.get("mqttCA"):
-    client.tls_set(ca_certs=config.get("mqttCA"))
-
-# attach event handlers
-client.on_connect = on_connect
-client.on_disconnect = on_disconnect
-client.on_message = on_message
-if config.get("DEBUG") is True:
-    client.on_log = on_log
-
-# define last will
-client.will_set(
-    config.get("mqttBaseTopic") + "/state", payload="offline", qos=1, retain=True
-)
-
-# connect to MQTT server
-print(
-    "Connecting to "
-    + config.get("mqttHostname")
-    + " on port "
-    + str(config.get("mqttPort"))
-)
-client.connect(
-    config.get("mqttHostname"),
-    config.get("mqttPort"),
-    config.get("mqttConnectionTimeout"),
-)
-
-# subscribe to topics
-print("Subscribing to " + config.get("mqttBaseTopic") + "/cmd/#")
-client.subscribe(config.get("mqttBaseTopic") + "/cmd/#")
-print("Subscribing to " + config.get("mqttBaseTopic") + "/get/#")
-client.subscribe(config.get("mqttBaseTopic") + "/get/#")
-
-# register thread for watchForNewCard
-tWatchForNewCard = Thread(target=watchForNewCard)
-tWatchForNewCard.setDaemon(True)
-tWatchForNewCard.start()
-
-# start endless loop
-client.loop_start()
-while True:
-    processGet("all")
-    time.sleep(refreshInterval)
+
+    if config.get("mqttCert") and config.get("mqttKey"):
+        if config.get("mqttCA"):
+            mqttClient.tls_set(
+                ca_certs=config.get("mqttCA"),
+                certfile=config.get("mqttCert"),
+                keyfile=config.get("mqttKey"),
+            )
+        else:
+            mqttClient.tls_set(certfile=config.get("mqttCert"), keyfile=config.get("mqttKey"))
+    elif config.get("mqttCA"):
+        mqttClient.tls_set(ca_certs=config.get("mqttCA"))
+
+    # attach event handlers
+    mqttClient.on_connect = on_connect
+    mqttClient.on_connect_fail = on_connect_fail
+    mqttClient.on_disconnect = on_disconnect
+    mqttClient.on_message = on_message
+    if config.get("DEBUG") is True:
+        mqttClient.on_log = on_log
+
+    # define last will
+    mqttClient.will_set(
+        config.get("mqttBaseTopic") + "/state", payload="offline", qos=1, retain=True
+    )
+
+    # messages are published through client, held back while disconnected
+    client = ReconnectingClient(
+        mqttClient,
+        config.get("mqttOfflineQueueSize"),
+        config.get("mqttReconnectDelayMin"),
+        config.get("mqttReconnectDelayMax"),
+    )
+    mqttClient.user_data_set(client)
+
+    # connect to MQTT server
+    print(
+        "Connecting to "
+        + config.get("mqttHostname")
+        + " on port "
+        + str(config.get("mqttPort"))
+    )
+    mqttClient.connect_async(
+        config.get("mqttHostname"),
+        config.get("mqttPort"),
+        config.get("mqttConnectionTimeout"),
+    )
+
+    # publish swiped cards and changed settings right away
+    settingsObserver.subscribe(onSettingChanged)
+    settingsObserver.start()
+
+    # start endless loop, which (re)connects in the background
+    mqttClient.loop_start()
+
+    # publish changes of MPD right away, the refresh interval is left for the elapsed time and the other attributes
+    mpdState = MPDStateService()
+    mpdState.subscribe(lambda state, changed: processGet("all"))
+    mpdState.start()
+
+    while True:
+        processGet("all")
+        time.sleep(refreshInterval)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,12 +17,17 @@
 
 # import string
 # import csv
+import logging
 import os.path
 import sys
 
 from evdev import InputDevice, ecodes, list_devices
 from select import select
 
+from input_hotplug import InputDeviceManager
+
+logger = logging.getLogger(__name__)
+
 
 def get_devices():
     return [InputDevice(fn) for fn in list_devices()]
@@ -38,24 +43,26 @@ class Reader:
         else:
             with open(path + '/deviceName.txt', 'r') as f:
                 deviceName = f.read()
-            devices = get_devices()
-            for device in devices:
-                if device.name == deviceName:
-                    self.dev = device
-                    break
-            try:
-                self.dev
-            except Exception:
-                sys.exit('Could not find the device %s\n. Make sure is connected' % deviceName)
+            # re-attaches the reader, if it is unplugged and plugged in again
+            self.device_manager = InputDeviceManager(deviceName, get_devices=get_devices)
+            self.dev = self.device_manager.find()
+            if self.dev is None:
+                logger.warning('Could not find the device {}, waiting for it to be connected'.format(deviceName.rstrip()))
+                self.dev = self.device_manager.wait_for_device()
 
     def readCard(self):
         stri = ''
         key = ''
         while key != 'KEY_ENTER':
-            r, w, x = select([self.dev], [], [])
-            for event in self.dev.read():
-                if event.type == 1 and event.value == 1:
-                    stri += self.keys[event.code]
-                    # print( keys[ event.code ] )
-                    key = ecodes.KEY[event.code]
+            try:
+                r, w, x = select([self.dev], [], [])
+                for event in self.dev.read():
+                    if event.type == 1 and event.value == 1:
+                        stri += self.keys[event.code]
+                        # print( keys[ event.code ] )
+                        key = ecodes.KEY[event.code]
+            except OSError:
+                # the reader is gone, drop the partial card id and wait for the reader to come back
+                self.dev = self.device_manager.reattach(self.dev)
+                stri = ''
         return stri[:-1]
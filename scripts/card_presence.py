@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Card presence tracking for the PLACENOTSWIPE mode.
+# The readers only report the cards they see, so a card counts as removed once
+# it has not been seen for the removal grace period. This debounces single
+# missed reads. Placing the same card again within the re-place window just
+# resumes the player instead of triggering the card again.
+
+import logging
+import os
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+# defaults in milliseconds, can be overridden in the settings folder
+REMOVAL_GRACE_MS = 1000
+REPLACE_WINDOW_MS = 0
+
+
+class CardPresence(Enum):
+    ABSENT = 0
+    PRESENT = 1
+    REMOVED = 2
+
+
+def read_ms_setting(filepath, default):
+    if not os.path.isfile(filepath):
+        return default
+    try:
+        with open(filepath, 'r') as f:
+            return int(f.readline().strip())
+    except ValueError:
+        logger.error('Invalid value in {}, using {} ms'.format(filepath, default))
+        return default
+
+
+class PresenceTracker:
+    """State machine ABSENT -> PRESENT -> REMOVED -> (PRESENT | ABSENT)
+
+    on_placed(cardid) is called for a newly placed card, on_removed(cardid) once the
+    card is gone for removal_grace seconds and on_replaced(cardid) if the same card is
+    placed again within replace_window seconds after its removal.
+    """
+
+    def __init__(self, loop, on_placed, on_removed, on_replaced, removal_grace=REMOVAL_GRACE_MS / 1000.0,
+                 replace_window=REPLACE_WINDOW_MS / 1000.0):
+        self.loop = loop
+        self.on_placed = on_placed
+        self.on_removed = on_removed
+        self.on_replaced = on_replaced
+        self.removal_grace = removal_grace
+        self.replace_window = replace_window
+        self.state = CardPresence.ABSENT
+        self.cardid = None
+        self._timer = None
+
+    def __repr__(self):
+        return '<PresenceTracker {} cardid={}>'.format(self.state.name, self.cardid)
+
+    @classmethod
+    def from_settings(cls, settings_path, loop, on_placed, on_removed, on_replaced):
+        removal_grace = read_ms_setting(os.path.join(settings_path, 'Place_Removal_Grace_Ms'), REMOVAL_GRACE_MS)
+        replace_window = read_ms_setting(os.path.join(settings_path, 'Place_Replace_Window_Ms'), REPLACE_WINDOW_MS)
+        return cls(loop, on_placed, on_removed, on_replaced, removal_grace / 1000.0, replace_window / 1000.0)
+
+    def _start_timer(self, delay, callback):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.loop.call_later(delay, callback)
+
+    def seen(self, cardid):
+        """Feed every card read into the tracker"""
+        previous_state, previous_cardid = self.state, self.cardid
+        self.state = CardPresence.PRESENT
+        self.cardid = cardid
+        self._start_timer(self.removal_grace, self._removed)
+
+        if previous_state == CardPresence.PRESENT and previous_cardid == cardid:
+            return
+        if previous_state == CardPresence.REMOVED and previous_cardid == cardid:
+            logger.debug('Card {} placed again'.format(cardid))
+            self.on_replaced(cardid)
+        else:
+            logger.debug('Card {} placed'.format(cardid))
+            self.on_placed(cardid)
+
+    def _removed(self):
+        logger.debug('Card {} removed'.format(self.cardid))
+        if self.replace_window > 0:
+            self.state = CardPresence.REMOVED
+            self._start_timer(self.replace_window, self._absent)
+        else:
+            self.state = CardPresence.ABSENT
+            self._timer = None
+        self.on_removed(self.cardid)
+
+    def _absent(self):
+        self.state = CardPresence.ABSENT
+        self._timer = None
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# Runs the commands of the GPIO and MQTT daemons in the background.
+# The callbacks and the MQTT network loop only enqueue, one worker thread per
+# command class runs the shell commands of its class one after another and
+# kills them with their children after the timeout of the class. Repetitions
+# like the steps of a rotary encoder or a burst of volumeup messages are
+# merged into one command by the CommandCoalescer.
+
+import logging
+import math
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# seconds a command of a class may run, before it is killed together with its children
+DEFAULT_TIMEOUTS = {'volume': 5, 'player': 30, 'system': 60}
+
+# commands of one class run one after another, the classes in parallel, commands not listed here are of class 'player'
+COMMAND_CLASSES = {
+    'volumeup': 'volume',
+    'volumedown': 'volume',
+    'mute': 'volume',
+    'setvolume': 'volume',
+    'setvolstep': 'volume',
+    'setmaxvolume': 'volume',
+    'scan': 'system',
+    'shutdown': 'system',
+    'shutdownsilent': 'system',
+    'reboot': 'system',
+    'disablewifi': 'system',
+    'togglewifi': 'system',
+    'bluetoothtoggle': 'system',
+    'recordstart': 'system',
+    'recordstop': 'system',
+    'setidletime': 'system',
+    'shutdownafter': 'system',
+    'shutdownvolumereduction': 'system',
+    'playerstopafter': 'system',
+    'rfid': 'system',
+    'gpio': 'system',
+}
+
+# the values of these commands are summed up, when they are called in a quick succession, with their format
+SUMMED_COMMANDS = {
+    'volumeup': '{}',
+    'volumedown': '{}',
+    'playerseek': '{:+d}',
+}
+
+# only the last value of these commands called in a quick succession is set
+REPLACED_COMMANDS = ('setvolume', 'setvolstep', 'setmaxvolume', 'setidletime')
+
+
+def class_of(command):
+    return COMMAND_CLASSES.get(command, 'player')
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100.0 * len(ordered)) - 1)]
+
+
+class CommandMetrics:
+    """Counters and the latest latencies of the commands of one class"""
+
+    def __init__(self, history=100):
+        self.executed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.dropped = 0
+        # seconds, from submitting until the command was started and from starting until it ended
+        self.waits = deque(maxlen=history)
+        self.durations = deque(maxlen=history)
+
+    def __repr__(self):
+        return '<CommandMetrics executed={} failed={} timeouts={} dropped={}>'.format(
+            self.executed, self.failed, self.timeouts, self.dropped)
+
+    def record(self, wait, duration, returncode):
+        self.executed += 1
+        if returncode != 0:
+            self.failed += 1
+        self.waits.append(wait)
+        self.durations.append(duration)
+
+    def summary(self):
+        result = {'executed': self.executed, 'failed': self.failed, 'timeouts': self.timeouts,
+                  'dropped': self.dropped}
+        for name, values in (('wait', self.waits), ('duration', self.durations)):
+            if values:
+                result[name + '_ms_p50'] = round(percentile(values, 50) * 1000, 1)
+                result[name + '_ms_p95'] = round(percentile(values, 95) * 1000, 1)
+        return result
+
+
+class CommandExecutor:
+    """Runs shell commands on one worker thread per command class, so the GPIO callbacks only enqueue
+
+    Commands of one class run one after another in the order they were submitted, e.g. two volumeup never
+    race on the volume. Every child is waited for and killed together with its children after the timeout
+    of its class. At most max_queued commands wait, further ones are dropped.
+    """
+
+    def __init__(self, max_queued=32, timeouts=None, history=100):
+        self.max_queued = max_queued
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.history = history
+        self.metrics = {}
+        self._queues = {}
+        self._workers = {}
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '<CommandExecutor queued={} running={}>'.format(self.queued(), self._running)
+
+    def queued(self):
+        return sum(len(commands) for commands in self._queues.values())
+
+    def _metrics(self, command_class):
+        if command_class not in self.metrics:
+            self.metrics[command_class] = CommandMetrics(self.history)
+        return self.metrics[command_class]
+
+    def submit(self, command_class, command, done=None):
+        """Run command, a shell command line or a function without arguments, on the worker of its class
+
+        done(returncode) is called on the worker after the command ended.
+        """
+        with self._condition:
+            if self.queued() >= self.max_queued:
+                self._metrics(command_class).dropped += 1
+                logger.warning('Too many commands waiting, dropping {}'.format(command))
+                return False
+
+            self._queues.setdefault(command_class, deque()).append((command, done, time.monotonic()))
+            if command_class not in self._workers:
+                self._workers[command_class] = threading.Thread(
+                    target=self._work, args=(command_class,), name='CommandExecutor-' + command_class, daemon=True)
+                self._workers[command_class].start()
+            self._condition.notify_all()
+        return True
+
+    def _work(self, command_class):
+        commands = self._queues[command_class]
+        while True:
+            with self._condition:
+                while not commands:
+                    self._condition.wait()
+                command, done, submitted = commands.popleft()
+                self._running += 1
+            try:
+                self._run(command_class, command, done, submitted)
+            except Exception:
+                logger.exception('Running {} failed'.format(command))
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._condition.notify_all()
+
+    def _run(self, command_class, command, done, submitted):
+        started = time.monotonic()
+        if callable(command):
+            try:
+                command()
+                returncode = 0
+            except Exception:
+                logger.exception('Running {} failed'.format(command))
+                returncode = 1
+        else:
+            returncode = self.run_shell(command_class, command)
+
+        ended = time.monotonic()
+        with self._condition:
+            self._metrics(command_class).record(started - submitted, ended - started, returncode)
+        logger.debug('{}: waited {:.1f} ms, ran {:.1f} ms, returned {}'.format(
+            command, (started - submitted) * 1000, (ended - started) * 1000, returncode))
+        if done is not None:
+            done(returncode)
+
+    def run_shell(self, command_class, command):
+        """Run command in a shell and return its returncode, killing it after the timeout of its class"""
+        timeout = self.timeouts.get(command_class)
+        # a session of its own, so the children of the shell are killed along with it
+        process = subprocess.Popen(command, shell=True, start_new_session=True)
+        try:
+            return process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning('Killing {} after {} seconds'.format(command, timeout))
+            os.killpg(process.pid, signal.SIGKILL)
+            with self._condition:
+                self._metrics(command_class).timeouts += 1
+            return process.wait()
+
+    def wait_idle(self, timeout=None):
+        """Wait until all submitted commands ran, returns False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self.queued() and not self._running, timeout)
+
+    def stats(self):
+        with self._condition:
+            return {command_class: metrics.summary() for command_class, metrics in self.metrics.items()}
+
+
+class CommandCoalescer:
+    """Merges commands of the same kind arriving within window seconds into one
+
+    e.g. turning the rotary encoder by 7 steps runs volumeup -v=7 once instead of 7 times. A value added with
+    replace, like setvolume or a seek to an absolute position, replaces the pending value instead, a value added
+    without replace is only summed up with one added without replace, too. A command of another kind first
+    submits the pending one of its class, so the order is kept.
+    """
+
+    def __init__(self, submit, window=0.1):
+        # submit(command_class, kind, value) is called with the sum of the merged values or the replacing value
+        self.submit = submit
+        self.window = window
+        self.merged = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<CommandCoalescer window={} pending={} merged={}>'.format(self.window, len(self._pending), self.merged)
+
+    def add(self, command_class, kind, value, replace=False):
+        with self._lock:
+            pending = self._pending.get(command_class)
+            if pending is not None and pending[0] == kind and (replace or not pending[2]):
+                if replace:
+                    pending[1] = value
+                    pending[2] = True
+                else:
+                    pending[1] += value
+                self.merged += 1
+                return
+            self._flush(command_class)
+            pending = [kind, value, replace, None]
+            pending[3] = threading.Timer(self.window, self._expire, (command_class, pending))
+            pending[3].daemon = True
+            self._pending[command_class] = pending
+            pending[3].start()
+
+    def _expire(self, command_class, pending):
+        with self._lock:
+            # the timer may fire late, after its command was submitted already
+            if self._pending.get(command_class) is pending:
+                self._flush(command_class)
+
+    def _flush(self, command_class):
+        pending = self._pending.pop(command_class, None)
+        if pending is not None:
+            pending[3].cancel()
+            self.submit(command_class, pending[0], pending[1])
+
+    def flush(self, command_class=None):
+        """Submit the pending command of a class or of all classes now"""
+        with self._lock:
+            for pending_class in ([command_class] if command_class is not None else list(self._pending)):
+                self._flush(pending_class)
@@ -3,109 +3,154 @@
 import logging
 import os
 import subprocess
+import threading
 import time
-import re
-import signal
 
-from Reader import Reader
+from card_presence import PresenceTracker
+from event_loop import EventLoop
+from mpd_client import MPDConnection, MPDError, MPDNotSentError
+from rfid_trigger import CardTrigger, create_card_trigger
+from swipe_guard import SwipeGuard
 
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-ch.setFormatter(formatter)
-logger.addHandler(ch)
-
-reader = Reader()
-
-# get absolute path of this script
-dir_path = os.path.dirname(os.path.realpath(__file__))
-logger.info('Dir_PATH: {dir_path}'.format(dir_path=dir_path))
-
-# get control card ids
-file_path = os.path.dirname(__file__)
-if file_path != "":
-    os.chdir(file_path)
-
-# vars for ensuring delay between same-card-swipes
-ssp = open('../settings/Second_Swipe_Pause', 'r')
-same_id_delay = ssp.read().strip()
-sspc = open('../settings/Second_Swipe_Pause_Controls', 'r')
-sspc_nodelay = sspc.readline().strip()
-previous_id = ""
-previous_time = time.monotonic()
-
-# get swipe or place configuration value
-sop = open('../settings/Swipe_or_Place', 'r')
-swipe_or_place = sop.read().strip()
-
-# create array for control card ids
-cards = []
-
-# open file and read the content in a list
-with open('../settings/global.conf', 'r') as filehandle:
-    filecontents = filehandle.readlines()
-
-    for line in filecontents:
-        cids = line[:-1]
-        cards.append(cids)
-
-
-extract = [s for s in cards if s.startswith('CMD')]
-string = ''.join(extract)
-
-# if controlcards delay is deactivated, let the cards pass, otherwise, they have to wait...
-if sspc_nodelay == "ON":
-    ids = re.findall("(\d+)", string) # noqa W605
-else:
-    ids = ""
-
-
-# handler for RFID reading no cardid
-def handler(signum, frame):
-    logger.info('No RFID Signal detected.')
-    try:
-        # force pause the player script
-        logger.info('Trigger Pause Force')
-        subprocess.call([dir_path + '/playout_controls.sh -c=playerpauseforce -v=0.1'], shell=True)
-    except OSError:
-        logger.info('Execution of Pause failed.')
-
-
-# associate the handler to signal alarm
-signal.signal(signal.SIGALRM, handler)
-
-while True:
-    # slow down the card reading while loop
-    time.sleep(0.2)
-
-    if swipe_or_place == "PLACENOTSWIPE":
-        # enable the signal alarm (if no card is present for 1 second)
-        signal.alarm(1)
-
-    # reading the card id
-    cardid = reader.readCard()
-
-    # disable the alarm after a successful read
-    signal.alarm(0)
-
-    try:
-        # start the player script and pass on the cardid (but only if new card or otherwise
-        # "same_id_delay" seconds have passed)
-        if cardid is not None:
-            if cardid != previous_id or (time.monotonic() - previous_time) >= float(same_id_delay) or cardid in str(ids):
-                logger.info('Trigger Play Cardid={cardid}'.format(cardid=cardid))
-                subprocess.call([dir_path + '/rfid_trigger_play.sh --cardid=' + cardid], shell=True)
-                previous_id = cardid
-
-            else:
-                logger.debug('Ignoring Card id {cardid} due to same-card-delay, delay: {same_id_delay}'.format(
-                    cardid=cardid,
-                    same_id_delay=same_id_delay
-                ))
-
-            previous_time = time.monotonic()
-
-    except OSError as e:
-        logger.error('Execution failed: {e}'.format(e=e))
+
+# seconds from one read to the next, so a card lying on a polled reader is not read over and over in a tight loop
+MIN_READ_INTERVAL = 0.2
+
+
+def read_setting(settings_path, name):
+    with open(os.path.join(settings_path, name), 'r') as f:
+        return f.readline().strip()
+
+
+class RfidDaemon:
+
+    def __init__(self, reader, dir_path, card_trigger=None, loop=None, min_read_interval=MIN_READ_INTERVAL):
+        self.reader = reader
+        self.min_read_interval = min_read_interval
+        self.dir_path = dir_path
+        self.card_trigger = card_trigger
+        self.loop = loop if loop is not None else EventLoop()
+        self.mpd = card_trigger.mpd if card_trigger is not None else MPDConnection()
+        settings_path = os.path.join(dir_path, '..', 'settings')
+
+        # ensures the delay between same-card-swipes, classifying the cards like the trigger does
+        self.swipe_guard = SwipeGuard.from_settings(
+            settings_path, card_trigger if card_trigger is not None else CardTrigger(dir_path, self.mpd))
+
+        # get swipe or place configuration value
+        self.swipe_or_place = read_setting(settings_path, 'Swipe_or_Place')
+        self.presence = PresenceTracker.from_settings(settings_path, self.loop, self.handle_card, self.pause_player,
+                                                      self.resume_player)
+
+    # handler for a removed card
+    def pause_player(self, cardid):
+        logger.info('No RFID Signal detected.')
+        try:
+            # Only pause when currently playing, like playout_controls.sh -c=playerpauseforce
+            logger.info('Trigger Pause Force')
+            if self.mpd.status().get('state') == 'play':
+                self.mpd.execute('pause', 1)
+        except (OSError, MPDError) as e:
+            logger.error('Pause via MPD failed, falling back to playout_controls.sh: {e}'.format(e=e))
+            subprocess.call([self.dir_path + '/playout_controls.sh -c=playerpauseforce -v=0.1'], shell=True)
+
+    # handler for a card placed again within the re-place window
+    def resume_player(self, cardid):
+        logger.info('Card {cardid} placed again, resume player'.format(cardid=cardid))
+        try:
+            if self.mpd.status().get('state') == 'pause':
+                self.mpd.execute('pause', 0)
+        except (OSError, MPDError) as e:
+            logger.error('Resume via MPD failed, falling back to playout_controls.sh: {e}'.format(e=e))
+            subprocess.call([self.dir_path + '/playout_controls.sh -c=playerplay'], shell=True)
+
+    def trigger_card(self, cardid):
+        if self.card_trigger is not None:
+            try:
+                if self.card_trigger.trigger(cardid):
+                    return
+            except MPDNotSentError as e:
+                logger.error('In-process trigger failed, falling back to rfid_trigger_play.sh: {e}'.format(e=e))
+            except Exception as e:
+                # MPD may have received a command already, the script would repeat it, e.g. skip another track
+                logger.error('In-process trigger of card {cardid} failed: {e}'.format(cardid=cardid, e=e))
+                return
+        subprocess.call([self.dir_path + '/rfid_trigger_play.sh --cardid=' + cardid], shell=True)
+
+    def handle_card(self, cardid):
+        try:
+            # start the player script and pass on the cardid (but only if new card or otherwise
+            # the cooldown of the card has passed)
+            if cardid is not None:
+                if self.swipe_guard.allow(cardid):
+                    logger.info('Trigger Play Cardid={cardid}'.format(cardid=cardid))
+                    self.trigger_card(cardid)
+
+                else:
+                    logger.debug('Ignoring Card id {cardid} due to same-card-delay, cooldowns: {cooldowns}'.format(
+                        cardid=cardid,
+                        cooldowns=self.swipe_guard.cooldowns
+                    ))
+
+        except OSError as e:
+            logger.error('Execution failed: {e}'.format(e=e))
+
+    def on_card(self, cardid):
+        if self.swipe_or_place == "PLACENOTSWIPE":
+            # the tracker calls handle_card only for newly placed cards
+            if cardid:
+                self.presence.seen(cardid)
+        else:
+            self.handle_card(cardid)
+
+    def read_cards(self):
+        # runs in its own thread, so the reader only blocks itself and the card is handed to the loop right away
+        try:
+            while True:
+                started = time.monotonic()
+                cardid = self.reader.readCard()
+                self.loop.call_soon_threadsafe(self.on_card, cardid)
+                # readers blocking until a card is swiped wait long enough, the others return right away
+                remaining = started + self.min_read_interval - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+        except Exception as e:
+            self.loop.call_soon_threadsafe(self.reader_failed, e)
+
+    def reader_failed(self, e):
+        logger.error('Reading the card failed: {e}'.format(e=e))
+        raise e
+
+    def start(self):
+        threading.Thread(target=self.read_cards, name='Reader', daemon=True).start()
+
+    def run(self):
+        self.start()
+        self.loop.run()
+
+
+def main():
+    from Reader import Reader
+
+    logger.setLevel(logging.DEBUG)
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+    reader = Reader()
+
+    # get absolute path of this script
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    logger.info('Dir_PATH: {dir_path}'.format(dir_path=dir_path))
+
+    # resolve cards in-process, rfid_trigger_play.sh remains the fallback
+    card_trigger = create_card_trigger(dir_path)
+
+    RfidDaemon(reader, dir_path, card_trigger).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Single threaded event loop for the daemons.
+# Other threads (e.g. the one blocking in Reader.readCard()) hand their events
+# to the loop with call_soon_threadsafe(). Timers use the monotonic clock and
+# fire with sub-second resolution, so no fixed sleeps or SIGALRM are needed.
+
+import heapq
+import logging
+import queue
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop:
+
+    def __init__(self):
+        self._events = queue.Queue()
+        self._timers = []
+        self._running = False
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Run callback(*args) in the loop, may be called from any thread"""
+        self._events.put((callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) after delay seconds, must be called from within the loop"""
+        timer = Timer(time.monotonic() + delay, callback, args)
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def stop(self):
+        self.call_soon_threadsafe(self._stop)
+
+    def _stop(self):
+        self._running = False
+
+    def _next_timeout(self):
+        while self._timers and self._timers[0].cancelled:
+            heapq.heappop(self._timers)
+        if not self._timers:
+            return None
+        return max(0, self._timers[0].deadline - time.monotonic())
+
+    def run_once(self):
+        """Wait for the next event or timer and run the callbacks which are due"""
+        try:
+            callback, args = self._events.get(timeout=self._next_timeout())
+        except queue.Empty:
+            pass
+        else:
+            callback(*args)
+
+        now = time.monotonic()
+        while self._timers and self._timers[0].deadline <= now:
+            timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self.run_once()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Keeps track of an USB reader which shows up as input device.
+# If the reader is unplugged or re-enumerated, the kernel uevents from the
+# netlink socket tell when an input device is added again, so the reader can
+# be re-attached by name and phys without restarting the daemon.
+
+import logging
+import socket
+import time
+from collections import deque
+from select import select
+
+logger = logging.getLogger(__name__)
+
+NETLINK_KOBJECT_UEVENT = 15
+KERNEL_EVENTS = 1
+# seconds between rescans of /dev/input, in case an uevent is missed
+RESCAN_INTERVAL = 1.0
+
+
+def list_input_devices():
+    from evdev import InputDevice, list_devices
+    return [InputDevice(fn) for fn in list_devices()]
+
+
+def parse_uevent(data):
+    """Parse a kernel uevent like b'add@/devices/...\\0ACTION=add\\0SUBSYSTEM=input\\0...' into a dict"""
+    event = {}
+    for field in data.split(b'\0')[1:]:
+        key, _, value = field.decode('utf-8', errors='replace').partition('=')
+        if key:
+            event[key] = value
+    return event
+
+
+class UeventMonitor:
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        # port id 0 lets the kernel assign one
+        self.sock.bind((0, KERNEL_EVENTS))
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def receive(self):
+        return parse_uevent(self.sock.recv(8192))
+
+    def close(self):
+        self.sock.close()
+
+
+def is_input_device_added(event):
+    return event.get('ACTION') == 'add' and event.get('SUBSYSTEM') == 'input' \
+        and event.get('DEVNAME', '').startswith('input/event')
+
+
+class InputDeviceManager:
+
+    def __init__(self, name, phys=None, accept=None, get_devices=list_input_devices, monitor_factory=UeventMonitor,
+                 rescan_interval=RESCAN_INTERVAL, clock=time.monotonic):
+        self.name = name
+        self.phys = phys
+        self.accept = accept if accept is not None else (lambda device: True)
+        self.get_devices = get_devices
+        self.monitor_factory = monitor_factory
+        self.rescan_interval = rescan_interval
+        self.clock = clock
+        # seconds from losing the reader until it was attached again
+        self.reconnect_latencies = deque(maxlen=100)
+
+    def __repr__(self):
+        return '<InputDeviceManager {} phys={} reconnects={}>'.format(self.name, self.phys,
+                                                                     len(self.reconnect_latencies))
+
+    def find(self):
+        """Return the reader or None, a device on the same phys (USB port) is preferred"""
+        candidates = [device for device in self.get_devices() if device.name == self.name and self.accept(device)]
+        found = None
+        for device in candidates:
+            if found is None or (device.phys == self.phys and found.phys != self.phys):
+                found = device
+        for device in candidates:
+            if device is not found:
+                device.close()
+        if found is not None:
+            self.phys = found.phys
+        return found
+
+    def _open_monitor(self):
+        try:
+            return self.monitor_factory()
+        except OSError as e:
+            logger.warning('Could not listen for uevents, rescanning only: {}'.format(e))
+            return None
+
+    def wait_for_device(self):
+        """Block until the reader is connected and return it"""
+        # listen before the first scan, so a device added in between is not missed
+        monitor = self._open_monitor()
+        try:
+            while True:
+                device = self.find()
+                if device is not None:
+                    return device
+                if monitor is None:
+                    time.sleep(self.rescan_interval)
+                    continue
+                # wait for an input device to be added, but rescan from time to time anyway
+                while select([monitor], [], [], self.rescan_interval)[0]:
+                    if is_input_device_added(monitor.receive()):
+                        break
+        finally:
+            if monitor is not None:
+                monitor.close()
+
+    def reattach(self, device):
+        """Replace the lost device with the reconnected reader"""
+        lost = self.clock()
+        logger.warning('Lost the reader {}, waiting for it to be reconnected'.format(self.name))
+        try:
+            device.close()
+        except OSError:
+            pass
+        device = self.wait_for_device()
+        latency = self.clock() - lost
+        self.reconnect_latencies.append(latency)
+        logger.info('Reader {} reconnected on {} after {:.0f} ms'.format(self.name, device.phys, latency * 1000))
+        return device
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Tag detection strategies for the MFRC522 reader.
+# IRQ: the reader raises the IRQ line when a tag enters the field, see
+#      pirc522.RFID.wait_for_tag(). Requires the IRQ pin to be wired.
+# POLL: without IRQ the reader is asked for a tag periodically. The poll
+#      interval grows while no card is seen, to keep the idle CPU and SPI
+#      traffic low, and drops back to the minimum as soon as a card is read.
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+IRQ = 'IRQ'
+POLL = 'POLL'
+
+# poll intervals in seconds
+MIN_POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+# seconds after the last read until the poll interval starts to grow
+IDLE_AFTER = 10.0
+BACKOFF_FACTOR = 1.5
+
+
+class DetectionStats:
+
+    def __init__(self):
+        self.polls = 0
+        self.reads = 0
+        # seconds spent talking to the reader and waiting for a tag
+        self.busy_time = 0.0
+        self.idle_time = 0.0
+
+    def __repr__(self):
+        return '<DetectionStats polls={} reads={} busy_time={:.3f}s idle_time={:.3f}s>'.format(
+            self.polls, self.reads, self.busy_time, self.idle_time)
+
+
+class IrqDetector:
+
+    def __init__(self, device, read_function, clock=time.monotonic):
+        self.device = device
+        self.read_function = read_function
+        self.clock = clock
+        self.stats = DetectionStats()
+
+    def readCard(self):
+        started = self.clock()
+        self.device.wait_for_tag()
+        woken = self.clock()
+        card_id = self.read_function()
+        self.stats.polls += 1
+        self.stats.idle_time += woken - started
+        self.stats.busy_time += self.clock() - woken
+        if card_id:
+            self.stats.reads += 1
+        return card_id
+
+
+class PollingDetector:
+
+    def __init__(self, read_function, min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL,
+                 idle_after=IDLE_AFTER, backoff_factor=BACKOFF_FACTOR, clock=time.monotonic, sleep=time.sleep):
+        self.read_function = read_function
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_after = idle_after
+        self.backoff_factor = backoff_factor
+        self.clock = clock
+        self.sleep = sleep
+        self.interval = min_interval
+        self.last_read = clock()
+        self.stats = DetectionStats()
+
+    def readCard(self):
+        while True:
+            started = self.clock()
+            card_id = self.read_function()
+            now = self.clock()
+            self.stats.polls += 1
+            self.stats.busy_time += now - started
+            if card_id:
+                self.stats.reads += 1
+                self.last_read = now
+                self.interval = self.min_interval
+                return card_id
+
+            if now - self.last_read >= self.idle_after:
+                self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+            self.sleep(self.interval)
+            self.stats.idle_time += self.interval
+
+
+def read_detection_mode(settings_path):
+    """IRQ (default) or POLL, from settings/Rfidreader_Rc522_Detection"""
+    filepath = os.path.join(settings_path, 'Rfidreader_Rc522_Detection')
+    if not os.path.isfile(filepath):
+        return IRQ
+    with open(filepath, 'r') as f:
+        mode = f.read().rstrip().split(';', 1)[0]
+    if mode not in (IRQ, POLL):
+        logger.error('Unknown RC522 detection mode {}, using {}'.format(mode, IRQ))
+        return IRQ
+    return mode
+
+
+def create_detector(mode, device, read_function):
+    if mode == POLL:
+        return PollingDetector(read_function)
+    return IrqDetector(device, read_function)
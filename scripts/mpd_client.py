@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# Minimal client for the MPD text protocol.
+# Keeps one TCP connection open, so that the python daemons do not have to
+# fork `nc` or `mpc` for every single command they send to MPD.
+# Several commands can be sent at once as command list, which costs only one
+# round trip. The connection can be shared between threads.
+# See https://mpd.readthedocs.io/en/latest/protocol.html
+
+import logging
+import select
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+MPD_HOST = 'localhost'
+MPD_PORT = 6600
+
+
+class MPDError(Exception):
+    """MPD answered a command with ACK"""
+    pass
+
+
+class MPDNotSentError(ConnectionError):
+    """The command could not be sent to MPD, so it is safe to try it another way"""
+    pass
+
+
+def quote(arg):
+    """Quote a command argument as required by the MPD protocol"""
+    return '"' + str(arg).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def command_line(command, *args):
+    return ' '.join([command] + [quote(arg) for arg in args])
+
+
+def parse_objects(pairs, delimiters):
+    """Split a response into one dict per object, every key in delimiters starts a new object
+
+    E.g. the response of `outputs` is split by ('outputid',).
+    """
+    objects = []
+    for key, value in pairs:
+        if key in delimiters or not objects:
+            objects.append({})
+        objects[-1][key] = value
+    return objects
+
+
+class MPDConnection:
+
+    def __init__(self, host=MPD_HOST, port=MPD_PORT, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.mpd_version = None
+        self._sock = None
+        self._file = None
+        # one command (list) at a time, the responses would get mixed up otherwise
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return '<MPDConnection {}:{} connected={}>'.format(self.host, self.port, self.is_connected)
+
+    @property
+    def is_connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        if self.is_connected:
+            return
+        logger.debug('Connecting to MPD on {}:{}'.format(self.host, self.port))
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock_file = sock.makefile('r', encoding='utf-8', newline='\n')
+        greeting = sock_file.readline()
+        if not greeting.startswith('OK MPD '):
+            sock_file.close()
+            sock.close()
+            raise MPDError('Unexpected greeting from MPD: {}'.format(greeting.rstrip()))
+        self.mpd_version = greeting[len('OK MPD '):].strip()
+        self._sock = sock
+        self._file = sock_file
+
+    def disconnect(self):
+        if self._file is not None:
+            self._file.close()
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    def shutdown(self):
+        """Shut the connection down from another thread, e.g. to end a blocking idle"""
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _send(self, line):
+        self._sock.sendall((line + '\n').encode('utf-8'))
+
+    def _read_response(self, end='OK'):
+        pairs = []
+        while True:
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError('Connection to MPD closed')
+            line = line.rstrip('\n')
+            if line == end:
+                return pairs
+            if line.startswith('ACK '):
+                raise MPDError(line)
+            key, _, value = line.partition(': ')
+            pairs.append((key, value))
+
+    def _drop_closed_connection(self):
+        """Disconnect, if MPD closed the connection meanwhile, e.g. after its connection_timeout"""
+        if self.is_connected and select.select([self._sock], [], [], 0)[0]:
+            # there is nothing to read between the commands, only the end of the connection
+            logger.debug('MPD closed the connection')
+            self.disconnect()
+
+    def _request(self, lines, read):
+        """Send lines and return the result of read()
+
+        If the connection is broken before the command is sent, it is re-established once, if that fails too,
+        MPDNotSentError is raised. A command, which was sent already, is never repeated, as MPD may have executed
+        it, e.g. next.
+        """
+        with self._lock:
+            self._drop_closed_connection()
+            for attempt in (1, 2):
+                try:
+                    self.connect()
+                    self._send('\n'.join(lines))
+                    break
+                except OSError as e:
+                    self.disconnect()
+                    if attempt == 2:
+                        raise MPDNotSentError('Could not send to MPD: {}'.format(e)) from e
+                    logger.debug('Lost connection to MPD, reconnecting')
+            try:
+                return read()
+            except OSError:
+                self.disconnect()
+                raise
+
+    def _read_command_list(self, count):
+        responses = [self._read_response(end='list_OK') for _ in range(count)]
+        # the final OK of the whole list
+        self._read_response()
+        return responses
+
+    def execute(self, command, *args):
+        """Send one command and return the response as list of (key, value) pairs"""
+        return self._request([command_line(command, *args)], self._read_response)
+
+    def execute_dict(self, command, *args):
+        return dict(self.execute(command, *args))
+
+    def command_list(self, *commands):
+        """Send several commands in one go and return one list of (key, value) pairs per command
+
+        Every command is a string or a tuple (command, arg, ...). MPD stops at the first failing command
+        and answers with ACK, which is raised as MPDError.
+        """
+        commands = [(command,) if isinstance(command, str) else command for command in commands]
+        lines = ['command_list_ok_begin'] + [command_line(*command) for command in commands] + ['command_list_end']
+        return self._request(lines, lambda: self._read_command_list(len(commands)))
+
+    def command_list_dict(self, *commands):
+        return [dict(pairs) for pairs in self.command_list(*commands)]
+
+    def idle(self, *subsystems):
+        """Block until one of subsystems (all, if none are given) changed and return the changed subsystems
+
+        The timeout does not apply while waiting. There is no retry, as changes could be missed while reconnecting.
+        """
+        with self._lock:
+            self.connect()
+            self._sock.settimeout(None)
+            try:
+                self._send(command_line('idle', *subsystems))
+                pairs = self._read_response()
+            except (OSError, ConnectionError):
+                self.disconnect()
+                raise
+            finally:
+                if self._sock is not None:
+                    self._sock.settimeout(self.timeout)
+        return [value for key, value in pairs if key == 'changed']
+
+    def status(self):
+        return self.execute_dict('status')
+
+    def currentsong(self):
+        return self.execute_dict('currentsong')
+
+    def outputs(self):
+        return parse_objects(self.execute('outputs'), ('outputid',))
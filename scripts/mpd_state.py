@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Keeps a snapshot of the MPD state and tells subscribers when it changes.
+# One connection waits in `idle` for changes of player, mixer, options and
+# playlist. Subscribers like the MQTT client, the LCD and the StatusLED react
+# within milliseconds, neither polling MPD nor missing changes between polls.
+
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from mpd_client import MPD_HOST, MPD_PORT, MPDConnection, MPDError
+
+logger = logging.getLogger(__name__)
+
+SUBSYSTEMS = ('player', 'mixer', 'options', 'playlist')
+# passed as changed subsystem, if MPD was connected or lost
+CONNECTION = 'connection'
+# seconds to wait before connecting again, after MPD was lost
+RETRY_INTERVAL = 2.0
+
+
+class MPDState(namedtuple('MPDState', ['status', 'currentsong', 'timestamp'])):
+    """Response of status and currentsong, fetched at timestamp (monotonic). status is empty without MPD"""
+    __slots__ = ()
+
+    @property
+    def connected(self):
+        return bool(self.status)
+
+    def elapsed(self, now=None):
+        """Elapsed seconds of the current song, continued since the snapshot while playing
+
+        Raises KeyError like status['elapsed'], if there is no current song.
+        """
+        elapsed = float(self.status['elapsed'])
+        if self.status.get('state') == 'play':
+            elapsed += (time.monotonic() if now is None else now) - self.timestamp
+        return elapsed
+
+
+DISCONNECTED = MPDState({}, {}, 0.0)
+
+
+class MPDStateService:
+
+    def __init__(self, host=MPD_HOST, port=MPD_PORT, timeout=1.0, subsystems=SUBSYSTEMS,
+                 retry_interval=RETRY_INTERVAL, clock=time.monotonic):
+        self.mpd = MPDConnection(host, port, timeout)
+        self.subsystems = subsystems
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.state = DISCONNECTED
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return '<MPDStateService {} subscribers={}>'.format(self.mpd, len(self._subscribers))
+
+    def subscribe(self, callback, subsystems=None):
+        """Call callback(state, changed) from the service thread, whenever one of subsystems changed
+
+        changed is the set of changed subsystems. Without subsystems, every change is passed.
+        Changes of CONNECTION are always passed.
+        """
+        with self._lock:
+            self._subscribers.append((callback, None if subsystems is None else frozenset(subsystems)))
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber[0] != callback]
+
+    def _publish(self, state, changed):
+        self.state = state
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, subsystems in subscribers:
+            if subsystems is None or CONNECTION in changed or subsystems & changed:
+                try:
+                    callback(state, changed)
+                except Exception:
+                    logger.exception('Subscriber {} failed'.format(callback))
+
+    def fetch(self):
+        status, currentsong = self.mpd.command_list_dict('status', 'currentsong')
+        return MPDState(status, currentsong, self.clock())
+
+    def run(self):
+        changed = {CONNECTION}
+        while not self._stopped.is_set():
+            try:
+                self._publish(self.fetch(), changed)
+                changed = set(self.mpd.idle(*self.subsystems))
+            except (OSError, MPDError) as e:
+                self.mpd.disconnect()
+                if self._stopped.is_set():
+                    break
+                if self.state.connected:
+                    logger.warning('Lost connection to MPD: {}'.format(e))
+                    self._publish(DISCONNECTED, {CONNECTION})
+                changed = {CONNECTION}
+                self._stopped.wait(self.retry_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='MPDStateService', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is None:
+            return
+        # ends the idle, again if the thread was just connecting
+        while self._thread.is_alive():
+            self.mpd.shutdown()
+            self._thread.join(0.1)
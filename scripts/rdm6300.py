@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Streaming decoder for the serial output of the RDM6300 125kHz reader.
+# A frame is STX, 10 hex digits of data, 2 hex digits of checksum and ETX.
+# The checksum is the XOR of the 5 data bytes.
+
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+STX = 0x02
+ETX = 0x03
+FRAME_LENGTH = 14
+
+CardRead = namedtuple('CardRead', ['card_id', 'timestamp'])
+
+
+class Rdm6300Decoder:
+
+    def __init__(self, number_format=''):
+        # The decoder supports 2 additional number formats: 'card_id_float' and 'card_id_dec'
+        self.number_format = number_format
+        self.buffer = bytearray()
+        self.frames = 0
+        self.checksum_errors = 0
+
+    def __repr__(self):
+        return '<Rdm6300Decoder frames={} checksum_errors={}>'.format(self.frames, self.checksum_errors)
+
+    def feed(self, data, timestamp=None):
+        """Add bytes from the serial port and return a CardRead for every complete and valid frame"""
+        buffer = self.buffer
+        buffer += data
+        reads = []
+        position = 0
+        while True:
+            start = buffer.find(STX, position)
+            if start < 0:
+                position = len(buffer)
+                break
+            end = buffer.find(ETX, start + 1, start + FRAME_LENGTH)
+            if end < 0:
+                if len(buffer) - start < FRAME_LENGTH:
+                    # wait for the rest of the frame
+                    position = start
+                    break
+                # no ETX where it is expected, resync on the next STX
+                position = start + 1
+                continue
+            card_id = self.decode_frame(buffer[start + 1:end])
+            if card_id is not None:
+                reads.append(CardRead(card_id, timestamp))
+            position = end + 1
+        del buffer[:position]
+        return reads
+
+    def decode_frame(self, raw_frame):
+        if len(raw_frame) != FRAME_LENGTH - 2:
+            return None
+        try:
+            raw_card_id = raw_frame.decode('ascii')
+            values = bytes.fromhex(raw_card_id)
+        except ValueError:
+            return None
+        checksum = 0
+        for value in values[:5]:
+            checksum ^= value
+        if checksum != values[5]:
+            self.checksum_errors += 1
+            logger.debug('Checksum error in frame {}'.format(raw_card_id))
+            return None
+        self.frames += 1
+
+        # the first data byte is the version / factory code and is ignored
+        if self.number_format == 'card_id_dec':
+            # this will return a 10 Digit card ID e.g. 0006762840
+            return '{0:010d}'.format((values[1] << 24) + (values[2] << 16) + (values[3] << 8) + values[4])
+        elif self.number_format == 'card_id_float':
+            # this will return card ID as fraction e.g. 103,12632
+            return '{0:d},{1:05d}'.format(((values[1] << 8) + values[2]), ((values[3] << 8) + values[4]))
+        # this will return the raw (original) card ID e.g. 070067315809
+        return raw_card_id
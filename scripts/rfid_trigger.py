@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# In-process counterpart of rfid_trigger_play.sh --cardid=...
+#
+# daemon_rfid_reader.py used to fork rfid_trigger_play.sh for every swipe. That
+# script sources three config files, walks the case block of control cards and
+# talks to MPD with several `nc` calls. CardTrigger keeps the parsed configuration,
+# the control card table and the shortcuts in memory and talks to MPD over one
+# persistent connection instead.
+#
+# Everything not handled here (sync-shared, first play of a folder without a
+# folder.conf, missing config files) is left to rfid_trigger_play.sh:
+# CardTrigger.trigger() returns False and the caller runs the shell script.
+
+import grp
+import logging
+import os
+import pwd
+import re
+import subprocess
+import time
+
+from mpd_client import MPDConnection
+
+logger = logging.getLogger(__name__)
+
+# Control card variables of settings/rfid_trigger_play.conf and the
+# playout_controls.sh arguments they trigger (see case block in rfid_trigger_play.sh)
+CONTROL_CARDS = {
+    'CMDSHUFFLE': ['-c=playershuffle'],
+    'CMDMAXVOL30': ['-c=setmaxvolume', '-v=30'],
+    'CMDMAXVOL50': ['-c=setmaxvolume', '-v=50'],
+    'CMDMAXVOL75': ['-c=setmaxvolume', '-v=75'],
+    'CMDMAXVOL80': ['-c=setmaxvolume', '-v=80'],
+    'CMDMAXVOL85': ['-c=setmaxvolume', '-v=85'],
+    'CMDMAXVOL90': ['-c=setmaxvolume', '-v=90'],
+    'CMDMAXVOL95': ['-c=setmaxvolume', '-v=95'],
+    'CMDMAXVOL100': ['-c=setmaxvolume', '-v=100'],
+    'CMDMUTE': ['-c=mute'],
+    'CMDVOL30': ['-c=setvolume', '-v=30'],
+    'CMDVOL50': ['-c=setvolume', '-v=50'],
+    'CMDVOL75': ['-c=setvolume', '-v=75'],
+    'CMDVOL80': ['-c=setvolume', '-v=80'],
+    'CMDVOL85': ['-c=setvolume', '-v=85'],
+    'CMDVOL90': ['-c=setvolume', '-v=90'],
+    'CMDVOL95': ['-c=setvolume', '-v=95'],
+    'CMDVOL100': ['-c=setvolume', '-v=100'],
+    'CMDVOLUP': ['-c=volumeup'],
+    'CMDVOLDOWN': ['-c=volumedown'],
+    'CMDSWITCHAUDIOIFACE': ['-c=switchaudioiface'],
+    'CMDSTOP': ['-c=playerstop'],
+    'CMDSHUTDOWN': ['-c=shutdown'],
+    'CMDREBOOT': ['-c=reboot'],
+    'CMDNEXT': ['-c=playernext'],
+    'CMDPREV': ['-c=playerprev'],
+    'CMDRANDCARD': ['-c=randomcard'],
+    'CMDRANDFOLD': ['-c=randomfolder'],
+    'CMDRANDTRACK': ['-c=randomtrack'],
+    'CMDREWIND': ['-c=playerrewind'],
+    'CMDSEEKFORW': ['-c=playerseek', '-v=+15'],
+    'CMDSEEKBACK': ['-c=playerseek', '-v=-15'],
+    'CMDPAUSE': ['-c=playerpause'],
+    'CMDPLAY': ['-c=playerplay'],
+    'STOPAFTER5': ['-c=playerstopafter', '-v=5'],
+    'STOPAFTER15': ['-c=playerstopafter', '-v=15'],
+    'STOPAFTER30': ['-c=playerstopafter', '-v=30'],
+    'STOPAFTER60': ['-c=playerstopafter', '-v=60'],
+    'STOPAFTER120': ['-c=playerstopafter', '-v=120'],
+    'STOPAFTER180': ['-c=playerstopafter', '-v=180'],
+    'STOPAFTER240': ['-c=playerstopafter', '-v=240'],
+    'SHUTDOWNAFTER5': ['-c=shutdownafter', '-v=5'],
+    'SHUTDOWNAFTER15': ['-c=shutdownafter', '-v=15'],
+    'SHUTDOWNAFTER30': ['-c=shutdownafter', '-v=30'],
+    'SHUTDOWNAFTER60': ['-c=shutdownafter', '-v=60'],
+    'SHUTDOWNAFTER120': ['-c=shutdownafter', '-v=120'],
+    'SHUTDOWNAFTER180': ['-c=shutdownafter', '-v=180'],
+    'SHUTDOWNAFTER240': ['-c=shutdownafter', '-v=240'],
+    'SHUTDOWNVOLUMEREDUCTION10': ['-c=shutdownvolumereduction', '-v=10'],
+    'SHUTDOWNVOLUMEREDUCTION15': ['-c=shutdownvolumereduction', '-v=15'],
+    'SHUTDOWNVOLUMEREDUCTION30': ['-c=shutdownvolumereduction', '-v=30'],
+    'SHUTDOWNVOLUMEREDUCTION60': ['-c=shutdownvolumereduction', '-v=60'],
+    'SHUTDOWNVOLUMEREDUCTION120': ['-c=shutdownvolumereduction', '-v=120'],
+    'SHUTDOWNVOLUMEREDUCTION180': ['-c=shutdownvolumereduction', '-v=180'],
+    'SHUTDOWNVOLUMEREDUCTION240': ['-c=shutdownvolumereduction', '-v=240'],
+    'ENABLEWIFI': ['-c=enablewifi'],
+    'DISABLEWIFI': ['-c=disablewifi'],
+    'TOGGLEWIFI': ['-c=togglewifi'],
+    'CMDPLAYCUSTOMPLS': ['-c=playlistaddplay', '-v=PhonieCustomPLS', '-d=PhonieCustomPLS'],
+    'RECORDSTART600': ['-c=recordstart', '-v=600'],
+    'RECORDSTART60': ['-c=recordstart', '-v=60'],
+    'RECORDSTART10': ['-c=recordstart', '-v=10'],
+    'RECORDSTOP': ['-c=recordstop'],
+    'RECORDPLAYBACKLATEST': ['-c=recordplaylatest'],
+    'CMDREADWIFIIP': ['-c=readwifiipoverspeaker'],
+    'CMDBLUETOOTHTOGGLE': ['-c=bluetoothtoggle', '-v=toggle'],
+    'SYNCSHAREDFULL': ['-c=sharedsyncfull'],
+    'SYNCSHAREDONRFIDSCANTOGGLE': ['-c=sharedsyncchangeonrfidscan', '-v=toggle'],
+}
+
+# rfid_trigger_play.sh runs these controls with sudo
+SUDO_CONTROL_CARDS = ('CMDPREV', 'CMDREWIND')
+
+# owner and mode the shell scripts give the settings they write, so the web UI running as www-data can write them too
+SETTINGS_OWNER = ('pi', 'www-data')
+SETTINGS_MODE = 0o777
+
+# keys of folder.conf in the order inc.writeFolderConfig.sh writes them
+FOLDER_CONF_KEYS = ('CURRENTFILENAME', 'ELAPSED', 'PLAYSTATUS', 'RESUME', 'SHUFFLE', 'LOOP', 'SINGLE')
+
+config_line = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)=(.*)$')
+
+
+def read_shell_config(filepath):
+    """Read the KEY="value" assignments of a config file which is otherwise sourced by bash"""
+    values = {}
+    with open(filepath, 'r') as f:
+        for line in f:
+            match = config_line.match(line)
+            if match is None:
+                continue
+            value = match.group(2).strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            values[match.group(1)] = value
+    return values
+
+
+def write_folder_config(filepath, values):
+    with open(filepath, 'w') as f:
+        for key in FOLDER_CONF_KEYS:
+            f.write('{key}="{value}"\n'.format(key=key, value=values.get(key, '')))
+
+
+def readfile(filepath, default=''):
+    try:
+        with open(filepath, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def writefile(filepath, content):
+    with open(filepath, 'w') as f:
+        f.write(content + '\n')
+
+
+def write_setting(filepath, content):
+    """Write a file of the settings folder, a new one gets the owner and mode like in rfid_trigger_play.sh"""
+    created = not os.path.exists(filepath)
+    writefile(filepath, content)
+    if not created:
+        return
+    try:
+        os.chown(filepath, pwd.getpwnam(SETTINGS_OWNER[0]).pw_uid, grp.getgrnam(SETTINGS_OWNER[1]).gr_gid)
+        os.chmod(filepath, SETTINGS_MODE)
+    except (KeyError, OSError) as e:
+        logger.warning('Could not share {filepath} with {owner}: {e}'.format(
+            filepath=filepath, owner=':'.join(SETTINGS_OWNER), e=e))
+
+
+class CardTrigger:
+
+    def __init__(self, dir_path, mpd=None):
+        self.dir_path = dir_path
+        self.settings_path = os.path.join(dir_path, '..', 'settings')
+        self.shortcuts_path = os.path.join(dir_path, '..', 'shared', 'shortcuts')
+        self.playout_controls = os.path.join(dir_path, 'playout_controls.sh')
+        self.playlist_builder = os.path.join(dir_path, 'playlist_recursive_by_folder.php')
+        self.mpd = mpd if mpd is not None else MPDConnection()
+
+        self.config = {}
+        self.control_cards = {}
+        self._config_mtimes = None
+        self._shortcuts = {}
+
+    def __repr__(self):
+        return '<CardTrigger control_cards={} shortcuts={}>'.format(len(self.control_cards), len(self._shortcuts))
+
+    def _setting(self, name):
+        return os.path.join(self.settings_path, name)
+
+    def _config_files(self):
+        return (self._setting('global.conf'), self._setting('rfid_trigger_play.conf'))
+
+    def reload(self):
+        """(Re-)read global.conf and rfid_trigger_play.conf if they changed since the last call
+
+        Returns False if one of the files does not exist yet.
+        """
+        try:
+            mtimes = tuple(os.stat(filepath).st_mtime_ns for filepath in self._config_files())
+        except OSError:
+            return False
+        if mtimes == self._config_mtimes:
+            return True
+
+        global_conf, trigger_conf = self._config_files()
+        config = read_shell_config(global_conf)
+        config.update(read_shell_config(trigger_conf))
+
+        control_cards = {}
+        for name in CONTROL_CARDS:
+            cardid = config.get(name, '')
+            # unused control cards keep their placeholder like %CMDMUTE%, the first match wins like in the case block
+            if cardid and not cardid.startswith('%') and cardid not in control_cards:
+                control_cards[cardid] = name
+
+        self.config = config
+        self.control_cards = control_cards
+        self._config_mtimes = mtimes
+        logger.info('Loaded configuration with {} control cards'.format(len(control_cards)))
+        return True
+
+    def is_control_card(self, cardid):
+        return cardid in self.control_cards
+
+    def sync_shared_enabled(self):
+        return readfile(self._setting('sync-shared-enabled'), 'FALSE') == 'TRUE'
+
+    def trigger(self, cardid):
+        """Play the audio folder or run the control command of cardid
+
+        Returns False if the card has to be handled by rfid_trigger_play.sh instead.
+        """
+        if not self.reload() or self.sync_shared_enabled():
+            return False
+
+        if cardid in self.control_cards:
+            self._log_card(cardid)
+            self.run_control(self.control_cards[cardid])
+            return True
+
+        folder = self.shortcut_folder(cardid)
+        known_card = folder is not None
+        if not known_card:
+            folder = cardid
+        audio_folder = os.path.join(self.config.get('AUDIOFOLDERSPATH', ''), folder)
+        if folder and os.path.isdir(audio_folder) and not os.path.isfile(os.path.join(audio_folder, 'folder.conf')):
+            # the folder is played for the first time, let inc.writeFolderConfig.sh create the folder.conf
+            return False
+
+        self._log_card(cardid)
+        if not known_card:
+            # human readable shortcut does not exist, so create one with the content cardid
+            self.create_shortcut(cardid)
+        self._log_shortcut(folder, known_card)
+        if not folder:
+            logger.debug('var FOLDER empty')
+        elif not os.path.isdir(audio_folder):
+            logger.info('Path not found {}'.format(audio_folder))
+        else:
+            self.play_folder(folder)
+        return True
+
+    def _log_card(self, cardid):
+        now = time.strftime('%Y-%m-%d.%H:%M:%S')
+        writefile(os.path.join(self.dir_path, '..', 'shared', 'latestID.txt'),
+                  "Card ID '{cardid}' was used at '{now}'.".format(cardid=cardid, now=now))
+        write_setting(self._setting('Latest_RFID'), cardid)
+
+    def _log_shortcut(self, folder, known_card):
+        with open(os.path.join(self.dir_path, '..', 'shared', 'latestID.txt'), 'a') as f:
+            if known_card:
+                f.write('This ID has been used before.\n')
+            else:
+                f.write('This ID was used for the first time.\n')
+            f.write("The shortcut points to audiofolder '{folder}'.\n".format(folder=folder))
+
+    def shortcut_folder(self, cardid):
+        """Return the audio folder of cardid from shared/shortcuts or None if there is no shortcut yet"""
+        filepath = os.path.join(self.shortcuts_path, cardid)
+        try:
+            mtime = os.stat(filepath).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._shortcuts.get(cardid)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, readfile(filepath))
+            self._shortcuts[cardid] = cached
+        return cached[1]
+
+    def audio_folder(self, cardid):
+        """Return the audio folder assigned to cardid or None if it does not exist (yet)"""
+        audio_folders = self.config.get('AUDIOFOLDERSPATH')
+        folder = self.shortcut_folder(cardid)
+        if folder is None:
+            folder = cardid
+        if audio_folders and folder and os.path.isdir(os.path.join(audio_folders, folder)):
+            return folder
+        return None
+
+    def create_shortcut(self, cardid):
+        writefile(os.path.join(self.shortcuts_path, cardid), cardid)
+
+    def run_control(self, name):
+        command = [self.playout_controls] + CONTROL_CARDS[name]
+        if name in SUDO_CONTROL_CARDS:
+            command = ['sudo'] + command
+        logger.info('Control card {name}: {command}'.format(name=name, command=' '.join(command)))
+        subprocess.call(command)
+
+    def build_playlist(self, folder):
+        """Create the m3u for folder with playlist_recursive_by_folder.php and return the playlist name"""
+        playlist_name = folder.replace('/', ' % ')
+        playlist_path = os.path.join(self.config.get('PLAYLISTSFOLDERPATH', ''), playlist_name + '.m3u')
+        with open(playlist_path, 'w') as f:
+            subprocess.call([self.playlist_builder, '--folder', folder], stdout=f)
+        return playlist_name
+
+    def play_folder(self, folder):
+        playlist_name = self.build_playlist(folder)
+        last_playlist = readfile(self._setting('Latest_Playlist_Played'))
+
+        action = 'play'
+        if last_playlist == playlist_name:
+            action = self.second_swipe_action()
+        logger.info('Folder {folder}: {action}'.format(folder=folder, action=action))
+
+        if action == 'play':
+            self.stop()
+            self.playlist_add_play(playlist_name, folder)
+            write_setting(self._setting('Latest_Playlist_Played'), playlist_name)
+        elif action == 'toggle':
+            self.unmute()
+            if self.mpd.status().get('state') == 'play':
+                self.mpd.execute('pause', 1)
+            else:
+                self.mpd.execute('play')
+        elif action == 'resume':
+            subprocess.call(['sudo', self.playout_controls, '-c=playerplay'])
+        elif action == 'skipnext':
+            self.unmute()
+            self.mpd.execute('next')
+
+    def second_swipe_action(self):
+        """Decide what the same card does again, see SECONDSWIPE in rfid_trigger_play.sh"""
+        second_swipe = self.config.get('SECONDSWIPE', 'RESTART')
+        if int(self.mpd.status().get('playlistlength', 0)) == 0:
+            # after a reboot we want to play the playlist once no matter what the setting is
+            return 'play'
+        if second_swipe == 'PAUSE':
+            return 'toggle'
+        if second_swipe == 'PLAY':
+            return 'resume'
+        if second_swipe == 'NOAUDIOPLAY':
+            # once the playlist has finished, the second swipe is like a first swipe
+            return 'play' if not self.mpd.currentsong() else 'nothing'
+        if second_swipe == 'SKIPNEXT':
+            return 'skipnext'
+        return 'play'
+
+    def _folder_conf(self, folder):
+        return os.path.join(self.config.get('AUDIOFOLDERSPATH', ''), folder, 'folder.conf')
+
+    def unmute(self):
+        volfile = self._setting('Audio_Volume_Level')
+        if os.path.isfile(volfile):
+            self.mpd.execute('setvol', readfile(volfile))
+            os.remove(volfile)
+
+    def stop(self):
+        """Save the position of the current folder and stop, like playout_controls.sh -c=playerstop"""
+        folder = readfile(self._setting('Latest_Folder_Played'))
+        folder_conf = self._folder_conf(folder)
+        if folder and os.path.isfile(folder_conf):
+            values = read_shell_config(folder_conf)
+            if values.get('RESUME') == 'ON' or values.get('SINGLE') == 'ON':
+                elapsed = self.mpd.status().get('elapsed')
+                # mpd reports an elapsed time only if the audio is playing or is paused
+                if elapsed:
+                    values['CURRENTFILENAME'] = self.mpd.currentsong().get('file', '')
+                    values['ELAPSED'] = elapsed
+                    values['PLAYSTATUS'] = 'Stopped'
+                    write_folder_config(folder_conf, values)
+        self.mpd.execute('stop')
+
+    def playlist_add_play(self, playlist_name, folder):
+        """Load and play the playlist, like playout_controls.sh -c=playlistaddplay"""
+        folder_conf = self._folder_conf(folder)
+        values = read_shell_config(folder_conf)
+
+        self.mpd.execute('clear')
+        self.mpd.execute('load', playlist_name.replace('/', 'SLASH'))
+        self.mpd.execute('single', 1 if values.get('SINGLE') == 'ON' else 0)
+        if values.get('SHUFFLE') == 'ON':
+            self.mpd.execute('shuffle')
+        else:
+            self.mpd.execute('random', 0)
+        self.unmute()
+        self.resume(folder_conf, values)
+
+        write_setting(self._setting('Latest_Folder_Played'), folder)
+
+    def resume(self, folder_conf, values):
+        """Continue at the saved position if resume is enabled, like resume_play.sh -c=resume"""
+        if values.get('RESUME') != 'ON' and values.get('SINGLE') != 'ON':
+            self.mpd.execute('play')
+            return
+        if values.get('PLAYSTATUS') != 'Stopped':
+            # the playlist was played to the end the last time
+            self.mpd.execute('play')
+            return
+
+        found = self.mpd.execute_dict('playlistfind', 'filename', values.get('CURRENTFILENAME', ''))
+        if 'Pos' in found:
+            self.mpd.execute('play', found['Pos'])
+            self.mpd.execute('seekcur', values.get('ELAPSED', '0'))
+        else:
+            self.mpd.execute('play')
+        values['PLAYSTATUS'] = 'Playing'
+        write_folder_config(folder_conf, values)
+
+
+def create_card_trigger(dir_path):
+    """Return a CardTrigger unless settings/Rfid_Trigger_Engine selects the shell script"""
+    engine = readfile(os.path.join(dir_path, '..', 'settings', 'Rfid_Trigger_Engine'), 'PYTHON')
+    if engine == 'SHELL':
+        logger.info('Using rfid_trigger_play.sh for every card')
+        return None
+    return CardTrigger(dir_path)
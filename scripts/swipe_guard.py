@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Suppresses repeated reads of the same card.
+# Every card has its own cooldown, which is restarted with every read, so a
+# card held on the reader does not trigger again. The cooldown depends on the
+# class of the card: control cards, audio cards (with an audio folder) and
+# unknown cards. The class is taken when the card triggers, before the trigger
+# creates a shortcut for a new card.
+
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CONTROL = 'control'
+AUDIO = 'audio'
+UNKNOWN = 'unknown'
+
+# number of cards to remember, the least recently seen card is forgotten first
+MAX_CARDS = 256
+
+
+def read_cooldown(settings_path, name, default):
+    filepath = os.path.join(settings_path, name)
+    if not os.path.isfile(filepath):
+        return default
+    with open(filepath, 'r') as f:
+        value = f.readline().strip()
+    try:
+        return float(value)
+    except ValueError:
+        logger.error('Invalid value {} in {}, using {}'.format(value, filepath, default))
+        return default
+
+
+class SwipeGuard:
+
+    def __init__(self, cooldowns, card_trigger=None, max_cards=MAX_CARDS, clock=time.monotonic):
+        self.cooldowns = cooldowns
+        # the CardTrigger knows the control cards and the audio folders, without one every card is unknown
+        self.card_trigger = card_trigger
+        self.max_cards = max_cards
+        self.clock = clock
+        # cardid -> (time of the last read, class), ordered from least to most recently seen
+        self.last_seen = OrderedDict()
+
+    def __repr__(self):
+        return '<SwipeGuard cooldowns={} cards={}>'.format(self.cooldowns, len(self.last_seen))
+
+    @classmethod
+    def from_settings(cls, settings_path, card_trigger):
+        # Second_Swipe_Pause is the default for all cards, the other settings are optional
+        same_id_delay = read_cooldown(settings_path, 'Second_Swipe_Pause', 0.0)
+        cooldowns = {
+            AUDIO: read_cooldown(settings_path, 'Second_Swipe_Pause_Audio', same_id_delay),
+            UNKNOWN: read_cooldown(settings_path, 'Second_Swipe_Pause_Unknown', same_id_delay),
+        }
+        # if controlcards delay is deactivated, let the cards pass, otherwise, they have to wait...
+        with open(os.path.join(settings_path, 'Second_Swipe_Pause_Controls'), 'r') as f:
+            sspc_nodelay = f.readline().strip()
+        cooldowns[CONTROL] = 0.0 if sspc_nodelay == 'ON' else same_id_delay
+        return cls(cooldowns, card_trigger)
+
+    def card_class(self, cardid):
+        if self.card_trigger is None or not self.card_trigger.reload():
+            return UNKNOWN
+        if self.card_trigger.is_control_card(cardid):
+            return CONTROL
+        if self.card_trigger.audio_folder(cardid) is not None:
+            return AUDIO
+        return UNKNOWN
+
+    def allow(self, cardid):
+        """Return True if cardid has to be triggered, False if it is still in its cooldown"""
+        now = self.clock()
+        last_seen = self.last_seen.pop(cardid, None)
+        allowed = last_seen is None or now - last_seen[0] >= self.cooldowns[last_seen[1]]
+        # classified before it triggers, the trigger creates a shortcut for a new card
+        card_class = self.card_class(cardid) if allowed else last_seen[1]
+        self.last_seen[cardid] = (now, card_class)
+        if len(self.last_seen) > self.max_cards:
+            self.last_seen.popitem(last=False)
+        return allowed
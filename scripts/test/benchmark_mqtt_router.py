@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# MQTT topic routing benchmark.
+# Feeds a mix of cmd/ and get/ messages through the Router of
+# daemon_mqtt_client.py and, for comparison, through the former way of
+# routing: a regex built from the base topic for each message followed by
+# list lookups. Only the routing and the validation of the payload are
+# measured, the commands are not executed.
+# Usage: python3 scripts/test/benchmark_mqtt_router.py --messages 100000
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from reader_modules import load_component  # noqa: E402
+
+MESSAGES = [
+    ('phoniebox/cmd/volumeup', ''),
+    ('phoniebox/cmd/setvolume', '42'),
+    ('phoniebox/cmd/playerseek', '-15'),
+    ('phoniebox/cmd/playfolder', 'Moby Dick'),
+    ('phoniebox/cmd/swipecard', '0001234567'),
+    ('phoniebox/get/all', ''),
+    ('phoniebox/get/volume', ''),
+    ('phoniebox/cmd/unknown', ''),
+]
+
+
+def load_daemon():
+    return load_component('smart-home-automation', 'MQTT-protocol', 'daemon_mqtt_client.py')
+
+
+def route_router(daemon, topic, payload):
+    route = daemon.router.route(topic)
+    if isinstance(route, daemon.CommandRoute):
+        route.parse(payload)
+    return route
+
+
+def route_regex(daemon, topic, payload):
+    regex_extract = re.search(daemon.config.get("mqttBaseTopic") + "/(.*)/(.*)", topic)
+    message_topic = regex_extract.group(1).lower()
+    message_subtopic = regex_extract.group(2).lower()
+    if message_topic == "cmd":
+        return message_subtopic in daemon.arAvailableCommands or message_subtopic in daemon.arAvailableCommandsWithParam
+    return message_subtopic == "all" or message_subtopic in daemon.arAvailableAttributes
+
+
+def measure(function, daemon, messages):
+    started = time.perf_counter()
+    for index in range(messages):
+        function(daemon, *MESSAGES[index % len(MESSAGES)])
+    return messages / (time.perf_counter() - started)
+
+
+def run_benchmark(messages=100000):
+    """Messages per second for each way of routing"""
+    daemon = load_daemon()
+    return {'router': measure(route_router, daemon, messages), 'regex': measure(route_regex, daemon, messages)}
+
+
+def report(results):
+    return '\n'.join('{:<10}{:>12.0f} msgs/s'.format(name, rate) for name, rate in results.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how many MQTT messages per second are routed')
+    parser.add_argument('--messages', type=int, default=100000, help='number of messages to route')
+    args = parser.parse_args()
+
+    print(report(run_benchmark(args.messages)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Swipe-to-sound latency benchmark.
+# Replays synthetic evdev key sequences through Reader.readCard(), runs the
+# loop of daemon_rfid_reader.py against them and lets a fake MPD server
+# timestamp the commands it receives. The time from injecting a card until
+# MPD receives `play` is split into the stages
+#   read      key events injected -> Reader.readCard() returns
+#   dedupe    readCard() returns -> card passed the same-card-delay check
+#   dispatch  card resolved to an audio folder -> playlist build starts
+#   playlist  playlist_recursive_by_folder.php runs
+#   mpd       playlist built -> MPD received `play`
+# Usage: python3 scripts/test/benchmark_swipe_latency.py --swipes 100
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import mock_open, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from daemon_rfid_reader import RfidDaemon  # noqa: E402
+from fake_evdev import ReplayDevice, card_events  # noqa: E402
+from fake_mpd import FakeMPD  # noqa: E402
+from mpd_client import MPDConnection  # noqa: E402
+from rfid_trigger import CardTrigger  # noqa: E402
+import Reader as reader_module  # noqa: E402
+
+STAGES = ('read', 'dedupe', 'dispatch', 'playlist', 'mpd', 'total')
+CARDS = ('0001234567', '0002345678', '0003456789', '0004567890')
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100.0 * len(ordered)) - 1)]
+
+
+def create_jukebox(base_path):
+    """Create a minimal jukebox tree with one audio folder per card"""
+    for folder in ('scripts', 'settings', 'shared/shortcuts', 'playlists'):
+        os.makedirs(os.path.join(base_path, folder))
+    settings = {
+        'Second_Swipe_Pause': '0',
+        'Second_Swipe_Pause_Controls': 'ON',
+        'Swipe_or_Place': 'SWIPENOTPLACE',
+        'global.conf': 'AUDIOFOLDERSPATH="{}"\nPLAYLISTSFOLDERPATH="{}"\nSECONDSWIPE="RESTART"\n'.format(
+            os.path.join(base_path, 'audiofolders'), os.path.join(base_path, 'playlists')),
+        'rfid_trigger_play.conf': 'CMDMUTE="1111"\n',
+    }
+    for name, content in settings.items():
+        with open(os.path.join(base_path, 'settings', name), 'w') as f:
+            f.write(content + '\n')
+    for number, cardid in enumerate(CARDS):
+        folder = 'Album {}'.format(number)
+        os.makedirs(os.path.join(base_path, 'audiofolders', folder))
+        with open(os.path.join(base_path, 'audiofolders', folder, 'folder.conf'), 'w') as f:
+            f.write('CURRENTFILENAME="filename"\nELAPSED="0"\nPLAYSTATUS="Stopped"\nRESUME="OFF"\n'
+                    'SHUFFLE="OFF"\nLOOP="OFF"\nSINGLE="OFF"\n')
+        with open(os.path.join(base_path, 'shared', 'shortcuts', cardid), 'w') as f:
+            f.write(folder + '\n')
+    builder = os.path.join(base_path, 'scripts', 'playlist_recursive_by_folder.php')
+    with open(builder, 'w') as f:
+        f.write('#!/bin/sh\necho "$2/01.mp3"\n')
+    os.chmod(builder, 0o755)
+    return os.path.join(base_path, 'scripts')
+
+
+def create_reader(device):
+    with patch.object(reader_module, 'get_devices', return_value=[device]), \
+            patch.object(reader_module.os.path, 'isfile', return_value=True), \
+            patch('builtins.open', mock_open(read_data=device.name)):
+        return reader_module.Reader()
+
+
+def instrument(daemon, card_trigger, record):
+    """Wrap the stage boundaries of the daemon to note down monotonic timestamps"""
+    read_card = daemon.reader.readCard
+    trigger_card = daemon.trigger_card
+    build_playlist = card_trigger.build_playlist
+
+    def timed_read_card():
+        cardid = read_card()
+        record['read'] = time.monotonic()
+        return cardid
+
+    def timed_trigger_card(cardid):
+        record['dedupe'] = time.monotonic()
+        return trigger_card(cardid)
+
+    def timed_build_playlist(folder):
+        record['dispatch'] = time.monotonic()
+        playlist_name = build_playlist(folder)
+        record['playlist'] = time.monotonic()
+        return playlist_name
+
+    daemon.reader.readCard = timed_read_card
+    daemon.trigger_card = timed_trigger_card
+    card_trigger.build_playlist = timed_build_playlist
+
+
+def run_benchmark(swipes=100, interval=0.5):
+    """Swipe `swipes` cards with a random pause of up to `interval` seconds in between
+
+    Returns a dict with the latencies in seconds for each stage.
+    """
+    results = {stage: [] for stage in STAGES}
+    record = {}
+    device = ReplayDevice()
+
+    with tempfile.TemporaryDirectory() as base_path, FakeMPD() as mpd:
+        dir_path = create_jukebox(base_path)
+        card_trigger = CardTrigger(dir_path, mpd=MPDConnection(port=mpd.port))
+        daemon = RfidDaemon(create_reader(device), dir_path, card_trigger)
+        instrument(daemon, card_trigger, record)
+
+        def swipe_cards():
+            try:
+                for swipe in range(swipes):
+                    time.sleep(random.uniform(0, interval))
+                    record.clear()
+                    injected = time.monotonic()
+                    device.push(card_events(CARDS[swipe % len(CARDS)]))
+                    played = mpd.wait_for('play', count=swipe + 1)
+                    if played is None:
+                        raise RuntimeError('MPD did not receive play for swipe {}'.format(swipe))
+                    previous = injected
+                    for stage in STAGES[:-2]:
+                        results[stage].append(record[stage] - previous)
+                        previous = record[stage]
+                    results['mpd'].append(played[0] - previous)
+                    results['total'].append(played[0] - injected)
+            finally:
+                daemon.loop.stop()
+
+        swiper = threading.Thread(target=swipe_cards, daemon=True)
+        swiper.start()
+        daemon.run()
+        swiper.join()
+        card_trigger.mpd.disconnect()
+    device.close()
+    return results
+
+
+def report(results):
+    lines = ['{:<10}{:>10}{:>10}{:>10}'.format('stage', 'p50 ms', 'p95 ms', 'p99 ms')]
+    for stage in STAGES:
+        lines.append('{:<10}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+            stage, *[percentile(results[stage], percent) * 1000 for percent in (50, 95, 99)]))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the latency from swiping a card until MPD plays')
+    parser.add_argument('--swipes', type=int, default=100, help='number of cards to swipe')
+    parser.add_argument('--interval', type=float, default=0.5, help='maximum pause between two swipes in seconds')
+    args = parser.parse_args()
+
+    print(report(run_benchmark(args.swipes, args.interval)))
+
+
+if __name__ == "__main__":
+    main()
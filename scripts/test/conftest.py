@@ -0,0 +1,6 @@
+import sys
+import os
+# add absolute parent path, to harmonize imports with the daemons which are started from the scripts folder
+sys.path.insert(1, "/".join(os.path.abspath(__file__).split("/")[0:-2]))
+# add the test folder itself for the fakes and benchmarks which are also run standalone
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
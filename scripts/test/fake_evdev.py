@@ -0,0 +1,72 @@
+# Fake evdev input device for tests and benchmarks.
+# USB RFID readers act as keyboard, so a card shows up as a sequence of key
+# events terminated by KEY_ENTER.
+
+import collections
+import errno
+import os
+import threading
+import time
+
+from evdev import InputEvent, ecodes
+
+
+class ReplayDevice:
+    """Stands in for an evdev InputDevice, events are pushed from another thread"""
+    name = 'Replay RFID Reader'
+    phys = ''
+
+    def __init__(self, name=None, phys=None):
+        if name is not None:
+            self.name = name
+        if phys is not None:
+            self.phys = phys
+        self._read_fd, self._write_fd = os.pipe()
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+        self.unplugged = False
+        self.closed = False
+
+    def fileno(self):
+        return self._read_fd
+
+    def push(self, events):
+        with self._lock:
+            self._events.extend(events)
+        os.write(self._write_fd, b'.')
+
+    def unplug(self):
+        """Reading fails from now on, like it does for an unplugged device"""
+        self.unplugged = True
+        os.write(self._write_fd, b'.')
+
+    def read(self):
+        os.read(self._read_fd, 4096)
+        if self.unplugged:
+            raise OSError(errno.ENODEV, os.strerror(errno.ENODEV))
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return iter(events)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+        # like evdev, so a reader still waiting on the device cannot pick up a reused fd number
+        self._read_fd = self._write_fd = -1
+
+
+def card_events(cardid):
+    """Key down/up events as sent by a USB RFID reader acting as keyboard"""
+    now = time.time()
+    sec, usec = int(now), int(now % 1 * 1000000)
+    events = []
+    for key in list(cardid) + ['ENTER']:
+        code = ecodes.ecodes['KEY_' + key]
+        events.append(InputEvent(sec, usec, ecodes.EV_KEY, code, 1))
+        events.append(InputEvent(sec, usec, ecodes.EV_KEY, code, 0))
+        events.append(InputEvent(sec, usec, ecodes.EV_SYN, ecodes.SYN_REPORT, 0))
+    return events
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# Fake MPD server speaking enough of the text protocol for tests and benchmarks.
+# Every command is recorded together with the monotonic time it arrived, so
+# callers can measure how long it took for a swipe to reach the player.
+# The state (status, queue, tags, outputs) can be scripted by the test and
+# every command can be delayed, to measure latencies deterministically.
+# Usage: python3 scripts/test/fake_mpd.py --port 6600 --latency 0.005
+
+import argparse
+import shlex
+import socketserver
+import threading
+import time
+from select import select
+
+# subsystem reported by idle after a command changed the state
+IDLE_EVENTS = {
+    'stop': 'player', 'play': 'player', 'pause': 'player', 'next': 'player', 'previous': 'player',
+    'seekcur': 'player', 'clearerror': 'player',
+    'setvol': 'mixer',
+    'single': 'options', 'random': 'options', 'repeat': 'options',
+    'clear': 'playlist', 'load': 'playlist', 'shuffle': 'playlist', 'add': 'playlist', 'delete': 'playlist',
+    'save': 'stored_playlist',
+    'enableoutput': 'output', 'disableoutput': 'output', 'toggleoutput': 'output',
+}
+
+ACK_ERROR_ARG = 2
+ACK_ERROR_UNKNOWN = 5
+ACK_ERROR_NO_EXIST = 50
+
+
+class FakeMPDError(Exception):
+    """Answered with ACK"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeMPDHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server.fake_mpd
+        # idle reports the changes since the last idle
+        self.seen_changes = len(server.changes)
+        self.wfile.write(b'OK MPD 0.21.0\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode('utf-8').rstrip('\n')
+            if line == 'close':
+                return
+            if line in ('command_list_begin', 'command_list_ok_begin'):
+                self.wfile.write(self.handle_command_list(line == 'command_list_ok_begin').encode('utf-8'))
+            elif line.split(' ', 1)[0] == 'idle':
+                response = self.handle_idle(shlex.split(line)[1:])
+                if response is None:
+                    return
+                self.wfile.write(response.encode('utf-8'))
+            elif line != 'noidle':
+                self.wfile.write(server.handle_command(line).encode('utf-8'))
+
+    def handle_idle(self, subsystems):
+        """Wait for a change, noidle or the client closing the connection (returns None then)"""
+        server = self.server.fake_mpd
+        server.record('idle', subsystems)
+        while True:
+            changed = server.wait_for_changes(self.seen_changes, subsystems, timeout=0.02)
+            if changed:
+                break
+            if select([self.connection], [], [], 0)[0]:
+                line = self.rfile.readline()
+                if line.rstrip(b'\n') != b'noidle':
+                    return None
+                break
+        self.seen_changes = len(server.changes)
+        return ''.join('changed: {}\n'.format(subsystem) for subsystem in changed) + 'OK\n'
+
+    def handle_command_list(self, list_ok):
+        lines = []
+        while True:
+            line = self.rfile.readline().decode('utf-8').rstrip('\n')
+            if line == 'command_list_end':
+                break
+            lines.append(line)
+        result = ''
+        for line in lines:
+            response = self.server.fake_mpd.handle_command(line)
+            if response.startswith('ACK '):
+                # MPD stops at the first failing command
+                return result + response
+            # the OK of every command is replaced by list_OK, or left out
+            result += response[:-len('OK\n')] + ('list_OK\n' if list_ok else '')
+        return result + 'OK\n'
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise FakeMPDError(ACK_ERROR_ARG, 'Integer expected: {}'.format(value))
+
+
+class FakeMPD:
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.commands = []
+        self.status = {'volume': '50', 'repeat': '0', 'random': '0', 'single': '0', 'consume': '0',
+                       'playlistlength': '0', 'state': 'stop'}
+        self.currentsong = {}
+        # stored playlists, name -> list of files
+        self.playlists = {}
+        # files in the queue
+        self.queue = []
+        # file -> tags like Title or duration, returned with currentsong and playlistinfo
+        self.tags = {}
+        self.outputs = [
+            {'outputid': '0', 'outputname': 'Speakers', 'plugin': 'alsa', 'outputenabled': '1'},
+            {'outputid': '1', 'outputname': 'Headphones', 'plugin': 'alsa', 'outputenabled': '0'},
+        ]
+        # command -> seconds to wait before answering, '*' for every command
+        self.latency = {}
+        # subsystems changed so far, in order
+        self.changes = []
+        self._lock = threading.Lock()
+        self._command_received = threading.Condition(self._lock)
+        self._server = socketserver.ThreadingTCPServer((host, port), FakeMPDHandler, bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.fake_mpd = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._server.server_bind()
+        self._server.server_activate()
+        # a short poll interval, so that stopping does not hold up the tests
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # scripting the state
+
+    def update_status(self, subsystem=None, **values):
+        """Change the status like MPD would do on its own, e.g. update_status('player', error='...')"""
+        with self._command_received:
+            self.status.update(values)
+        if subsystem is not None:
+            self.notify(subsystem)
+
+    def add_songs(self, *songs):
+        """Append songs to the queue, every song is a dict of tags including file"""
+        with self._command_received:
+            for song in songs:
+                self.tags[song['file']] = {key: value for key, value in song.items() if key != 'file'}
+                self.queue.append(song['file'])
+            self.status['playlistlength'] = str(len(self.queue))
+        self.notify('playlist')
+
+    def set_latency(self, command, seconds):
+        """Delay the answers to command, '*' delays all commands without own latency"""
+        self.latency[command] = seconds
+
+    # inspecting the received commands
+
+    def wait_for(self, command, count=1, timeout=5.0):
+        """Block until `command` has been received `count` times, return the last (timestamp, args)"""
+        with self._command_received:
+            self._command_received.wait_for(lambda: len(self.received(command)) >= count, timeout)
+            received = self.received(command)
+        return received[count - 1] if len(received) >= count else None
+
+    def received(self, command):
+        return [(timestamp, args) for timestamp, name, args in self.commands if name == command]
+
+    def record(self, command, args):
+        with self._command_received:
+            self.commands.append((time.monotonic(), command, args))
+            self._command_received.notify_all()
+
+    def notify(self, subsystem):
+        """Wake up idle clients, e.g. after the test changed the state"""
+        with self._command_received:
+            self.changes.append(subsystem)
+            self._command_received.notify_all()
+
+    def wait_for_changes(self, seen, subsystems, timeout):
+        """Subsystems changed after the first `seen` changes, only those in subsystems if given"""
+        def changed():
+            return sorted({subsystem for subsystem in self.changes[seen:] if not subsystems or subsystem in subsystems})
+
+        with self._command_received:
+            self._command_received.wait_for(changed, timeout)
+            return changed()
+
+    def handle_command(self, line):
+        timestamp = time.monotonic()
+        command, *args = shlex.split(line)
+        with self._command_received:
+            self.commands.append((timestamp, command, args))
+            try:
+                handler = getattr(self, '_cmd_' + command, None)
+                if handler is None:
+                    raise FakeMPDError(ACK_ERROR_UNKNOWN, 'unknown command "{}"'.format(command))
+                try:
+                    response = handler(*args) or {}
+                except TypeError:
+                    raise FakeMPDError(ACK_ERROR_ARG, 'wrong number of arguments for "{}"'.format(command))
+                if command in IDLE_EVENTS:
+                    self.changes.append(IDLE_EVENTS[command])
+                answer = ''.join('{}: {}\n'.format(key, value) for key, value in self._pairs(response)) + 'OK\n'
+            except FakeMPDError as e:
+                answer = 'ACK [{}@0] {{{}}} {}\n'.format(e.code, command, e)
+            self._command_received.notify_all()
+        # outside of the lock, other connections are not delayed
+        latency = self.latency.get(command, self.latency.get('*', 0))
+        if latency:
+            time.sleep(latency)
+        return answer
+
+    @staticmethod
+    def _pairs(response):
+        """Handlers return a dict or, for several objects, a list of (key, value) pairs"""
+        return response.items() if isinstance(response, dict) else response
+
+    def _song(self, pos):
+        filename = self.queue[pos]
+        return dict({'file': filename}, **self.tags.get(filename, {}), Pos=str(pos), Id=str(pos + 1))
+
+    def _select(self, pos):
+        """Make pos the current song and start it from the beginning"""
+        self.currentsong = self._song(pos)
+        self.status.update(song=str(pos), songid=str(pos + 1), elapsed='0.000')
+        duration = self.currentsong.get('duration')
+        if duration is not None:
+            self.status['duration'] = duration
+            self.status['time'] = '0:{}'.format(int(float(duration)))
+
+    def _check_pos(self, pos):
+        pos = parse_int(pos)
+        if not 0 <= pos < len(self.queue):
+            raise FakeMPDError(ACK_ERROR_ARG, 'Bad song index')
+        return pos
+
+    def _cmd_ping(self):
+        pass
+
+    def _cmd_status(self):
+        return dict(self.status)
+
+    def _cmd_currentsong(self):
+        return dict(self.currentsong)
+
+    def _cmd_clearerror(self):
+        self.status.pop('error', None)
+
+    # playback
+
+    def _cmd_stop(self):
+        self.status['state'] = 'stop'
+
+    def _cmd_play(self, pos=None):
+        if pos is not None:
+            self._select(self._check_pos(pos))
+        elif not self.queue:
+            return
+        elif self.status['state'] == 'stop' or not self.currentsong:
+            self._select(int(self.status.get('song', '0')) if self.currentsong else 0)
+        self.status['state'] = 'play'
+
+    def _cmd_pause(self, pause=None):
+        if self.status['state'] == 'stop':
+            return
+        if pause is None:
+            pause = '1' if self.status['state'] == 'play' else '0'
+        self.status['state'] = 'pause' if pause == '1' else 'play'
+
+    def _skip(self, offset):
+        if self.status['state'] == 'stop' or not self.currentsong:
+            return
+        pos = int(self.currentsong['Pos']) + offset
+        if 0 <= pos < len(self.queue):
+            self._select(pos)
+        elif self.status['repeat'] == '1' and self.queue:
+            self._select(pos % len(self.queue))
+        else:
+            self.status['state'] = 'stop'
+
+    def _cmd_next(self):
+        self._skip(1)
+
+    def _cmd_previous(self):
+        self._skip(-1)
+
+    def _cmd_seekcur(self, elapsed):
+        self.status['elapsed'] = elapsed
+
+    def _cmd_setvol(self, volume):
+        volume = parse_int(volume)
+        if not 0 <= volume <= 100:
+            raise FakeMPDError(ACK_ERROR_ARG, 'Invalid volume value')
+        self.status['volume'] = str(volume)
+
+    # options
+
+    def _cmd_single(self, state):
+        self.status['single'] = state
+
+    def _cmd_random(self, state):
+        self.status['random'] = state
+
+    def _cmd_repeat(self, state):
+        self.status['repeat'] = state
+
+    # queue and stored playlists
+
+    def _queue_changed(self):
+        self.status['playlistlength'] = str(len(self.queue))
+
+    def _cmd_clear(self):
+        self.queue = []
+        self._queue_changed()
+        self.status['state'] = 'stop'
+        self.currentsong = {}
+
+    def _cmd_add(self, filename):
+        self.queue.append(filename)
+        self._queue_changed()
+
+    def _cmd_delete(self, pos):
+        del self.queue[self._check_pos(pos)]
+        self._queue_changed()
+
+    def _cmd_load(self, name):
+        self.queue.extend(self.playlists.get(name, [name + '/01.mp3']))
+        self._queue_changed()
+
+    def _cmd_save(self, name):
+        self.playlists[name] = list(self.queue)
+
+    def _cmd_listplaylists(self):
+        return [('playlist', name) for name in self.playlists]
+
+    def _cmd_shuffle(self):
+        pass
+
+    def _cmd_playlistinfo(self):
+        return [pair for pos in range(len(self.queue)) for pair in self._song(pos).items()]
+
+    def _cmd_playlistfind(self, tag, needle):
+        for pos, filename in enumerate(self.queue):
+            if filename == needle:
+                return {'file': filename, 'Pos': str(pos)}
+
+    # outputs
+
+    def _output(self, outputid):
+        outputid = parse_int(outputid)
+        if not 0 <= outputid < len(self.outputs):
+            raise FakeMPDError(ACK_ERROR_NO_EXIST, 'No such audio output')
+        return self.outputs[outputid]
+
+    def _cmd_outputs(self):
+        return [pair for output in self.outputs for pair in output.items()]
+
+    def _cmd_enableoutput(self, outputid):
+        self._output(outputid)['outputenabled'] = '1'
+
+    def _cmd_disableoutput(self, outputid):
+        self._output(outputid)['outputenabled'] = '0'
+
+    def _cmd_toggleoutput(self, outputid):
+        output = self._output(outputid)
+        output['outputenabled'] = '0' if output['outputenabled'] == '1' else '1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake MPD server, e.g. to try the LCD or MQTT client without MPD')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6600)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to delay every answer')
+    args = parser.parse_args()
+
+    fake_mpd = FakeMPD(args.host, args.port)
+    fake_mpd.set_latency('*', args.latency)
+    fake_mpd.add_songs(*[{'file': 'Moby Dick/{:02}.mp3'.format(track), 'Title': 'Chapter {}'.format(track),
+                          'Artist': 'Herman Melville', 'Album': 'Moby Dick', 'Track': str(track),
+                          'duration': '600.000'} for track in range(1, 4)])
+    with fake_mpd:
+        print('Fake MPD listening on {}:{}'.format(args.host, fake_mpd.port))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
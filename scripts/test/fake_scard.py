@@ -0,0 +1,173 @@
+# Stand-in for smartcard.scard, so the PC/SC reader can be tested without pcscd.
+# Readers and cards are added and removed by the test, SCardGetStatusChange
+# blocks until the state of one of the watched readers differs.
+
+import collections
+import itertools
+import threading
+import time
+
+SCARD_S_SUCCESS = 0
+SCARD_SCOPE_USER = 0
+SCARD_SHARE_SHARED = 2
+SCARD_PROTOCOL_T0 = 1
+SCARD_PROTOCOL_T1 = 2
+SCARD_LEAVE_CARD = 0
+INFINITE = 0xFFFFFFFF
+
+SCARD_STATE_UNAWARE = 0x0000
+SCARD_STATE_IGNORE = 0x0001
+SCARD_STATE_CHANGED = 0x0002
+SCARD_STATE_UNKNOWN = 0x0004
+SCARD_STATE_UNAVAILABLE = 0x0008
+SCARD_STATE_EMPTY = 0x0010
+SCARD_STATE_PRESENT = 0x0020
+
+SCARD_E_INVALID_HANDLE = 0x80100003
+SCARD_E_UNKNOWN_READER = 0x80100009
+SCARD_E_TIMEOUT = 0x8010000A
+SCARD_E_NO_SMARTCARD = 0x8010000C
+SCARD_E_NO_SERVICE = 0x8010001D
+SCARD_E_NO_READERS_AVAILABLE = 0x8010002E
+
+PNP_NOTIFICATION = '\\\\?PnP?\\Notification'
+STATUS_OK = [0x90, 0x00]
+
+
+class FakeSCard:
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        # reader name -> uid of the card on the reader or None
+        self.readers = {}
+        # reader name -> number of card insertions and removals, reported in the upper 16 bits like pcsc-lite does
+        self.events = collections.Counter()
+        self.contexts = set()
+        self.handles = {}
+        self.failures = collections.deque()
+        self._ids = itertools.count(1)
+        self._changed = threading.Condition()
+
+    # scripting the state
+
+    def add_reader(self, reader):
+        with self._changed:
+            self.readers[reader] = None
+            self._changed.notify_all()
+
+    def remove_reader(self, reader):
+        with self._changed:
+            del self.readers[reader]
+            self._changed.notify_all()
+
+    def insert_card(self, reader, uid):
+        with self._changed:
+            self.readers[reader] = uid
+            self.events[reader] += 1
+            self._changed.notify_all()
+
+    def remove_card(self, reader):
+        with self._changed:
+            self.readers[reader] = None
+            self.events[reader] += 1
+            self._changed.notify_all()
+
+    def fail_next(self, function, hresult):
+        self.failures.append((function, hresult))
+
+    def _failure(self, function):
+        self.calls[function] += 1
+        if self.failures and self.failures[0][0] == function:
+            return self.failures.popleft()[1]
+        return None
+
+    def _state(self, reader):
+        if reader == PNP_NOTIFICATION:
+            return len(self.readers) << 16
+        if reader not in self.readers:
+            return SCARD_STATE_UNKNOWN
+        state = SCARD_STATE_PRESENT if self.readers[reader] is not None else SCARD_STATE_EMPTY
+        return self.events[reader] << 16 | state
+
+    # smartcard.scard API
+
+    def SCardGetErrorMessage(self, hresult):
+        return 'error 0x{:08X}'.format(hresult)
+
+    def SCardEstablishContext(self, scope):
+        hresult = self._failure('SCardEstablishContext')
+        if hresult is not None:
+            return hresult, None
+        hcontext = next(self._ids)
+        self.contexts.add(hcontext)
+        return SCARD_S_SUCCESS, hcontext
+
+    def SCardReleaseContext(self, hcontext):
+        self.calls['SCardReleaseContext'] += 1
+        self.contexts.discard(hcontext)
+        return SCARD_S_SUCCESS
+
+    def SCardListReaders(self, hcontext, groups):
+        self.calls['SCardListReaders'] += 1
+        if not self.readers:
+            return SCARD_E_NO_READERS_AVAILABLE, []
+        return SCARD_S_SUCCESS, list(self.readers)
+
+    def SCardGetStatusChange(self, hcontext, timeout, readerstates):
+        hresult = self._failure('SCardGetStatusChange')
+        if hresult is not None:
+            return hresult, []
+        if hcontext not in self.contexts:
+            return SCARD_E_INVALID_HANDLE, []
+
+        def changed():
+            return any(self._state(reader) != state & ~SCARD_STATE_CHANGED for reader, state in readerstates)
+
+        deadline = None if timeout == INFINITE else time.monotonic() + timeout / 1000.0
+        with self._changed:
+            while not changed():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return SCARD_E_TIMEOUT, []
+                self._changed.wait(remaining)
+            newstates = []
+            for reader, state in readerstates:
+                eventstate = self._state(reader)
+                if eventstate != state & ~SCARD_STATE_CHANGED:
+                    eventstate |= SCARD_STATE_CHANGED
+                newstates.append((reader, eventstate, []))
+        return SCARD_S_SUCCESS, newstates
+
+    def SCardConnect(self, hcontext, reader, share_mode, protocols):
+        self.calls['SCardConnect'] += 1
+        if self.readers.get(reader) is None:
+            return SCARD_E_NO_SMARTCARD, None, None
+        hcard = next(self._ids)
+        self.handles[hcard] = reader
+        return SCARD_S_SUCCESS, hcard, SCARD_PROTOCOL_T1
+
+    def SCardReconnect(self, hcard, share_mode, protocols, initialization):
+        self.calls['SCardReconnect'] += 1
+        if hcard not in self.handles:
+            return SCARD_E_INVALID_HANDLE, None
+        if self.readers.get(self.handles[hcard]) is None:
+            return SCARD_E_NO_SMARTCARD, None
+        return SCARD_S_SUCCESS, SCARD_PROTOCOL_T1
+
+    def SCardDisconnect(self, hcard, disposition):
+        self.calls['SCardDisconnect'] += 1
+        self.handles.pop(hcard, None)
+        return SCARD_S_SUCCESS
+
+    def SCardTransmit(self, hcard, protocol, apdu):
+        self.calls['SCardTransmit'] += 1
+        uid = self.readers.get(self.handles.get(hcard))
+        if uid is None:
+            return SCARD_E_NO_SMARTCARD, []
+        return SCARD_S_SUCCESS, list(uid) + STATUS_OK
+
+
+# the API is used as module, so the constants have to be attributes of the fake as well
+for _name, _value in list(globals().items()):
+    if _name.startswith('SCARD_') or _name == 'INFINITE':
+        setattr(FakeSCard, _name, _value)
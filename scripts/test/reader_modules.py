@@ -0,0 +1,29 @@
+# Load the Reader.py.* variants and other scripts, which are not importable by their file name.
+
+import os
+import sys
+import types
+from importlib.machinery import SourceFileLoader
+
+from mock import MagicMock, patch
+
+SCRIPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+COMPONENTS_PATH = os.path.join(SCRIPTS_PATH, '..', 'components')
+
+
+def load_source(path, name):
+    with patch.dict(sys.modules, {'RPi': MagicMock(), 'RPi.GPIO': MagicMock()}):
+        loader = SourceFileLoader(name, path)
+        module = types.ModuleType(loader.name)
+        module.__file__ = path
+        loader.exec_module(module)
+    return module
+
+
+def load_reader(filename):
+    return load_source(os.path.join(SCRIPTS_PATH, filename), filename.replace('.', '_'))
+
+
+def load_component(*path):
+    """Load a script of a component, e.g. load_component('bluetooth-sink-switch', 'bt-sink-switch.py')"""
+    return load_source(os.path.join(COMPONENTS_PATH, *path), os.path.splitext(path[-1])[0].replace('-', '_'))
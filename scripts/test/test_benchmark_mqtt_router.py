@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip('paho.mqtt')
+pytest.importorskip('inotify')
+
+from benchmark_mqtt_router import MESSAGES, load_daemon, report, route_router, run_benchmark  # noqa: E402
+
+
+def test_messages_are_routed():
+    daemon = load_daemon()
+    routes = [route_router(daemon, topic, payload) for topic, payload in MESSAGES]
+    assert routes[-1] is None
+    assert all(routes[:-1])
+
+
+def test_run_benchmark():
+    results = run_benchmark(messages=100)
+    assert set(results) == {'router', 'regex'}
+    assert 'msgs/s' in report(results)
@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip('evdev')
+
+from benchmark_swipe_latency import STAGES, percentile, report, run_benchmark  # noqa: E402
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3], 99) == 3
+
+
+def test_run_benchmark():
+    results = run_benchmark(swipes=3, interval=0)
+    for stage in STAGES:
+        assert len(results[stage]) == 3
+        assert min(results[stage]) >= 0
+    assert 'p99 ms' in report(results)
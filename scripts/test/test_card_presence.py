@@ -0,0 +1,151 @@
+import time
+
+import pytest
+from mock import MagicMock, call, patch
+
+from card_presence import CardPresence, PresenceTracker, read_ms_setting
+from daemon_rfid_reader import RfidDaemon
+from mpd_client import MPDNotSentError
+
+
+class FakeLoop:
+    """Collects the timers, which are then fired by the test"""
+
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback, *args):
+        timer = MagicMock(delay=delay, callback=callback, cancelled=False)
+        timer.cancel.side_effect = lambda: setattr(timer, 'cancelled', True)
+        self.timers.append(timer)
+        return timer
+
+    def fire(self):
+        timer = [timer for timer in self.timers if not timer.cancelled][-1]
+        timer.cancelled = True
+        timer.callback()
+        return timer.delay
+
+
+@pytest.fixture
+def loop():
+    return FakeLoop()
+
+
+@pytest.fixture
+def callbacks():
+    return MagicMock()
+
+
+@pytest.fixture
+def tracker(loop, callbacks):
+    return PresenceTracker(loop, callbacks.placed, callbacks.removed, callbacks.replaced,
+                           removal_grace=0.3, replace_window=5.0)
+
+
+def test_repeated_reads_keep_card_present(tracker, loop, callbacks):
+    tracker.seen('1234')
+    tracker.seen('1234')
+    tracker.seen('1234')
+    assert tracker.state == CardPresence.PRESENT
+    assert callbacks.mock_calls == [call.placed('1234')]
+    assert len([timer for timer in loop.timers if not timer.cancelled]) == 1
+
+
+def test_removal_after_grace(tracker, loop, callbacks):
+    tracker.seen('1234')
+    assert loop.fire() == 0.3
+    assert tracker.state == CardPresence.REMOVED
+    assert callbacks.mock_calls == [call.placed('1234'), call.removed('1234')]
+    assert loop.fire() == 5.0
+    assert tracker.state == CardPresence.ABSENT
+
+
+def test_replace_within_window_resumes(tracker, loop, callbacks):
+    tracker.seen('1234')
+    loop.fire()
+    tracker.seen('1234')
+    assert tracker.state == CardPresence.PRESENT
+    assert callbacks.mock_calls == [call.placed('1234'), call.removed('1234'), call.replaced('1234')]
+
+
+def test_other_card_within_window_is_placed(tracker, loop, callbacks):
+    tracker.seen('1234')
+    loop.fire()
+    tracker.seen('5678')
+    assert callbacks.mock_calls == [call.placed('1234'), call.removed('1234'), call.placed('5678')]
+
+
+def test_replace_after_window_is_placed(tracker, loop, callbacks):
+    tracker.seen('1234')
+    loop.fire()
+    loop.fire()
+    tracker.seen('1234')
+    assert callbacks.mock_calls[-1] == call.placed('1234')
+
+
+def test_read_ms_setting(tmp_path):
+    setting = tmp_path / 'Place_Removal_Grace_Ms'
+    assert read_ms_setting(str(setting), 1000) == 1000
+    setting.write_text('250\n')
+    assert read_ms_setting(str(setting), 1000) == 250
+    setting.write_text('fast\n')
+    assert read_ms_setting(str(setting), 1000) == 1000
+
+
+@pytest.fixture
+def daemon(tmp_path, loop):
+    settings = tmp_path / 'settings'
+    settings.mkdir()
+    (tmp_path / 'scripts').mkdir()
+    for name, value in (('Second_Swipe_Pause', '0'), ('Second_Swipe_Pause_Controls', 'OFF'),
+                        ('Swipe_or_Place', 'PLACENOTSWIPE'), ('global.conf', ''), ('Place_Replace_Window_Ms', '3000')):
+        (settings / name).write_text(value + '\n')
+    card_trigger = MagicMock()
+    card_trigger.mpd.status.return_value = {'state': 'play'}
+    return RfidDaemon(MagicMock(), str(tmp_path / 'scripts'), card_trigger, loop=loop)
+
+
+def test_daemon_pauses_and_resumes_in_process(daemon, loop):
+    mpd = daemon.card_trigger.mpd
+    daemon.on_card('1234')
+    daemon.on_card('1234')
+    daemon.card_trigger.trigger.assert_called_once_with('1234')
+
+    assert loop.fire() == 1.0
+    mpd.execute.assert_called_once_with('pause', 1)
+
+    mpd.status.return_value = {'state': 'pause'}
+    daemon.on_card('1234')
+    assert mpd.execute.call_args == call('pause', 0)
+    daemon.card_trigger.trigger.assert_called_once_with('1234')
+
+
+def test_daemon_reads_a_card_on_the_reader_at_the_minimum_interval(daemon):
+    daemon.loop = MagicMock()
+    daemon.min_read_interval = 0.05
+    daemon.reader.readCard.side_effect = ['1234', '1234', '1234', OSError('unplugged')]
+    started = time.monotonic()
+    daemon.read_cards()
+    assert time.monotonic() - started >= 0.15
+    assert daemon.loop.call_soon_threadsafe.call_count == 4
+
+
+@pytest.mark.parametrize('error, fallback', [
+    (MPDNotSentError('refused'), True),
+    # MPD may have executed the command already
+    (ConnectionError('closed'), False),
+    (ValueError('malformed shortcut'), False),
+])
+def test_daemon_falls_back_only_if_nothing_was_sent(daemon, error, fallback):
+    daemon.card_trigger.trigger.side_effect = error
+    with patch('daemon_rfid_reader.subprocess.call') as mock_call:
+        daemon.handle_card('1234')
+    assert mock_call.called == fallback
+
+
+def test_daemon_pauses_with_the_script_without_mpd(daemon):
+    daemon.mpd.status.side_effect = OSError('refused')
+    with patch('daemon_rfid_reader.subprocess.call') as mock_call:
+        daemon.pause_player('1234')
+    mock_call.assert_called_once_with([daemon.dir_path + '/playout_controls.sh -c=playerpauseforce -v=0.1'], shell=True)
@@ -0,0 +1,132 @@
+import time
+
+import pytest
+from command_executor import CommandCoalescer, CommandExecutor, CommandMetrics, class_of, percentile
+
+
+@pytest.fixture
+def executor():
+    return CommandExecutor(max_queued=8, timeouts={'volume': 0.5})
+
+
+@pytest.fixture
+def submitted():
+    return []
+
+
+@pytest.fixture
+def coalescer(submitted):
+    return CommandCoalescer(lambda *command: submitted.append(command), window=0.05)
+
+
+def lines(path):
+    return path.read().split()
+
+
+def test_commands_of_a_class_run_in_order(executor, tmpdir):
+    log = tmpdir.join('log')
+    # the first one takes longest, but the others wait for it
+    for step, delay in ((1, 0.2), (2, 0.1), (3, 0)):
+        assert executor.submit('player', 'sleep {}; echo {} >> {}'.format(delay, step, log))
+    assert executor.wait_idle(2)
+    assert lines(log) == ['1', '2', '3']
+
+
+def test_classes_run_in_parallel(executor, tmpdir):
+    log = tmpdir.join('log')
+    executor.submit('player', 'sleep 0.3; echo player >> {}'.format(log))
+    executor.submit('volume', 'echo volume >> {}'.format(log))
+    assert executor.wait_idle(2)
+    assert lines(log) == ['volume', 'player']
+
+
+def test_timeout_kills_children(executor, tmpdir):
+    log = tmpdir.join('log')
+    started = time.monotonic()
+    executor.submit('volume', '(sleep 1; echo child >> {}) & sleep 5'.format(log))
+    assert executor.wait_idle(2)
+    assert time.monotonic() - started < 1
+    assert executor.metrics['volume'].timeouts == 1
+    time.sleep(1)
+    assert not log.exists()
+
+
+def test_queue_is_bounded(executor):
+    results = [executor.submit('player', 'sleep 0.2') for _ in range(12)]
+    # one is running, 8 wait
+    assert results.count(False) in (3, 4)
+    assert executor.metrics['player'].dropped == results.count(False)
+    assert executor.wait_idle(5)
+
+
+def test_functions_and_done(executor):
+    done = []
+
+    def fail():
+        raise ValueError('failed')
+
+    executor.submit('get', lambda: None, done=done.append)
+    executor.submit('get', fail, done=done.append)
+    executor.submit('player', 'exit 3', done=done.append)
+    assert executor.wait_idle(2)
+    assert sorted(done) == [0, 1, 3]
+    assert executor.metrics['get'].failed == 1
+
+
+def test_stats(executor):
+    executor.submit('player', 'true')
+    executor.submit('player', 'false')
+    assert executor.wait_idle(2)
+    stats = executor.stats()['player']
+    assert stats['executed'] == 2
+    assert stats['failed'] == 1
+    assert stats['wait_ms_p50'] >= 0
+    assert 'duration_ms_p95' in stats
+
+
+def test_command_classes():
+    assert class_of('volumeup') == 'volume'
+    assert class_of('shutdown') == 'system'
+    assert class_of('playerplay') == 'player'
+
+
+def test_percentile():
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile(range(1, 101), 95) == 95
+    assert percentile([7], 95) == 7
+
+
+def test_metrics_history():
+    metrics = CommandMetrics(history=2)
+    for duration in (1, 2, 3):
+        metrics.record(0, duration, 0)
+    assert list(metrics.durations) == [2, 3]
+    assert metrics.executed == 3
+
+
+def test_coalescer_window(coalescer, submitted):
+    for _ in range(3):
+        coalescer.add('volume', 'volumeup', 2)
+    coalescer.add('player', 'playerseek', -10)
+    time.sleep(0.1)
+    assert sorted(submitted) == [('player', 'playerseek', -10), ('volume', 'volumeup', 6)]
+    assert coalescer.merged == 2
+
+
+def test_coalescer_keeps_the_order(coalescer, submitted):
+    coalescer.add('volume', 'volumeup', 1)
+    coalescer.add('volume', 'volumedown', 1)
+    coalescer.add('volume', 'volumeup', 1)
+    coalescer.flush()
+    assert submitted == [('volume', 'volumeup', 1), ('volume', 'volumedown', 1), ('volume', 'volumeup', 1)]
+
+
+def test_coalescer_replaces(coalescer, submitted):
+    # an absolute seek replaces the relative ones, but a relative one is not added to an absolute one
+    coalescer.add('player', 'playerseek', 10)
+    coalescer.add('player', 'playerseek', '90', replace=True)
+    coalescer.add('player', 'playerseek', '30', replace=True)
+    coalescer.add('player', 'playerseek', 5)
+    coalescer.flush('player')
+    assert submitted == [('player', 'playerseek', '30'), ('player', 'playerseek', 5)]
+    assert coalescer.merged == 2
@@ -0,0 +1,32 @@
+import threading
+import time
+
+from event_loop import EventLoop
+
+
+def test_timers_fire_in_order():
+    loop = EventLoop()
+    fired = []
+    loop.call_later(0.02, fired.append, 'second')
+    loop.call_later(0.01, fired.append, 'first')
+    cancelled = loop.call_later(0.005, fired.append, 'cancelled')
+    cancelled.cancel()
+    loop.call_later(0.03, loop.stop)
+    started = time.monotonic()
+    loop.run()
+    assert fired == ['first', 'second']
+    assert time.monotonic() - started < 0.5
+
+
+def test_events_from_other_threads():
+    loop = EventLoop()
+    received = []
+
+    def push():
+        loop.call_soon_threadsafe(received.append, threading.current_thread())
+        loop.stop()
+
+    threading.Thread(target=push).start()
+    loop.run()
+    assert len(received) == 1
+    assert received[0] is not threading.current_thread()
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+from mock import MagicMock, patch
+
+from fake_mpd import FakeMPD
+from mpd_client import MPDConnection, MPDError, parse_objects
+from reader_modules import load_component
+
+SONGS = [{'file': 'Moby Dick/{:02}.mp3'.format(track), 'Title': 'Chapter {}'.format(track), 'duration': '90.500'}
+         for track in range(1, 4)]
+
+
+@pytest.fixture
+def fake_mpd():
+    with FakeMPD() as server:
+        yield server
+
+
+@pytest.fixture
+def mpd(fake_mpd):
+    connection = MPDConnection(port=fake_mpd.port)
+    yield connection
+    connection.disconnect()
+
+
+@pytest.fixture
+def bt_sink_switch():
+    return load_component('bluetooth-sink-switch', 'bt-sink-switch.py')
+
+
+def test_playback(fake_mpd, mpd):
+    fake_mpd.add_songs(*SONGS)
+    mpd.execute('play')
+    status, currentsong = mpd.command_list_dict('status', 'currentsong')
+    assert status['state'] == 'play'
+    assert status['duration'] == '90.500'
+    assert status['time'] == '0:90'
+    assert currentsong['Title'] == 'Chapter 1'
+
+    mpd.execute('next')
+    assert mpd.currentsong()['Pos'] == '1'
+    mpd.execute('previous')
+    assert mpd.currentsong()['Pos'] == '0'
+    mpd.execute('pause')
+    assert mpd.status()['state'] == 'pause'
+    mpd.execute('play', 2)
+    mpd.execute('next')
+    assert mpd.status()['state'] == 'stop'
+
+    mpd.execute('repeat', 1)
+    mpd.execute('play', 2)
+    mpd.execute('next')
+    assert mpd.currentsong()['Title'] == 'Chapter 1'
+
+
+def test_queue_and_playlists(fake_mpd, mpd):
+    mpd.execute('add', 'Moby Dick/01.mp3')
+    mpd.execute('add', 'Moby Dick/02.mp3')
+    mpd.execute('delete', 0)
+    mpd.execute('save', 'Moby Dick')
+    assert parse_objects(mpd.execute('playlistinfo'), ('file',)) == [{'file': 'Moby Dick/02.mp3', 'Pos': '0', 'Id': '1'}]
+    assert mpd.execute('listplaylists') == [('playlist', 'Moby Dick')]
+    assert mpd.status()['playlistlength'] == '1'
+
+
+def test_outputs(mpd):
+    assert [output['outputenabled'] for output in mpd.outputs()] == ['1', '0']
+    mpd.command_list(('enableoutput', 1), ('disableoutput', 0))
+    assert [output['outputenabled'] for output in mpd.outputs()] == ['0', '1']
+    mpd.execute('toggleoutput', 0)
+    assert mpd.outputs()[0]['outputenabled'] == '1'
+    with pytest.raises(MPDError, match='No such audio output'):
+        mpd.execute('enableoutput', 5)
+
+
+@pytest.mark.parametrize('command', [('setvol', 'loud'), ('setvol', 101), ('play', 3), ('delete', 0), ('stop', 1)])
+def test_invalid_arguments(mpd, command):
+    with pytest.raises(MPDError, match=r'^ACK \[2@0\]'):
+        mpd.execute(*command)
+
+
+def test_latency(fake_mpd, mpd):
+    mpd.connect()
+    fake_mpd.set_latency('status', 0.05)
+    started = time.monotonic()
+    mpd.status()
+    assert time.monotonic() - started >= 0.05
+    started = time.monotonic()
+    mpd.currentsong()
+    assert time.monotonic() - started < 0.05
+
+    fake_mpd.set_latency('*', 0.02)
+    started = time.monotonic()
+    mpd.command_list('ping', 'ping', 'ping')
+    assert time.monotonic() - started >= 0.06
+
+
+def test_bt_check_mpc_err(fake_mpd, mpd, bt_sink_switch):
+    fake_mpd.add_songs(*SONGS)
+    bt_sink_switch.bt_check_mpc_err(mpd)
+    assert fake_mpd.received('play') == []
+
+    fake_mpd.update_status('player', error='Failed to open audio output')
+    bt_sink_switch.bt_check_mpc_err(mpd)
+    assert len(fake_mpd.received('play')) == 1
+    assert mpd.status()['state'] == 'play'
+
+
+def test_bt_enable_only(fake_mpd, mpd, bt_sink_switch):
+    fake_mpd.outputs[1]['outputenabled'] = '1'
+    bt_sink_switch.bt_enable_only(mpd, mpd.outputs(), bt_sink_switch.SPEAKERS)
+    assert [output['outputenabled'] for output in mpd.outputs()] == ['1', '0']
+    # the speakers come first, so there is always an output
+    assert fake_mpd.received('enableoutput')[0][0] < fake_mpd.received('disableoutput')[0][0]
+
+
+def test_bt_switch_sets_led_on_mpd_error(fake_mpd, bt_sink_switch):
+    # there are no headphones configured in MPD
+    del fake_mpd.outputs[1:]
+    bluetoothctl = MagicMock(stdout=b'Connected: yes')
+    with patch.object(bt_sink_switch, 'MPDConnection', lambda: MPDConnection(port=fake_mpd.port)), \
+            patch.object(bt_sink_switch, 'LED') as led, \
+            patch.object(bt_sink_switch.subprocess, 'run', return_value=bluetoothctl):
+        bt_sink_switch.bt_switch('headphones', led_pin=6)
+    led.return_value.on.assert_called_once_with()
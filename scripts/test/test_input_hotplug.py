@@ -0,0 +1,126 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from input_hotplug import InputDeviceManager, is_input_device_added, parse_uevent
+
+ADD_EVENT = (b'add@/devices/platform/soc/usb1/1-1/1-1.2/input/input7/event3\0ACTION=add\0'
+             b'DEVPATH=/devices/platform/soc/usb1/1-1/1-1.2/input/input7/event3\0SUBSYSTEM=input\0'
+             b'MAJOR=13\0MINOR=67\0DEVNAME=input/event3\0SEQNUM=2456\0')
+
+
+class FakeMonitor:
+    """Uevents are sent by the test through a socketpair"""
+
+    def __init__(self):
+        self.sock, self.sender = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def receive(self):
+        return parse_uevent(self.sock.recv(8192))
+
+    def close(self):
+        self.sock.close()
+        self.sender.close()
+
+
+class FakeDevice:
+
+    def __init__(self, name, phys):
+        self.name = name
+        self.phys = phys
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_parse_uevent():
+    event = parse_uevent(ADD_EVENT)
+    assert event['ACTION'] == 'add'
+    assert event['DEVNAME'] == 'input/event3'
+    assert is_input_device_added(event)
+    assert not is_input_device_added(dict(event, ACTION='remove'))
+    assert not is_input_device_added(dict(event, DEVNAME='input/mouse0'))
+
+
+def test_find_prefers_same_phys():
+    other_port = FakeDevice('Reader', 'usb-1.3/input0')
+    same_port = FakeDevice('Reader', 'usb-1.2/input0')
+    keyboard = FakeDevice('Keyboard', 'usb-1.2/input0')
+    manager = InputDeviceManager('Reader', phys='usb-1.2/input0',
+                                 get_devices=lambda: [other_port, same_port, keyboard])
+    assert manager.find() is same_port
+    assert other_port.closed
+    assert not same_port.closed
+
+
+def test_find_by_name_on_new_port():
+    device = FakeDevice('Reader', 'usb-1.3/input0')
+    manager = InputDeviceManager('Reader', phys='usb-1.2/input0', get_devices=lambda: [device])
+    assert manager.find() is device
+    assert manager.phys == 'usb-1.3/input0'
+
+
+def test_wait_for_device_wakes_on_uevent():
+    devices = []
+    monitors = []
+
+    def create_monitor():
+        monitors.append(FakeMonitor())
+        return monitors[-1]
+
+    # the rescan interval is long, so only the uevent can wake up the manager in time
+    manager = InputDeviceManager('Reader', get_devices=lambda: list(devices), monitor_factory=create_monitor,
+                                 rescan_interval=10)
+
+    def plug_in():
+        while not monitors:
+            time.sleep(0.01)
+        devices.append(FakeDevice('Reader', 'usb-1.2/input0'))
+        monitors[0].sender.send(ADD_EVENT)
+
+    threading.Thread(target=plug_in).start()
+    start = time.monotonic()
+    assert manager.wait_for_device().phys == 'usb-1.2/input0'
+    assert time.monotonic() - start < 5
+    assert monitors[0].sock.fileno() == -1
+
+
+def test_wait_for_device_without_monitor():
+    devices = []
+
+    def no_monitor():
+        raise OSError('netlink not available')
+
+    manager = InputDeviceManager('Reader', get_devices=lambda: list(devices), monitor_factory=no_monitor,
+                                 rescan_interval=0.01)
+    threading.Timer(0.05, devices.append, [FakeDevice('Reader', '')]).start()
+    assert manager.wait_for_device() is devices[0]
+
+
+def test_reader_reattached_after_unplug():
+    pytest.importorskip('evdev')
+    from benchmark_swipe_latency import create_reader
+    from fake_evdev import ReplayDevice, card_events
+
+    device = ReplayDevice(phys='usb-1.2/input0')
+    reader = create_reader(device)
+    assert reader.dev is device
+    device.push(card_events('0001234567'))
+    assert reader.readCard() == '0001234567'
+
+    replugged = ReplayDevice(phys='usb-1.2/input0')
+    replugged.push(card_events('0002345678'))
+    reader.device_manager.get_devices = lambda: [replugged]
+    reader.device_manager.monitor_factory = FakeMonitor
+    device.unplug()
+    assert reader.readCard() == '0002345678'
+    assert reader.dev is replugged
+    assert device.closed
+    assert len(reader.device_manager.reconnect_latencies) == 1
+    replugged.close()
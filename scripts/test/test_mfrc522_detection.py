@@ -0,0 +1,58 @@
+import pytest
+from mock import MagicMock
+
+from mfrc522_detection import IRQ, POLL, IrqDetector, PollingDetector, create_detector, read_detection_mode
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_polling_backs_off_when_idle(clock):
+    read_function = MagicMock(side_effect=[None] * 30 + ['1234'])
+    detector = PollingDetector(read_function, min_interval=0.05, max_interval=0.5, idle_after=1.0,
+                               clock=clock, sleep=clock.sleep)
+    assert detector.readCard() == '1234'
+    # fast polls during the first second, then growing up to the maximum interval
+    assert clock.sleeps[:20] == [0.05] * 20
+    assert clock.sleeps[20] == pytest.approx(0.075)
+    assert clock.sleeps[-1] == 0.5
+    assert detector.stats.polls == 31
+    assert detector.stats.reads == 1
+    assert detector.stats.idle_time == pytest.approx(sum(clock.sleeps))
+    assert detector.interval == 0.05
+
+
+def test_irq_waits_for_tag(clock):
+    device = MagicMock()
+    device.wait_for_tag.side_effect = lambda: clock.sleep(2.0)
+    detector = IrqDetector(device, MagicMock(side_effect=['1234', None]), clock=clock)
+    assert detector.readCard() == '1234'
+    assert detector.readCard() is None
+    assert detector.stats.polls == 2
+    assert detector.stats.reads == 1
+    assert detector.stats.idle_time == 4.0
+
+
+def test_read_detection_mode(tmp_path):
+    assert read_detection_mode(str(tmp_path)) == IRQ
+    (tmp_path / 'Rfidreader_Rc522_Detection').write_text('POLL')
+    assert read_detection_mode(str(tmp_path)) == POLL
+    assert isinstance(create_detector(POLL, MagicMock(), MagicMock()), PollingDetector)
+    (tmp_path / 'Rfidreader_Rc522_Detection').write_text('SOMETIMES')
+    assert read_detection_mode(str(tmp_path)) == IRQ
@@ -0,0 +1,119 @@
+import select
+import threading
+import time
+
+import pytest
+
+from fake_mpd import FakeMPD
+from mpd_client import MPDConnection, MPDError, MPDNotSentError, parse_objects
+
+
+@pytest.fixture
+def fake_mpd():
+    with FakeMPD() as server:
+        yield server
+
+
+@pytest.fixture
+def mpd(fake_mpd):
+    connection = MPDConnection(port=fake_mpd.port)
+    yield connection
+    connection.disconnect()
+
+
+def test_execute_dict(mpd, fake_mpd):
+    assert mpd.status()['volume'] == '50'
+    mpd.execute('setvol', 30)
+    assert mpd.status()['volume'] == '30'
+    assert fake_mpd.received('setvol')[0][1] == ['30']
+    assert mpd.mpd_version == '0.21.0'
+
+
+def test_command_list(mpd, fake_mpd):
+    fake_mpd.currentsong = {'file': 'Moby Dick/01.mp3', 'Title': 'Loomings'}
+    status, currentsong = mpd.command_list_dict('status', 'currentsong')
+    assert status['state'] == 'stop'
+    assert currentsong['Title'] == 'Loomings'
+
+    assert mpd.command_list(('setvol', 20), ('repeat', 1), 'ping') == [[], [], []]
+    assert fake_mpd.status['volume'] == '20'
+    assert fake_mpd.status['repeat'] == '1'
+
+
+def test_command_list_stops_at_error(mpd, fake_mpd):
+    with pytest.raises(MPDError):
+        mpd.command_list(('setvol', 20), 'unknown', ('repeat', 1))
+    assert fake_mpd.received('repeat') == []
+    # the connection is still in sync
+    assert mpd.status()['volume'] == '20'
+
+
+def test_reconnect(mpd, fake_mpd):
+    mpd.status()
+    # the server drops the connection, e.g. after MPD restarted
+    mpd._sock.shutdown(2)
+    assert mpd.currentsong() == {}
+    assert mpd.is_connected
+
+
+def test_closed_by_mpd(mpd, fake_mpd):
+    mpd.status()
+    # like after the connection_timeout of MPD
+    mpd._send('close')
+    select.select([mpd._sock], [], [], 1)
+    assert mpd.status()['volume'] == '50'
+
+
+def test_sent_command_is_not_repeated(fake_mpd):
+    mpd = MPDConnection(port=fake_mpd.port, timeout=0.2)
+    fake_mpd.add_songs({'file': 'Moby Dick/01.mp3'}, {'file': 'Moby Dick/02.mp3'}, {'file': 'Moby Dick/03.mp3'})
+    mpd.execute('play')
+    fake_mpd.set_latency('next', 0.5)
+    with pytest.raises(OSError) as error:
+        mpd.execute('next')
+    assert not isinstance(error.value, MPDNotSentError)
+    assert not mpd.is_connected
+    fake_mpd.set_latency('next', 0)
+    time.sleep(0.5)
+    assert len(fake_mpd.received('next')) == 1
+    assert mpd.currentsong()['Pos'] == '1'
+    mpd.disconnect()
+
+
+def test_not_sent(fake_mpd):
+    mpd = MPDConnection(port=fake_mpd.port)
+    fake_mpd.stop()
+    with pytest.raises(MPDNotSentError):
+        mpd.execute('next')
+    assert fake_mpd.received('next') == []
+
+
+def test_shared_between_threads(mpd, fake_mpd):
+    errors = []
+
+    def poll():
+        try:
+            for _ in range(50):
+                status, currentsong = mpd.command_list_dict('status', 'currentsong')
+                assert 'volume' in status
+                assert 'volume' not in currentsong
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=poll) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(fake_mpd.received('status')) == 200
+
+
+def test_parse_objects():
+    pairs = [('outputid', '0'), ('outputname', 'Speakers'), ('outputenabled', '1'),
+             ('outputid', '1'), ('outputname', 'Headphones'), ('outputenabled', '0')]
+    assert parse_objects(pairs, ('outputid',)) == [
+        {'outputid': '0', 'outputname': 'Speakers', 'outputenabled': '1'},
+        {'outputid': '1', 'outputname': 'Headphones', 'outputenabled': '0'},
+    ]
+    assert parse_objects([], ('file',)) == []
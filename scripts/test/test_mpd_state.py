@@ -0,0 +1,101 @@
+import queue
+import socket
+
+import pytest
+
+from fake_mpd import FakeMPD
+from mpd_client import MPDConnection
+from mpd_state import CONNECTION, DISCONNECTED, MPDState, MPDStateService
+
+
+@pytest.fixture
+def fake_mpd():
+    with FakeMPD() as server:
+        yield server
+
+
+@pytest.fixture
+def events():
+    return queue.Queue()
+
+
+@pytest.fixture
+def service(fake_mpd, events):
+    _service = MPDStateService(port=fake_mpd.port, retry_interval=0.05)
+    _service.subscribe(lambda state, changed: events.put((state, changed)))
+    yield _service.start()
+    _service.stop()
+
+
+def test_initial_state(service, events):
+    state, changed = events.get(timeout=2)
+    assert changed == {CONNECTION}
+    assert state.connected
+    assert state.status['volume'] == '50'
+    assert service.state is state
+
+
+def test_change_is_published(fake_mpd, service, events):
+    events.get(timeout=2)
+    fake_mpd.wait_for('idle')
+    mpd = MPDConnection(port=fake_mpd.port)
+    mpd.execute('setvol', 30)
+    mpd.disconnect()
+    state, changed = events.get(timeout=2)
+    assert changed == {'mixer'}
+    assert state.status['volume'] == '30'
+
+
+def test_subscribe_to_subsystems(fake_mpd, service, events):
+    events.get(timeout=2)
+    fake_mpd.wait_for('idle')
+    options = queue.Queue()
+    service.subscribe(lambda state, changed: options.put(changed), subsystems=('options',))
+    fake_mpd.notify('mixer')
+    assert events.get(timeout=2)[1] == {'mixer'}
+    fake_mpd.notify('options')
+    assert events.get(timeout=2)[1] == {'options'}
+    assert options.get(timeout=2) == {'options'}
+    assert options.empty()
+
+
+def test_failing_subscriber(fake_mpd, service, events):
+    def fail(state, changed):
+        raise RuntimeError('subscriber failed')
+
+    service.subscribe(fail)
+    events.get(timeout=2)
+    fake_mpd.wait_for('idle')
+    fake_mpd.notify('player')
+    assert events.get(timeout=2)[1] == {'player'}
+
+
+def test_lost_and_reconnected(fake_mpd, service, events):
+    events.get(timeout=2)
+    fake_mpd.wait_for('idle')
+    # MPD is restarted
+    service.mpd.shutdown()
+    state, changed = events.get(timeout=2)
+    assert state is DISCONNECTED
+    assert changed == {CONNECTION}
+    state, changed = events.get(timeout=2)
+    assert state.connected
+    assert changed == {CONNECTION}
+
+
+def test_mpd_not_running(events):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    service = MPDStateService(port=port, retry_interval=0.01).start()
+    service.stop()
+    assert service.state is DISCONNECTED
+
+
+def test_elapsed():
+    playing = MPDState({'state': 'play', 'elapsed': '10.5'}, {}, 100.0)
+    assert playing.elapsed(now=102.0) == 12.5
+    paused = MPDState({'state': 'pause', 'elapsed': '10.5'}, {}, 100.0)
+    assert paused.elapsed(now=102.0) == 10.5
+    with pytest.raises(KeyError):
+        MPDState({'state': 'stop'}, {}, 100.0).elapsed()
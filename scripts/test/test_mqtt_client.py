@@ -0,0 +1,372 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from reader_modules import load_component
+
+mqtt = pytest.importorskip('paho.mqtt.client')
+mqtt_enum = pytest.importorskip('paho.mqtt.enums')
+pytest.importorskip('inotify')
+
+
+class Message:
+
+    def __init__(self, topic, payload=''):
+        self.topic = topic
+        self.payload = payload.encode('utf-8')
+
+
+class RecordingClient:
+
+    def __init__(self):
+        self.published = []
+        self.subscribed = []
+        self.delays = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((topic, payload, retain))
+
+    def subscribe(self, topic):
+        self.subscribed.append(topic)
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        self.delays.append(max_delay)
+
+    def topics(self):
+        topics = [topic for topic, payload, retain in self.published]
+        self.published.clear()
+        return topics
+
+
+def send(daemon, topic, payload=''):
+    return daemon.router.dispatch('phoniebox/' + topic, payload)
+
+
+@pytest.fixture
+def daemon():
+    module = load_component('smart-home-automation', 'MQTT-protocol', 'daemon_mqtt_client.py')
+    module.client = module.ReconnectingClient(RecordingClient())
+    module.client.connected = True
+    module.values = {'state': 'play', 'volume': '30', 'elapsed': '00:00:01'}
+    module.collectors = module.Collectors([module.Collector('player', lambda: dict(module.values))])
+    return module
+
+
+def test_only_changes_are_published(daemon):
+    daemon.processGet('all')
+    assert 'phoniebox/attribute/volume' in daemon.client.mqtt.topics()
+
+    daemon.values['elapsed'] = '00:00:06'
+    daemon.processGet('all')
+    topics = daemon.client.mqtt.topics()
+    assert 'phoniebox/attribute/elapsed' in topics
+    assert 'phoniebox/attribute/volume' not in topics
+    assert 'phoniebox/attribute/state' not in topics
+    assert daemon.publishedState.suppressed >= 2
+
+
+def test_attributes_are_retained(daemon):
+    daemon.processGet('all')
+    assert all(retain for topic, payload, retain in daemon.client.mqtt.published)
+
+
+def test_resync(daemon):
+    daemon.processGet('all')
+    published = len(daemon.client.mqtt.topics())
+    daemon.processGet('all', force=True)
+    assert len(daemon.client.mqtt.topics()) == published + len(daemon.diagnosticAttributes)
+
+
+def test_get_request_is_always_answered(daemon):
+    daemon.processGet('all')
+    daemon.client.mqtt.topics()
+    daemon.processGet('volume', force=True)
+    assert daemon.client.mqtt.topics() == ['phoniebox/attribute/volume']
+
+
+def test_reset_on_connect(daemon):
+    daemon.processGet('all')
+    published = len(daemon.client.mqtt.topics())
+    daemon.publishedState.reset()
+    daemon.processGet('all')
+    assert len(daemon.client.mqtt.topics()) == published
+
+
+def test_diagnostics_are_published_on_request(daemon):
+    daemon.config['mqttStateJson'] = True
+    daemon.processGet('all')
+    daemon.client.mqtt.topics()
+    daemon.processGet('all')
+    # the counters changed, but they are not part of the state
+    assert daemon.client.mqtt.topics() == []
+    assert daemon.stateDocument.sequence == 1
+    assert 'published_messages' not in daemon.stateDocument.attributes
+
+    daemon.processGet('published_messages', force=True)
+    assert daemon.client.mqtt.published == [('phoniebox/attribute/published_messages', '3', False)]
+    daemon.client.mqtt.topics()
+    daemon.processGet('all', force=True)
+    topics = daemon.client.mqtt.topics()
+    assert 'phoniebox/attribute/volume' in topics
+    assert 'phoniebox/attribute/mqtt_downtime' in topics
+
+
+class ShellCalls(list):
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+
+def test_state_json_is_optional(daemon):
+    daemon.processGet('all')
+    assert 'phoniebox/state/json' not in daemon.client.mqtt.topics()
+
+
+def test_state_json(daemon):
+    daemon.config['mqttStateJson'] = True
+    daemon.processGet('all')
+    topic, payload, retain = daemon.client.mqtt.published[-1]
+    assert topic == 'phoniebox/state/json'
+    assert retain
+    document = json.loads(payload)
+    assert document['sequence'] == 1
+    assert document['timestamp'] > 0
+    assert document['attributes']['volume'] == '30'
+    assert '": ' not in payload
+
+    daemon.values['volume'] = '35'
+    daemon.processGet('all')
+    document = json.loads(daemon.client.mqtt.published[-1][1])
+    assert document['sequence'] == 2
+    assert document['attributes']['volume'] == '35'
+
+
+@pytest.fixture
+def shell(daemon):
+    """Records the commands run by the command executor, which wait until released"""
+    calls = ShellCalls()
+
+    def call(command_class, cmd):
+        calls.release.wait(5)
+        calls.append(cmd.replace(daemon.path + '/', ''))
+        return 0
+
+    daemon.commandExecutor.run_shell = call
+    yield calls
+    calls.release.set()
+
+
+def wait_for(calls, count, timeout=2):
+    deadline = time.monotonic() + timeout
+    while len(calls) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return calls
+
+
+def test_on_message_does_not_wait_for_command(daemon, shell):
+    started = time.monotonic()
+    daemon.on_message(daemon.client, None, Message('phoniebox/cmd/playerplay'))
+    daemon.on_message(daemon.client, None, Message('phoniebox/get/volume'))
+    assert time.monotonic() - started < 0.1
+    shell.release.set()
+    assert wait_for(shell, 1) == ['playout_controls.sh -c=playerplay']
+
+
+def test_repeated_commands_are_combined(daemon, shell):
+    # keep the workers busy
+    send(daemon, 'cmd/mute')
+    send(daemon, 'cmd/playerstop')
+    while daemon.commandExecutor.queued():
+        time.sleep(0.01)
+
+    for _ in range(20):
+        send(daemon, 'cmd/volumeup')
+    send(daemon, 'cmd/playerseek', '+10')
+    send(daemon, 'cmd/playerseek', '-15')
+    send(daemon, 'cmd/setvolume', '20')
+    shell.release.set()
+    assert sorted(wait_for(shell, 5)) == ['playout_controls.sh -c=mute',
+                                          'playout_controls.sh -c=playerseek -v=-5',
+                                          'playout_controls.sh -c=playerstop',
+                                          'playout_controls.sh -c=setvolume -v=20',
+                                          'playout_controls.sh -c=volumeup -v=20']
+    assert daemon.commandCoalescer.merged == 20
+
+
+def test_commands_of_a_class_keep_their_order(daemon, shell):
+    for command in ('volumeup', 'mute', 'volumeup', 'volumedown'):
+        send(daemon, 'cmd/' + command)
+    shell.release.set()
+    assert wait_for(shell, 4) == ['playout_controls.sh -c=volumeup -v=1',
+                                  'playout_controls.sh -c=mute',
+                                  'playout_controls.sh -c=volumeup -v=1',
+                                  'playout_controls.sh -c=volumedown -v=1']
+
+
+def test_classes_run_in_parallel(daemon, shell):
+    send(daemon, 'cmd/playfolder', 'Moby Dick')
+    send(daemon, 'cmd/volumeup')
+    time.sleep(0.05)
+    assert shell == []
+    shell.release.set()
+    assert len(wait_for(shell, 2)) == 2
+
+
+def test_full_queue_drops_commands(daemon, shell):
+    daemon.commandExecutor.max_queued = 2
+    for _ in range(4):
+        send(daemon, 'cmd/playerpause')
+    assert daemon.commandExecutor.metrics['player'].dropped >= 1
+
+
+def test_command_timeout(daemon):
+    daemon.commandExecutor.timeouts['volume'] = 0.1
+    started = time.monotonic()
+    daemon.commandExecutor.run_shell('volume', 'sleep 5')
+    assert time.monotonic() - started < 1
+
+
+def test_routes(daemon):
+    assert daemon.router.route('phoniebox/cmd/volumeup').commandClass == 'volume'
+    assert daemon.router.route('phoniebox/cmd/PlayerPlay').name == 'playerplay'
+    assert daemon.router.route('phoniebox/get/volume').attribute == 'volume'
+    assert daemon.router.route('phoniebox/cmd/unknown') is None
+    assert daemon.router.route('phoniebox/attribute/volume') is None
+    assert daemon.router.route('otherbox/cmd/volumeup') is None
+    # the base topic is no pattern
+    router = daemon.buildRouter('phonie.box')
+    assert router.route('phonie.box/cmd/volumeup') is not None
+    assert router.route('phonieXbox/cmd/volumeup') is None
+
+
+@pytest.mark.parametrize('command, payload', [
+    ('setvolume', '101'),
+    ('setvolume', 'loud'),
+    ('rfid', 'restart'),
+    ('playerrepeat', 'twice'),
+    ('swipecard', '1234; reboot'),
+    ('playfolder', "Moby Dick'; reboot; '"),
+    ('playfolder', ''),
+])
+def test_invalid_parameters_are_rejected(daemon, shell, command, payload):
+    assert not send(daemon, 'cmd/' + command, payload)
+    daemon.commandCoalescer.flush()
+    assert daemon.commandExecutor.queued() == 0
+
+
+def test_absolute_seek_is_not_summed(daemon, shell):
+    # the relative seek is not added to the absolute one, but the absolute one replaces the relative ones
+    for parameter in ('30', '+10', '-20', '90'):
+        send(daemon, 'cmd/playerseek', parameter)
+    shell.release.set()
+    assert wait_for(shell, 2) == ['playout_controls.sh -c=playerseek -v=30',
+                                  'playout_controls.sh -c=playerseek -v=90']
+
+
+def test_parameters_are_normalized(daemon, shell):
+    send(daemon, 'cmd/rfid', ' Stop ')
+    send(daemon, 'cmd/volumedown', 'ignored')
+    send(daemon, 'cmd/playerseek', '10')
+    shell.release.set()
+    assert sorted(wait_for(shell, 3)) == ['playout_controls.sh -c=playerseek -v=10',
+                                          'playout_controls.sh -c=volumedown -v=1',
+                                          'sudo /bin/systemctl stop phoniebox-rfid-reader.service']
+
+
+def test_help_is_answered_right_away(daemon):
+    send(daemon, 'get/help')
+    send(daemon, 'cmd/help')
+    assert daemon.client.mqtt.topics() == ['phoniebox/available_attributes',
+                                      'phoniebox/available_commands',
+                                      'phoniebox/available_commands_with_params']
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def offline(daemon):
+    daemon.readfile = lambda filepath: '2.8'
+    daemon.disk_stats = lambda: (29.5, 12.1)
+    daemon.client = daemon.ReconnectingClient(RecordingClient(), queueSize=3, clock=Clock())
+    return daemon.client
+
+
+def test_latest_message_per_topic_is_held_back(daemon, offline):
+    offline.publish('phoniebox/attribute/volume', '30', retain=True)
+    offline.publish('phoniebox/event/card_swiped', '0001234567')
+    offline.publish('phoniebox/attribute/volume', '35', retain=True)
+    offline.publish('phoniebox/attribute/state', 'play', retain=True)
+    offline.publish('phoniebox/attribute/title', 'Loomings', retain=True)
+    assert offline.mqtt.published == []
+    assert offline.dropped == 1
+
+    daemon.on_connect(offline.mqtt, offline, {}, 0)
+    assert offline.mqtt.subscribed == ['phoniebox/cmd/#', 'phoniebox/get/#']
+    assert offline.mqtt.published[0] == ('phoniebox/state', 'online', True)
+    assert offline.mqtt.published[-3:] == [('phoniebox/attribute/volume', '35', True),
+                                           ('phoniebox/attribute/state', 'play', True),
+                                           ('phoniebox/attribute/title', 'Loomings', True)]
+    offline.publish('phoniebox/attribute/volume', '40')
+    assert offline.mqtt.published[-1] == ('phoniebox/attribute/volume', '40', False)
+
+
+def test_reconnect_delay(daemon, offline):
+    offline.maxDelay = 8
+    delays = [offline.nextDelay() for _ in range(6)]
+    for delay, limit in zip(delays, [1, 2, 4, 8, 8, 8]):
+        assert limit / 2 <= delay <= limit
+    assert offline.mqtt.delays == delays
+
+    offline.onConnect()
+    assert offline.nextDelay() <= 1
+
+
+def test_reconnects_and_downtime(daemon, offline):
+    daemon.on_connect(offline.mqtt, offline, {}, 0)
+    assert offline.reconnects == 0
+
+    daemon.on_disconnect(offline.mqtt, offline, 7)
+    assert not offline.connected
+    offline.clock.now += 30
+    assert offline.getDowntime() == 30
+    daemon.on_connect_fail(offline.mqtt, offline)
+    offline.clock.now += 15
+    daemon.on_connect(offline.mqtt, offline, {}, 0)
+    assert offline.reconnects == 1
+    offline.clock.now += 60
+    assert offline.getDowntime() == 45
+
+    daemon.collectors = daemon.Collectors([])
+    result = daemon.fetchDiagnostics()
+    assert result['mqtt_reconnects'] == '1'
+    assert result['mqtt_downtime'] == '45'
+
+
+def test_paho_keeps_reconnecting(daemon):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    mqttClient = mqtt.Client(callback_api_version=mqtt_enum.CallbackAPIVersion.VERSION1)
+    client = daemon.ReconnectingClient(mqttClient, minDelay=0.05, maxDelay=0.1)
+    mqttClient.user_data_set(client)
+    mqttClient.on_connect_fail = daemon.on_connect_fail
+    mqttClient.connect_async('127.0.0.1', port)
+    mqttClient.loop_start()
+    try:
+        deadline = time.monotonic() + 3
+        while client.attempts < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert client.attempts >= 3
+    finally:
+        mqttClient.loop_stop()
@@ -0,0 +1,191 @@
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+from fake_mpd import FakeMPD
+from mpd_client import MPDConnection
+from reader_modules import load_component
+
+pytest.importorskip('paho.mqtt')
+pytest.importorskip('inotify')
+
+
+@pytest.fixture
+def daemon():
+    return load_component('smart-home-automation', 'MQTT-protocol', 'daemon_mqtt_client.py')
+
+
+@pytest.fixture
+def fake_mpd(daemon):
+    with FakeMPD() as server:
+        daemon.mpd = MPDConnection(port=server.port)
+        yield server
+        daemon.mpd.disconnect()
+
+
+def counting(values, calls, delay=0):
+    def collect():
+        calls.append(time.monotonic())
+        time.sleep(delay)
+        return dict(values)
+    return collect
+
+
+def test_get_duration(daemon):
+    assert daemon.getDuration({'duration': '90.500'}) == 90
+    assert daemon.getDuration({'time': '12:345'}) == 345
+    assert daemon.getDuration({}) == 0
+
+
+def test_get_repeat_mode(daemon):
+    assert daemon.get_repeat_mode('false', {'single': '1'}) == daemon.REPEAT_MODE_OFF
+    assert daemon.get_repeat_mode('true', {'single': '0'}) == daemon.REPEAT_MODE_PLAYLIST
+    assert daemon.get_repeat_mode('true', {'single': '1'}) == daemon.REPEAT_MODE_SINGLE
+
+
+def test_collect_player(daemon, fake_mpd):
+    fake_mpd.add_songs({'file': 'Moby Dick/01.mp3', 'Title': 'Loomings', 'Artist': 'Herman Melville',
+                        'duration': '3725.000'})
+    fake_mpd.update_status(repeat='1', single='1', volume='0')
+    assert daemon.collectPlayer()['state'] == 'stop'
+
+    daemon.mpd.execute('play')
+    result = daemon.collectPlayer()
+    assert result['state'] == 'play'
+    assert result['title'] == 'Loomings'
+    assert result['artist'] == 'Herman Melville'
+    assert result['album'] == '-'
+    assert result['duration'] == '01:02:05'
+    assert result['repeat_mode'] == 'single'
+    assert result['mute'] == 'true'
+
+
+def test_collect_player_without_mpd(daemon):
+    daemon.mpd = MPDConnection(port=1)
+    assert daemon.collectPlayer()['state'] == '-'
+
+
+def test_collectors_run_concurrently(daemon):
+    calls = []
+    collectors = daemon.Collectors([
+        daemon.Collector(name, counting({name: 'value'}, calls, delay=0.2)) for name in ('a', 'b', 'c')
+    ])
+    started = time.monotonic()
+    assert collectors.collect() == {'a': 'value', 'b': 'value', 'c': 'value'}
+    assert time.monotonic() - started < 0.5
+    assert 'a=' in collectors.durations()
+
+
+def test_collector_interval(daemon):
+    fast_calls, slow_calls = [], []
+    collectors = daemon.Collectors([
+        daemon.Collector('fast', counting({'fast': '1'}, fast_calls)),
+        daemon.Collector('slow', counting({'slow': '1'}, slow_calls), interval=60),
+    ])
+    collectors.collect()
+    assert collectors.collect() == {'fast': '1', 'slow': '1'}
+    assert len(fast_calls) == 2
+    assert len(slow_calls) == 1
+
+    collectors.invalidate()
+    collectors.collect()
+    assert len(slow_calls) == 2
+
+
+def test_collector_timeout(daemon):
+    release = threading.Event()
+    values = iter([{'slow': 'first'}, {'slow': 'second'}])
+    calls = []
+
+    def slow():
+        release.wait()
+        return next(values)
+
+    collectors = daemon.Collectors([
+        daemon.Collector('slow', slow, timeout=0.05),
+        daemon.Collector('fast', counting({'fast': '1'}, calls)),
+    ])
+    assert collectors.collect() == {'fast': '1'}
+    release.set()
+    time.sleep(0.05)
+    assert collectors.collect() == {'fast': '1', 'slow': 'second'}
+
+    # a slow collector keeps its last values and is not started twice
+    release.clear()
+    collectors.invalidate()
+    assert collectors.collect() == {'fast': '1', 'slow': 'second'}
+    assert collectors.collect() == {'fast': '1', 'slow': 'second'}
+    release.set()
+
+
+def test_failing_collector(daemon):
+    def fail():
+        raise FileNotFoundError('vcgencmd')
+
+    collectors = daemon.Collectors([
+        daemon.Collector('throttling', fail),
+        daemon.Collector('fast', lambda: {'fast': '1'}),
+    ])
+    assert collectors.collect() == {'fast': '1'}
+
+
+def test_fetch_data(daemon, fake_mpd):
+    daemon.collectors = daemon.Collectors([daemon.Collector('player', daemon.collectPlayer)])
+    daemon.client = daemon.ReconnectingClient(None)
+    fake_mpd.add_songs({'file': 'Moby Dick/01.mp3'})
+    daemon.mpd.execute('play')
+    result = daemon.fetchData()
+    assert result['title'] == 'Moby Dick/01.mp3'
+    assert daemon.fetchDiagnostics()['collector_durations'].startswith('player=')
+    assert daemon.refreshInterval == daemon.config['refreshIntervalPlaying']
+
+
+@pytest.fixture
+def settings(daemon, tmpdir):
+    for filename, value in (('Latest_RFID', '0001234567'), ('Max_Volume_Limit', '80'),
+                            ('Audio_Volume_Change_Step', '3'), ('Idle_Time_Before_Shutdown', '0')):
+        tmpdir.join(filename).write(value + '\n')
+    observer = daemon.SettingsObserver(str(tmpdir), daemon.settingsAttributes)
+    changes = queue.Queue()
+    observer.subscribe(lambda attribute, value: changes.put((attribute, value)))
+    observer.changes = changes
+    observer.start().watching.wait(2)
+    yield observer
+    observer.stop()
+
+
+def test_settings_are_read(settings):
+    assert settings.collect() == {'last_card': '0001234567', 'maxvolume': '80', 'volstep': '3', 'idletime': '0'}
+
+
+def test_changed_setting_is_pushed(settings, tmpdir):
+    tmpdir.join('Max_Volume_Limit').write('75\n')
+    assert settings.changes.get(timeout=2) == ('maxvolume', '75')
+    assert settings.collect()['maxvolume'] == '75'
+
+    # replaced by another file
+    tmpdir.join('Audio_Volume_Change_Step.new').write('5\n')
+    os.rename(str(tmpdir.join('Audio_Volume_Change_Step.new')), str(tmpdir.join('Audio_Volume_Change_Step')))
+    assert settings.changes.get(timeout=2) == ('volstep', '5')
+
+    tmpdir.join('global.conf').write('AUDIOVOLMAXLIMIT="75"\n')
+    assert settings.changes.empty()
+
+
+def test_swiped_card_is_published(daemon, settings, tmpdir):
+    published = []
+    daemon.client = daemon.ReconnectingClient(None)
+    daemon.client.publish = lambda topic, payload=None, qos=0, retain=False: published.append((topic, payload))
+    daemon.collectors = daemon.Collectors([daemon.Collector('settings', settings.collect)])
+    settings.subscribe(daemon.onSettingChanged)
+
+    tmpdir.join('Latest_RFID').write('0002345678\n')
+    settings.changes.get(timeout=2)
+    deadline = time.monotonic() + 2
+    while len(published) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert published[0] == ('phoniebox/event/card_swiped', '0002345678')
+    assert ('phoniebox/attribute/last_card', '0002345678') in published
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+import pytest
+from mock import patch
+
+from rdm6300 import CardRead, Rdm6300Decoder
+
+
+def frame(data):
+    """RDM6300 frame for the 10 hex digits data, including the checksum"""
+    checksum = 0
+    for value in bytes.fromhex(data):
+        checksum ^= value
+    return b'\x02' + '{}{:02X}'.format(data, checksum).encode('ascii') + b'\x03'
+
+
+def capture(card_count, repeat=3):
+    """Serial output of card_count cards, each held long enough to be sent repeat times, with some line noise"""
+    data = bytearray(b'\x00\xff')
+    for card in range(card_count):
+        data += frame('0F{:08X}'.format(card)) * repeat
+        if card % 10 == 0:
+            # corrupted frame
+            data += b'\x020F00000000FF\x03'
+    return bytes(data)
+
+
+def test_frame_checksum():
+    assert frame('0700673158') == b'\x02070067315809\x03'
+
+
+def test_decode_frames():
+    decoder = Rdm6300Decoder()
+    assert decoder.feed(frame('0700673158') + b'\x020700', 1.5) == [CardRead('070067315809', 1.5)]
+    assert decoder.feed(b'67315809\x03', 2.0) == [CardRead('070067315809', 2.0)]
+    assert decoder.buffer == bytearray()
+    assert decoder.frames == 2
+
+
+def test_checksum_error():
+    decoder = Rdm6300Decoder()
+    assert decoder.feed(b'\x02070067315800\x03') == []
+    assert decoder.checksum_errors == 1
+
+
+def test_resync_after_garbage():
+    decoder = Rdm6300Decoder()
+    assert decoder.feed(b'\x02\x02garbage\xff\xff\xff\xff\xff\xff' + frame('0700673158')) == [CardRead('070067315809', None)]
+
+
+@pytest.mark.parametrize('number_format, card_id', [
+    ('card_id_dec', '0006762840'),
+    ('card_id_float', '103,12632'),
+    ('', '070067315809'),
+])
+def test_number_formats(number_format, card_id):
+    decoder = Rdm6300Decoder(number_format)
+    assert decoder.feed(frame('0700673158')) == [CardRead(card_id, None)]
+
+
+def test_throughput_through_pty():
+    serial = pytest.importorskip('serial')
+    pytest.importorskip('evdev')
+    from reader_modules import load_reader
+
+    card_count = 500
+    data = capture(card_count)
+    master, slave = os.openpty()
+    real_serial = serial.Serial
+    with patch('serial.Serial', side_effect=lambda device, baudrate, timeout: real_serial(os.ttyname(slave), baudrate,
+                                                                                          timeout=timeout)):
+        reader = load_reader('Reader.py.experimental').Rdm6300Reader()
+
+    def replay():
+        for position in range(0, len(data), 64):
+            os.write(master, data[position:position + 64])
+
+    started = time.monotonic()
+    threading.Thread(target=replay, daemon=True).start()
+    card_ids = [reader.readCard() for _ in range(card_count)]
+    elapsed = time.monotonic() - started
+    reader.cleanup()
+    os.close(master)
+    os.close(slave)
+
+    assert card_ids == [frame('0F{:08X}'.format(card))[1:-1].decode('ascii') for card in range(card_count)]
+    assert reader.decoder.checksum_errors == card_count // 10
+    assert reader.last_card_time is not None
+    print('{:.0f} frames/s'.format(reader.decoder.frames / elapsed))
@@ -0,0 +1,83 @@
+import os
+import queue
+import threading
+
+import pytest
+from mock import mock_open, patch
+
+pytest.importorskip('evdev')
+pytest.importorskip('serial')
+
+from fake_evdev import ReplayDevice, card_events  # noqa: E402
+from reader_modules import load_reader  # noqa: E402
+
+
+@pytest.fixture
+def reader_module():
+    return load_reader('Reader.py.experimental.Multi')
+
+
+class BlockingReader:
+    """Stands in for the MFRC522 reader, which blocks until a tag is detected"""
+
+    def __init__(self):
+        self.tags = queue.Queue()
+        self.thread = None
+
+    def readCard(self):
+        self.thread = threading.current_thread()
+        return self.tags.get()
+
+
+class FakeSerial:
+
+    def __init__(self, *args, **kwargs):
+        self._read_fd, self._write_fd = os.pipe()
+        self.in_waiting = 0
+
+    def fileno(self):
+        return self._read_fd
+
+    def feed(self, data):
+        self.in_waiting += len(data)
+        os.write(self._write_fd, data)
+
+    def read(self, size=1):
+        data = os.read(self._read_fd, size)
+        self.in_waiting -= len(data)
+        return data
+
+
+def create_reader(reader_module, device_names, devices):
+    with patch.object(reader_module, 'get_devices', return_value=devices), \
+            patch.object(reader_module.os.path, 'isfile', return_value=True), \
+            patch('builtins.open', mock_open(read_data='\n'.join(device_names))):
+        return reader_module.Reader()
+
+
+def test_first_card_of_any_reader(reader_module):
+    usb_device = ReplayDevice()
+    blocking_reader = BlockingReader()
+    with patch.object(reader_module, 'Mfrc522Reader', return_value=blocking_reader):
+        reader = create_reader(reader_module, [usb_device.name, 'MFRC522'],
+                               [usb_device, reader_module.NonUsbDevice('MFRC522')])
+    assert len(reader.devs) == 2
+
+    usb_device.push(card_events('0001234567') + card_events('0002345678'))
+    assert reader.readCard() == '0001234567'
+    assert reader.readCard() == '0002345678'
+
+    blocking_reader.tags.put('987654321')
+    assert reader.readCard() == '987654321'
+    assert blocking_reader.thread is not threading.current_thread()
+    usb_device.close()
+
+
+def test_rdm6300_frames(reader_module):
+    with patch.object(reader_module.serial, 'Serial', FakeSerial):
+        rdm6300 = reader_module.Rdm6300Reader()
+    rdm6300.rfid_serial.feed(b'\x020F00ABCDEF86')
+    assert rdm6300.read_available() == []
+    rdm6300.rfid_serial.feed(b'\x03\x020F00ABCDEF86\x03\x02short\x03')
+    # the repeated frame of a card which stays on the reader is dropped
+    assert rdm6300.read_available() == ['0F00ABCDEF86']
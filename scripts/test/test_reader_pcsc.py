@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from fake_scard import SCARD_E_NO_SERVICE, FakeSCard
+from reader_modules import load_reader
+
+
+@pytest.fixture
+def pcsc():
+    module = load_reader('Reader.py.pcsc')
+    module.RETRY_DELAY = 0
+    return module
+
+
+@pytest.fixture
+def scard():
+    return FakeSCard()
+
+
+def test_one_context_for_all_reads(pcsc, scard):
+    scard.add_reader('ACS ACR122U 00 00')
+    reader = pcsc.Reader(scard)
+
+    scard.insert_card('ACS ACR122U 00 00', b'\x04\xa1\xb2\xc3')
+    assert reader.readCard() == '04A1B2C39000'
+    scard.remove_card('ACS ACR122U 00 00')
+    scard.insert_card('ACS ACR122U 00 00', b'\x04\xd4\xe5\xf6')
+    assert reader.readCard() == '04D4E5F69000'
+
+    assert scard.calls['SCardEstablishContext'] == 1
+    assert scard.calls['SCardReleaseContext'] == 0
+    # the handle of the first card is reused for the second one
+    assert scard.calls['SCardConnect'] == 1
+    assert scard.calls['SCardReconnect'] == 1
+
+
+def test_multiple_readers(pcsc, scard):
+    scard.add_reader('Reader A')
+    scard.add_reader('Reader B')
+    scard.insert_card('Reader A', b'\x01')
+    scard.insert_card('Reader B', b'\x02')
+    reader = pcsc.Reader(scard)
+    assert sorted([reader.readCard(), reader.readCard()]) == ['019000', '029000']
+
+
+def test_reader_plugged_in_later(pcsc, scard):
+    reader = pcsc.Reader(scard)
+
+    def plug_in():
+        time.sleep(0.05)
+        scard.add_reader('Reader B')
+        time.sleep(0.05)
+        scard.insert_card('Reader B', b'\x0b')
+
+    threading.Thread(target=plug_in).start()
+    assert reader.readCard() == '0B9000'
+    assert scard.calls['SCardEstablishContext'] == 1
+
+
+def test_reader_unplugged(pcsc, scard):
+    scard.add_reader('Reader A')
+    scard.add_reader('Reader B')
+    scard.insert_card('Reader A', b'\x0a')
+    reader = pcsc.Reader(scard)
+    assert reader.readCard() == '0A9000'
+
+    scard.remove_reader('Reader A')
+    scard.insert_card('Reader B', b'\x0b')
+    assert reader.readCard() == '0B9000'
+    assert list(reader.session.reader_states) == ['Reader B']
+    assert 'Reader A' not in reader.session.card_handles
+
+
+def test_new_context_after_pcscd_restart(pcsc, scard):
+    scard.add_reader('Reader A')
+    reader = pcsc.Reader(scard)
+    scard.fail_next('SCardGetStatusChange', SCARD_E_NO_SERVICE)
+    assert reader.readCard() is None
+    assert scard.contexts == set()
+
+    scard.insert_card('Reader A', b'\x0a')
+    assert reader.readCard() == '0A9000'
+    assert scard.calls['SCardEstablishContext'] == 2
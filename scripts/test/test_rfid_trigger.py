@@ -0,0 +1,120 @@
+import os
+import pytest
+from mock import MagicMock, patch, call
+from rfid_trigger import CardTrigger, read_shell_config
+
+
+@pytest.fixture
+def jukebox(tmp_path):
+    for folder in ('scripts', 'settings', 'shared/shortcuts', 'audiofolders/Moby Dick', 'playlists'):
+        (tmp_path / folder).mkdir(parents=True)
+    (tmp_path / 'settings' / 'global.conf').write_text(
+        'AUDIOFOLDERSPATH="{audio}"\nPLAYLISTSFOLDERPATH="{playlists}"\nSECONDSWIPE="RESTART"\n'.format(
+            audio=tmp_path / 'audiofolders', playlists=tmp_path / 'playlists'))
+    (tmp_path / 'settings' / 'rfid_trigger_play.conf').write_text(
+        '# comment\nCMDMUTE="1111"\nCMDVOLUP="%CMDVOLUP%"\nCMDPREV="2222"\n')
+    (tmp_path / 'audiofolders' / 'Moby Dick' / 'folder.conf').write_text(
+        'CURRENTFILENAME="filename"\nELAPSED="0"\nPLAYSTATUS="Stopped"\nRESUME="OFF"\n'
+        'SHUFFLE="OFF"\nLOOP="OFF"\nSINGLE="OFF"\n')
+    return tmp_path
+
+
+@pytest.fixture
+def mpd():
+    _mpd = MagicMock()
+    _mpd.status.return_value = {'state': 'stop', 'playlistlength': '0'}
+    _mpd.currentsong.return_value = {}
+    _mpd.execute_dict.return_value = {}
+    return _mpd
+
+
+@pytest.fixture
+def card_trigger(jukebox, mpd):
+    return CardTrigger(str(jukebox / 'scripts'), mpd=mpd)
+
+
+def test_read_shell_config(jukebox):
+    config = read_shell_config(str(jukebox / 'settings' / 'rfid_trigger_play.conf'))
+    assert config == {'CMDMUTE': '1111', 'CMDVOLUP': '%CMDVOLUP%', 'CMDPREV': '2222'}
+
+
+def test_control_cards_are_exact(card_trigger):
+    assert card_trigger.reload() is True
+    assert card_trigger.control_cards == {'1111': 'CMDMUTE', '2222': 'CMDPREV'}
+    assert card_trigger.is_control_card('1111')
+    assert not card_trigger.is_control_card('11')
+
+
+def test_missing_config_falls_back(card_trigger, jukebox):
+    os.remove(str(jukebox / 'settings' / 'global.conf'))
+    assert card_trigger.trigger('1234') is False
+
+
+def test_control_card(card_trigger, jukebox, mpd):
+    with patch('rfid_trigger.subprocess.call') as mock_call:
+        assert card_trigger.trigger('2222') is True
+    mock_call.assert_called_once_with(['sudo', card_trigger.playout_controls, '-c=playerprev'])
+    assert (jukebox / 'settings' / 'Latest_RFID').read_text() == '2222\n'
+    mpd.execute.assert_not_called()
+
+
+def test_new_settings_are_shared_with_the_web_ui(card_trigger):
+    latest_rfid = card_trigger._setting('Latest_RFID')
+    with patch('rfid_trigger.subprocess.call'), patch('rfid_trigger.os.chown') as mock_chown, \
+            patch('rfid_trigger.pwd.getpwnam', return_value=MagicMock(pw_uid=1000)), \
+            patch('rfid_trigger.grp.getgrnam', return_value=MagicMock(gr_gid=33)):
+        card_trigger.trigger('2222')
+        mock_chown.assert_called_once_with(latest_rfid, 1000, 33)
+        assert os.stat(latest_rfid).st_mode & 0o777 == 0o777
+        # an existing file keeps its owner
+        card_trigger.trigger('2222')
+        mock_chown.assert_called_once()
+
+
+def test_unknown_card_creates_shortcut(card_trigger, jukebox, mpd):
+    with patch('rfid_trigger.subprocess.call') as mock_call:
+        assert card_trigger.trigger('3333') is True
+    mock_call.assert_not_called()
+    assert (jukebox / 'shared' / 'shortcuts' / '3333').read_text() == '3333\n'
+    assert 'used for the first time' in (jukebox / 'shared' / 'latestID.txt').read_text()
+
+
+def test_first_play_of_folder_falls_back(card_trigger, jukebox):
+    (jukebox / 'audiofolders' / 'New').mkdir()
+    (jukebox / 'shared' / 'shortcuts' / '4444').write_text('New\n')
+    assert card_trigger.trigger('4444') is False
+
+
+def test_audio_card(card_trigger, jukebox, mpd):
+    (jukebox / 'shared' / 'shortcuts' / '5555').write_text('Moby Dick\n')
+    with patch('rfid_trigger.subprocess.call') as mock_call:
+        assert card_trigger.trigger('5555') is True
+    assert mock_call.call_args[0][0] == [card_trigger.playlist_builder, '--folder', 'Moby Dick']
+    assert mpd.execute.call_args_list == [call('stop'), call('clear'), call('load', 'Moby Dick'), call('single', 0),
+                                          call('random', 0), call('play')]
+    assert (jukebox / 'settings' / 'Latest_Playlist_Played').read_text() == 'Moby Dick\n'
+    assert (jukebox / 'settings' / 'Latest_Folder_Played').read_text() == 'Moby Dick\n'
+
+
+def test_audio_card_second_swipe_pause(card_trigger, jukebox, mpd):
+    (jukebox / 'shared' / 'shortcuts' / '5555').write_text('Moby Dick\n')
+    (jukebox / 'settings' / 'Latest_Playlist_Played').write_text('Moby Dick\n')
+    (jukebox / 'settings' / 'global.conf').write_text(
+        'AUDIOFOLDERSPATH="{audio}"\nPLAYLISTSFOLDERPATH="{playlists}"\nSECONDSWIPE="PAUSE"\n'.format(
+            audio=jukebox / 'audiofolders', playlists=jukebox / 'playlists'))
+    mpd.status.return_value = {'state': 'play', 'playlistlength': '3'}
+    with patch('rfid_trigger.subprocess.call'):
+        card_trigger.trigger('5555')
+    assert mpd.execute.call_args_list == [call('pause', 1)]
+
+
+def test_audio_card_resume(card_trigger, jukebox, mpd):
+    (jukebox / 'shared' / 'shortcuts' / '5555').write_text('Moby Dick\n')
+    folder_conf = jukebox / 'audiofolders' / 'Moby Dick' / 'folder.conf'
+    folder_conf.write_text('CURRENTFILENAME="Moby Dick/02.mp3"\nELAPSED="42.5"\nPLAYSTATUS="Stopped"\nRESUME="ON"\n'
+                           'SHUFFLE="OFF"\nLOOP="OFF"\nSINGLE="OFF"\n')
+    mpd.execute_dict.return_value = {'file': 'Moby Dick/02.mp3', 'Pos': '1'}
+    with patch('rfid_trigger.subprocess.call'):
+        card_trigger.trigger('5555')
+    assert mpd.execute.call_args_list[-2:] == [call('play', '1'), call('seekcur', '42.5')]
+    assert read_shell_config(str(folder_conf))['PLAYSTATUS'] == 'Playing'
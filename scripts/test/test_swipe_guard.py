@@ -0,0 +1,113 @@
+import os
+
+import pytest
+from mock import MagicMock, patch
+
+from rfid_trigger import CardTrigger
+from swipe_guard import AUDIO, CONTROL, UNKNOWN, SwipeGuard
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def settings(tmp_path):
+    for folder in ('scripts', 'settings', 'shared/shortcuts', 'audiofolders/Moby Dick/CD 1', 'playlists'):
+        (tmp_path / folder).mkdir(parents=True)
+    settings = tmp_path / 'settings'
+    (tmp_path / 'shared' / 'shortcuts' / '5555').write_text('Moby Dick\n')
+    (tmp_path / 'audiofolders' / 'Moby Dick' / 'folder.conf').write_text('RESUME="OFF"\n')
+    (settings / 'Second_Swipe_Pause').write_text('2\n')
+    (settings / 'Second_Swipe_Pause_Controls').write_text('ON\n')
+    (settings / 'global.conf').write_text(
+        'AUDIOFOLDERSPATH="{}"\nPLAYLISTSFOLDERPATH="{}"\nSECONDSWIPE="RESTART"\nCMDVOLUP="1111"\nCMDNEXT=""\n'.format(
+            tmp_path / 'audiofolders', tmp_path / 'playlists'))
+    (settings / 'rfid_trigger_play.conf').write_text('CMDMUTE="2222"\nCMDSHUFFLE="%CMDSHUFFLE%"\nCMDPAUSE="04:a2:f1"\n')
+    return tmp_path
+
+
+@pytest.fixture
+def card_trigger(settings):
+    return CardTrigger(str(settings / 'scripts'), mpd=MagicMock())
+
+
+def test_cooldowns_from_settings(settings, card_trigger):
+    (settings / 'settings' / 'Second_Swipe_Pause_Unknown').write_text('5\n')
+    guard = SwipeGuard.from_settings(str(settings / 'settings'), card_trigger)
+    assert guard.cooldowns == {CONTROL: 0.0, AUDIO: 2.0, UNKNOWN: 5.0}
+    assert guard.card_class('1111') == CONTROL
+    assert guard.card_class('04:a2:f1') == CONTROL
+    assert guard.card_class('111') == UNKNOWN
+    assert guard.card_class('5555') == AUDIO
+    # a folder named like the card
+    (settings / 'audiofolders' / '6666').mkdir()
+    assert guard.card_class('6666') == AUDIO
+
+
+def test_control_cards_are_reloaded(settings, card_trigger):
+    guard = SwipeGuard({CONTROL: 0.0, AUDIO: 2.0, UNKNOWN: 2.0}, card_trigger)
+    assert guard.card_class('3333') == UNKNOWN
+    conf = settings / 'settings' / 'rfid_trigger_play.conf'
+    conf.write_text('CMDMUTE="3333"\n')
+    stat = conf.stat()
+    os.utime(str(conf), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert guard.card_class('3333') == CONTROL
+
+
+def test_unknown_card_keeps_its_cooldown(settings, card_trigger, clock):
+    guard = SwipeGuard({CONTROL: 0.0, AUDIO: 0.0, UNKNOWN: 5.0}, card_trigger, clock=clock)
+    with patch('rfid_trigger.subprocess.call'):
+        assert guard.allow('7777')
+        assert card_trigger.trigger('7777')
+    # the trigger created a shortcut, the card is still unknown
+    assert (settings / 'shared' / 'shortcuts' / '7777').exists()
+    clock.now += 1.0
+    assert not guard.allow('7777')
+    clock.now += 5.0
+    assert guard.allow('7777')
+
+
+def test_held_card_is_suppressed(clock):
+    guard = SwipeGuard({CONTROL: 0.0, AUDIO: 2.0, UNKNOWN: 2.0}, clock=clock)
+    assert guard.allow('1234')
+    # every read restarts the cooldown
+    for _ in range(5):
+        clock.now += 1.0
+        assert not guard.allow('1234')
+    clock.now += 2.0
+    assert guard.allow('1234')
+
+
+def test_cooldown_per_card(card_trigger, clock):
+    guard = SwipeGuard({CONTROL: 0.0, AUDIO: 2.0, UNKNOWN: 2.0}, card_trigger, clock=clock)
+    assert guard.allow('1234')
+    assert guard.allow('5678')
+    clock.now += 1.0
+    assert not guard.allow('1234')
+    assert not guard.allow('5678')
+    # control cards may be swiped again right away, a short card id does not match
+    assert guard.allow('1111')
+    assert guard.allow('1111')
+    assert guard.allow('11')
+    assert not guard.allow('11')
+
+
+def test_least_recently_seen_card_is_evicted(clock):
+    guard = SwipeGuard({CONTROL: 0.0, AUDIO: 2.0, UNKNOWN: 2.0}, max_cards=2, clock=clock)
+    guard.allow('1')
+    guard.allow('2')
+    guard.allow('1')
+    guard.allow('3')
+    assert list(guard.last_seen) == ['1', '3']
+    assert guard.allow('2')